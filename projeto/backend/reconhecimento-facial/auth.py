@@ -1,46 +1,86 @@
 import jwt
-import bcrypt
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import os
-from database import SessionLocal, User
+from sqlalchemy import event, select
+from fastapi.concurrency import run_in_threadpool
+from database import SessionLocal, User, session_scope
+from db_writer import single_writer
+from password_hashing import (
+    hash_password, hash_password_async, verify_password_async, needs_rehash
+)
 
 # Configurações de JWT
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "midiaz-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verifica se a senha está correta"""
-    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+# Cache de identidades verificadas: token -> usuário (0 desliga)
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "60"))
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
 
-def get_user(email: str) -> Optional[Dict[str, Any]]:
-    """Busca usuário por email no banco de dados"""
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.email == email).first()
-        if user:
-            return {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "cpf": user.cpf,
-                "phone": user.phone,
-                "password_hash": user.password_hash,
-                "type": user.user_type,
-                "avatar": user.avatar
-            }
-        return None
-    finally:
-        db.close()
+# token -> (expira_em, usuário); ordem = uso mais recente por último (LRU)
+_identity_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_identity_lock = threading.Lock()
+
+def _user_dict(user: User) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "cpf": user.cpf,
+        "phone": user.phone,
+        "password_hash": user.password_hash,
+        "type": user.user_type,
+        "avatar": user.avatar
+    }
+
+async def get_user_async(db, email: str) -> Optional[Dict[str, Any]]:
+    """Busca usuário por email no banco de dados (AsyncSession da requisição)"""
+    async with db.begin():
+        user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+        return _user_dict(user) if user else None
+
+@single_writer
+def update_password_hash(user_id: int, password_hash: str):
+    """Grava um novo hash de senha (ex.: custo do bcrypt alterado)"""
+    with session_scope() as db:
+        try:
+            user = db.query(User).filter(User.id == user_id).first()
+            if user:
+                user.password_hash = password_hash
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
 
-def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
-    """Autentica usuário com email e senha"""
-    user = get_user(email)
+async def authenticate_user_async(db, email: str, password: str) -> Optional[Dict[str, Any]]:
+    """
+    Autentica usuário com email e senha
+    
+    A consulta usa a AsyncSession da requisição e o bcrypt o pool dedicado
+    de password_hashing. Se o custo configurado mudou, a senha é refeita
+    de forma transparente após um login válido.
+    
+    Raises:
+        PasswordHasherBusy: fila de bcrypt cheia
+    """
+    user = await get_user_async(db, email)
     if not user:
         return None
-    if not verify_password(password, user["password_hash"]):
+    if not await verify_password_async(password, user["password_hash"]):
         return None
+    if needs_rehash(user["password_hash"]):
+        try:
+            new_hash = await hash_password_async(password)
+            await run_in_threadpool(update_password_hash, user["id"], new_hash)
+            user["password_hash"] = new_hash
+        except Exception as e:
+            # O login continua válido; o hash é refeito na próxima vez
+            print(f"❌ Erro ao atualizar hash da senha: {e}")
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -54,19 +94,77 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[Dict[str, Any]]:
-    """Verifica e decodifica token JWT"""
+def _cached_identity(token: str) -> Optional[Dict[str, Any]]:
+    """Usuário de um token já verificado, se ainda estiver válido no cache"""
+    with _identity_lock:
+        entry = _identity_cache.get(token)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _identity_cache[token]
+            return None
+        _identity_cache.move_to_end(token)
+        return dict(entry[1])
+
+def _cache_identity(token: str, token_exp: Optional[float], user: Dict[str, Any]):
+    """Guarda o usuário até o fim do TTL ou da validade do token, o que vier antes"""
+    expires_at = time.time() + IDENTITY_CACHE_TTL
+    if token_exp is not None:
+        expires_at = min(expires_at, token_exp)
+    with _identity_lock:
+        _identity_cache[token] = (expires_at, dict(user))
+        _identity_cache.move_to_end(token)
+        while len(_identity_cache) > IDENTITY_CACHE_SIZE:
+            _identity_cache.popitem(last=False)
+
+def invalidate_identity_cache(user_id: Optional[int] = None):
+    """Remove do cache as identidades de um usuário (ou todas)"""
+    with _identity_lock:
+        if user_id is None:
+            _identity_cache.clear()
+            return
+        for token in [token for token, (_, user) in _identity_cache.items() if user["id"] == user_id]:
+            del _identity_cache[token]
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    """Alterações em usuários (nome, tipo, senha, email) invalidam o cache"""
+    invalidate_identity_cache(target.id)
+
+def _decode_token(token: str) -> Optional[dict]:
+    """Payload de um token JWT válido (None se inválido, expirado ou sem email)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        return get_user(email)
     except jwt.PyJWTError:
         return None
+    return payload if payload.get("sub") else None
 
-def create_user(name: str, email: str, password: str, user_type: str, cpf: str, phone: str) -> Dict[str, Any]:
-    """Cria novo usuário no banco de dados"""
+async def verify_token_async(db, token: str) -> Optional[Dict[str, Any]]:
+    """Verifica e decodifica token JWT (consulta pela AsyncSession no cache miss)"""
+    if IDENTITY_CACHE_TTL > 0:
+        user = _cached_identity(token)
+        if user is not None:
+            return user
+    payload = _decode_token(token)
+    if payload is None:
+        return None
+    user = await get_user_async(db, payload["sub"])
+    if user is not None and IDENTITY_CACHE_TTL > 0:
+        _cache_identity(token, payload.get("exp"), user)
+    return user
+
+@single_writer
+def create_user(
+    name: str,
+    email: str,
+    password: str,
+    user_type: str,
+    cpf: str,
+    phone: str,
+    password_hash: Optional[str] = None
+) -> Dict[str, Any]:
+    """Cria novo usuário no banco de dados (password_hash: hash já calculado)"""
     db = SessionLocal()
     try:
         # Verificar se email já existe
@@ -80,7 +178,8 @@ def create_user(name: str, email: str, password: str, user_type: str, cpf: str,
             raise ValueError("CPF já cadastrado")
         
         # Criar hash da senha
-        password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        if password_hash is None:
+            password_hash = hash_password(password)
         
         # Criar novo usuário
         new_user = User(
@@ -114,26 +213,51 @@ def create_user(name: str, email: str, password: str, user_type: str, cpf: str,
     finally:
         db.close()
 
+async def create_user_async(name: str, email: str, password: str, user_type: str, cpf: str, phone: str) -> Dict[str, Any]:
+    """Versão assíncrona de create_user: bcrypt no pool dedicado, banco no threadpool"""
+    password_hash = await hash_password_async(password)
+    return await run_in_threadpool(create_user, name, email, password, user_type, cpf, phone, password_hash)
+
 # Manter dados mock para compatibilidade (será removido depois)
-users_db = {
-    "admin@midiaz.com": {
+MOCK_USERS = [
+    {
         "id": "admin-1",
         "name": "Admin Midiaz",
         "email": "admin@midiaz.com",
         "cpf": "123.456.789-00",
         "phone": "(11) 99999-9999",
-        "password_hash": bcrypt.hashpw("senha123".encode(), bcrypt.gensalt()).decode(),
+        "password": "senha123",
         "type": "admin",
         "avatar": "/placeholder.svg?height=80&width=80"
     },
-    "fotografo@midiaz.com": {
-        "id": "photographer-1", 
+    {
+        "id": "photographer-1",
         "name": "João Silva",
         "email": "fotografo@midiaz.com",
         "cpf": "987.654.321-00",
         "phone": "(11) 88888-8888",
-        "password_hash": bcrypt.hashpw("senha123".encode(), bcrypt.gensalt()).decode(),
+        "password": "senha123",
         "type": "photographer",
         "avatar": "/placeholder.svg?height=80&width=80"
     }
-} 
\ No newline at end of file
+]
+
+_mock_users_db: Optional[Dict[str, Dict[str, Any]]] = None
+
+def get_mock_users() -> Dict[str, Dict[str, Any]]:
+    """Usuários mock com hash de senha, calculados só no primeiro uso (bcrypt é caro)"""
+    global _mock_users_db
+    if _mock_users_db is None:
+        users = {}
+        for mock_user in MOCK_USERS:
+            user = {key: value for key, value in mock_user.items() if key != "password"}
+            user["password_hash"] = hash_password(mock_user["password"])
+            users[user["email"]] = user
+        _mock_users_db = users
+    return _mock_users_db
+
+def __getattr__(name: str):
+    """Compatibilidade: auth.users_db continua disponível, mas sem custo no import"""
+    if name == "users_db":
+        return get_mock_users()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark do cache de identidades: latência e consultas ao banco por requisição
+
+Mede /api/auth/me e /api/user/photos com o cache de identidades desligado
+e ligado. Cria um usuário temporário no banco configurado e o remove no fim.
+
+Uso:
+    python benchmark_auth.py --requests 2000
+"""
+
+import time
+import uuid
+import argparse
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+import auth
+from auth import create_user, create_access_token
+from database import create_tables, engine, get_async_engine, SessionLocal, User
+
+ENDPOINTS = ("/api/auth/me", "/api/user/photos")
+
+class QueryCounter:
+    """Conta as consultas SQL executadas pelos engines síncrono e assíncrono (as rotas usam o assíncrono)"""
+
+    def __init__(self):
+        self.count = 0
+        for target in (engine, get_async_engine().sync_engine):
+            event.listen(target, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+def measure(client: TestClient, path: str, headers: dict, num_requests: int, counter: QueryCounter):
+    """Executa as requisições e retorna (ms por requisição, consultas por requisição)"""
+    client.get(path, headers=headers)  # aquecimento
+    queries_before = counter.count
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        response = client.get(path, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} retornou {response.status_code}")
+    elapsed_ms = (time.perf_counter() - start) * 1000 / num_requests
+    return elapsed_ms, (counter.count - queries_before) / num_requests
+
+def run_benchmark(num_requests: int):
+    print("📊 BENCHMARK: CACHE DE IDENTIDADES")
+    print("=" * 50)
+
+    create_tables()
+    suffix = uuid.uuid4().hex[:12]
+    user = create_user("Benchmark", f"benchmark-{suffix}@midiaz.local", uuid.uuid4().hex,
+                       "consumer", f"bench-{suffix}", "(00) 00000-0000")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': user['email']})}"}
+
+    import main_simple
+    counter = QueryCounter()
+    ttl = auth.IDENTITY_CACHE_TTL or 60
+    try:
+        with TestClient(main_simple.app) as client:
+            print(f"🔁 Requisições por cenário: {num_requests}")
+            print(f"\n{'endpoint':<20} {'cache':>6} {'ms/req':>8} {'SQL/req':>8}")
+            for path in ENDPOINTS:
+                results = {}
+                for label, cache_ttl in (("não", 0), ("sim", ttl)):
+                    auth.IDENTITY_CACHE_TTL = cache_ttl
+                    auth.invalidate_identity_cache()
+                    results[label] = measure(client, path, headers, num_requests, counter)
+                    print(f"{path:<20} {label:>6} {results[label][0]:>8.3f} {results[label][1]:>8.2f}")
+                speedup = results["não"][0] / max(results["sim"][0], 1e-9)
+                print(f"{'':<20} {'':>6} {speedup:>7.2f}x")
+    finally:
+        auth.IDENTITY_CACHE_TTL = ttl
+        db = SessionLocal()
+        try:
+            db.query(User).filter(User.id == user["id"]).delete()
+            db.commit()
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do cache de identidades")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    run_benchmark(args.requests)
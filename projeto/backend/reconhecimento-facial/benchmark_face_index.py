@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark de recall x latência: índice IVF vs busca exata
+
+Gera encodings sintéticos agrupados por identidade (como num evento real,
+onde cada pessoa aparece em várias fotos) e compara a busca aproximada com
+a varredura exata da matriz inteira.
+
+Uso:
+    python benchmark_face_index.py --faces 200000 --nprobe 4 8 16 32
+"""
+
+import time
+import argparse
+import numpy as np
+from face_matcher import build_encoding_matrix, match_encodings
+from face_index import FaceIndex
+
+def generate_event(num_faces: int, dim: int, faces_per_person: int, seed: int = 42):
+    """Gera um evento sintético: identidades com vários rostos ruidosos cada"""
+    rng = np.random.default_rng(seed)
+    num_people = max(1, num_faces // faces_per_person)
+    people = rng.normal(0, 0.08, size=(num_people, dim)).astype(np.float32)
+    identities = rng.integers(0, num_people, size=num_faces)
+    vectors = people[identities] + rng.normal(0, 0.02, size=(num_faces, dim)).astype(np.float32)
+    photo_ids = np.arange(num_faces, dtype=np.int64) // 2  # ~2 rostos por foto
+    return people, photo_ids, vectors
+
+def timed_searches(search, queries):
+    """Executa as buscas e retorna (resultados, latência média em ms)"""
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    elapsed = (time.perf_counter() - start) * 1000 / len(queries)
+    return results, elapsed
+
+def run_benchmark(num_faces: int, dim: int, num_queries: int, top_k: int, nprobes):
+    print("📊 BENCHMARK: ÍNDICE IVF x BUSCA EXATA")
+    print("=" * 50)
+    print(f"👥 Rostos: {num_faces} | Dimensão: {dim} | Consultas: {num_queries} | top-k: {top_k}")
+
+    people, photo_ids, vectors = generate_event(num_faces, dim, faces_per_person=40)
+    rng = np.random.default_rng(7)
+    chosen = rng.integers(0, len(people), size=num_queries)
+    queries = people[chosen] + rng.normal(0, 0.02, size=(num_queries, dim)).astype(np.float32)
+
+    exact = build_encoding_matrix(photo_ids, vectors)
+    exact_results, exact_ms = timed_searches(lambda q: match_encodings(exact, q, top_k=top_k), queries)
+    print(f"\n🔎 Busca exata: {exact_ms:.2f} ms/consulta")
+
+    start = time.perf_counter()
+    index = FaceIndex.build(photo_ids, vectors, nlist=int(4 * np.sqrt(num_faces)))
+    print(f"🏗️ Índice construído em {time.perf_counter() - start:.1f}s ({len(index.centroids)} listas)")
+
+    print(f"\n{'nprobe':>8} {'ms/consulta':>12} {'speedup':>9} {'recall@k':>9}")
+    for nprobe in nprobes:
+        ann_results, ann_ms = timed_searches(lambda q: index.search(q, top_k=top_k, nprobe=nprobe), queries)
+        recalls = []
+        for truth, found in zip(exact_results, ann_results):
+            truth_ids = {match["photo_id"] for match in truth}
+            if truth_ids:
+                recalls.append(len(truth_ids & {match["photo_id"] for match in found}) / len(truth_ids))
+        recall = np.mean(recalls) if recalls else 1.0
+        print(f"{nprobe:>8} {ann_ms:>12.2f} {exact_ms / ann_ms:>8.1f}x {recall:>9.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do índice IVF de rostos")
+    parser.add_argument("--faces", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+    run_benchmark(args.faces, args.dim, args.queries, args.top_k, args.nprobe)
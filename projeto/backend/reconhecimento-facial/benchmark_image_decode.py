@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark da decodificação das fotos para a detecção e as miniaturas
+
+Gera um lote de JPEGs grandes sintéticos (metade com orientação EXIF 6,
+como fotos de celular na vertical) e compara a decodificação completa
+(transpor, converter e só então reduzir) com image_loader.load_image
+(draft() na escala DCT). O lote e cada medição rodam em processos novos:
+o ru_maxrss do filho começa no pico do pai, então o processo principal não
+pode passar pela geração das imagens.
+
+Uso:
+    python benchmark_image_decode.py --count 8 --width 6000 --height 4000 --runs 3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+import numpy as np
+from PIL import Image, ImageOps
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Decodificadores comparados (o primeiro é a referência do ganho)
+DECODERS = ["decodificação completa", "draft() reduzido"]
+
+def full_decode(file_path: str, max_side: int) -> Image.Image:
+    """Decodificação anterior: orientação e conversão no original, redução no fim"""
+    with Image.open(file_path) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_side, max_side))
+        return image
+
+def target_sizes() -> list:
+    """(nome, maior lado, filtro) dos estágios que decodificam o original"""
+    from face_embedding import DETECTION_MAX_SIDE, DETECTION_RESAMPLE
+    from image_derivatives import DERIVATIVE_SIZES
+    return [
+        ("detecção", DETECTION_MAX_SIDE, DETECTION_RESAMPLE),
+        ("miniatura", DERIVATIVE_SIZES["thumb"], Image.Resampling.BICUBIC)
+    ]
+
+def make_corpus(directory: str, count: int, width: int, height: int) -> list:
+    """JPEGs com gradientes, formas e ruído (comprimem como fotos, não como cor sólida)"""
+    paths = []
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    for i in range(count):
+        rng = np.random.default_rng(i)
+        channels = []
+        for _ in range(3):
+            fx, fy, phase = rng.uniform(2, 12), rng.uniform(2, 12), rng.uniform(0, 6.3)
+            channels.append(128 + 100 * np.sin(x / width * fx + phase) * np.cos(y / height * fy))
+        pixels = np.stack(channels, axis=-1)
+        for _ in range(20):
+            cx, cy, radius = rng.integers(0, width), rng.integers(0, height), rng.integers(50, height // 6)
+            left, top = max(cx - radius, 0), max(cy - radius, 0)
+            pixels[top:cy + radius, left:cx + radius] = rng.uniform(0, 255, 3)
+        pixels += rng.normal(0, 6, (height, width, 1))
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+        exif = Image.Exif()
+        exif[0x0112] = 6 if i % 2 else 1
+        path = os.path.join(directory, f"foto_{i:03d}.jpg")
+        image.save(path, "JPEG", quality=90, exif=exif)
+        paths.append(path)
+    return paths
+
+def measure(decoder: str, max_side: int, resample: int, paths: list, runs: int) -> dict:
+    """Executa no processo atual: tempo por foto (mediana) e pico de memória"""
+    from image_loader import load_image
+    if decoder == DECODERS[0]:
+        decode = full_decode
+    else:
+        decode = lambda path, max_side: load_image(path, max_side, resample)
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(runs):
+        for path in paths:
+            start = time.perf_counter()
+            array = np.asarray(decode(path, max_side))
+            timings.append((time.perf_counter() - start) * 1000)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"ms": statistics.median(timings), "peak_mb": (peak_kb - baseline_kb) / 1024, "shape": list(array.shape)}
+
+def run_in_subprocess(*arguments) -> dict:
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *map(str, arguments)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run_benchmark(count: int, width: int, height: int, runs: int):
+    print("📊 BENCHMARK: DECODIFICAÇÃO DAS FOTOS")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory(prefix="midiaz-decode-bench-") as corpus_dir:
+        paths = run_in_subprocess("--make-corpus", "--corpus", corpus_dir,
+                                  "--count", count, "--width", width, "--height", height)
+        total_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+        print(f"🖼️  {count} JPEGs de {width}x{height} ({width * height / 1e6:.0f} MP, {total_mb:.1f} MB) | Execuções: {runs}")
+
+        for label, max_side, resample in target_sizes():
+            print(f"\n{label} ({max_side}px)")
+            print(f"{'decodificador':<26} {'ms/foto':>9} {'pico MB':>9} {'saída':>14} {'ganho':>7}")
+            baseline = None
+            for decoder in DECODERS:
+                result = run_in_subprocess("--measure", decoder, "--max-side", max_side,
+                                           "--resample", int(resample), "--corpus", corpus_dir, "--runs", runs)
+                baseline = baseline or result["ms"]
+                shape = "x".join(str(value) for value in result["shape"])
+                print(f"{decoder:<26} {result['ms']:>9.1f} {result['peak_mb']:>9.1f} {shape:>14} {baseline / result['ms']:>6.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da decodificação das fotos")
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--make-corpus", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", choices=DECODERS, help=argparse.SUPPRESS)
+    parser.add_argument("--max-side", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--resample", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.make_corpus:
+        print(json.dumps(make_corpus(args.corpus, args.count, args.width, args.height)))
+    elif args.measure:
+        paths = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus))
+        print(json.dumps(measure(args.measure, args.max_side, args.resample, paths, args.runs)))
+    else:
+        run_benchmark(args.count, args.width, args.height, args.runs)
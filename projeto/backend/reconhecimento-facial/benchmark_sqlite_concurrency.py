@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concorrência do SQLite: leituras da galeria durante uploads
+
+Threads leitoras paginam /api/user/photos (get_user_photos) enquanto
+threads escritoras registram fotos (register_photo), em três configurações:
+SQLite padrão (journal DELETE), WAL com os PRAGMAs ajustados e WAL com a
+fila de escrita única. Cada configuração roda num processo e banco novos.
+
+Uso:
+    python benchmark_sqlite_concurrency.py --readers 8 --writers 4 --duration 10
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (nome, variáveis de ambiente)
+SCENARIOS = [
+    ("padrão (journal DELETE)", {"SQLITE_PRAGMAS": "0", "SQLITE_SINGLE_WRITER": "0"}),
+    ("WAL + PRAGMAs", {"SQLITE_PRAGMAS": "1", "SQLITE_SINGLE_WRITER": "0"}),
+    ("WAL + PRAGMAs + fila de escrita", {"SQLITE_PRAGMAS": "1", "SQLITE_SINGLE_WRITER": "1"})
+]
+
+def percentile(timings: list, fraction: float) -> float:
+    if not timings:
+        return 0.0
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+def run_scenario(readers: int, writers: int, duration: float) -> dict:
+    """Executa a carga no processo atual (banco definido por DATABASE_URL)"""
+    from database import create_tables
+    from auth import create_user
+    from file_upload import register_photo, get_user_photos
+
+    create_tables()
+    user = create_user("Benchmark", "sqlite-bench@midiaz.local", "", "photographer",
+                       "sqlite-bench", "(00) 00000-0000", password_hash="x")
+
+    results = {"read_ms": [], "write_ms": [], "read_errors": 0, "write_errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def reader():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                get_user_photos(user["id"], limit=50)
+                key = "read_ms"
+            except Exception:
+                key = "read_errors"
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                if key == "read_ms":
+                    results["read_ms"].append(elapsed_ms)
+                else:
+                    results["read_errors"] += 1
+
+    def writer():
+        while time.perf_counter() < deadline:
+            content_hash = uuid.uuid4().hex * 2
+            start = time.perf_counter()
+            # is_duplicate: o arquivo não existe e não deve ser removido em caso de erro
+            success, _, _ = register_photo(user["id"], f"bench/{content_hash}.jpg", 1024, "image/jpeg",
+                                           content_hash, event_id="benchmark", is_duplicate=True)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                if success:
+                    results["write_ms"].append(elapsed_ms)
+                else:
+                    results["write_errors"] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    with contextlib.redirect_stdout(io.StringIO()):  # register_photo imprime cada foto
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results
+
+def run_in_subprocess(env_overrides: dict, readers: int, writers: int, duration: float) -> dict:
+    """Roda um cenário num interpretador novo com banco temporário"""
+    with tempfile.TemporaryDirectory(prefix="midiaz-sqlite-bench-") as workdir:
+        env = dict(os.environ)
+        env.update(env_overrides)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "FACE_WORKER_EMBEDDED": "0",
+            "PYTHONPATH": BACKEND_DIR
+        })
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--scenario",
+             "--readers", str(readers), "--writers", str(writers), "--duration", str(duration)],
+            cwd=workdir, env=env, capture_output=True, text=True, check=True
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run_benchmark(readers: int, writers: int, duration: float):
+    print("📊 BENCHMARK: CONCORRÊNCIA NO SQLITE")
+    print("=" * 50)
+    print(f"👥 Leitores: {readers} | Escritores: {writers} | Duração: {duration:.0f}s")
+    print(f"\n{'configuração':<34} {'leit/s':>8} {'p95 ms':>8} {'esc/s':>7} {'p95 ms':>8} {'erros':>6}")
+    for label, env_overrides in SCENARIOS:
+        try:
+            results = run_in_subprocess(env_overrides, readers, writers, duration)
+        except subprocess.CalledProcessError as e:
+            print(f"{label:<34} ❌ {e.stderr.strip().splitlines()[-1]}")
+            continue
+        errors = results["read_errors"] + results["write_errors"]
+        print(f"{label:<34} {len(results['read_ms']) / duration:>8.1f} {percentile(results['read_ms'], 0.95):>8.1f} "
+              f"{len(results['write_ms']) / duration:>7.1f} {percentile(results['write_ms'], 0.95):>8.1f} {errors:>6}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de concorrência do SQLite")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--scenario", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scenario:
+        print(json.dumps(run_scenario(args.readers, args.writers, args.duration)))
+    else:
+        run_benchmark(args.readers, args.writers, args.duration)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Benchmark do tempo de importação dos módulos do backend
+
+Cada medição roda num interpretador novo (como um worker do uvicorn ou um
+script de linha de comando) e mede só o import do módulo.
+
+Uso:
+    python benchmark_startup.py --runs 5
+    python benchmark_startup.py --modules auth main_simple
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+DEFAULT_MODULES = ["database", "auth", "file_upload", "face_jobs", "main_simple", "check_uploads", "init_db"]
+
+MEASURE_CODE = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+def measure_import(module: str) -> float:
+    """Tempo de import (ms) de um módulo num processo Python novo"""
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_CODE.format(module=module)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def run_benchmark(modules, runs: int):
+    print("📊 BENCHMARK: TEMPO DE IMPORTAÇÃO")
+    print("=" * 50)
+    print(f"🔁 Execuções por módulo: {runs}")
+    print(f"\n{'módulo':<16} {'mediana ms':>11} {'mín ms':>8} {'máx ms':>8}")
+    for module in modules:
+        try:
+            timings = [measure_import(module) for _ in range(runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<16} ❌ erro ao importar: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"{module:<16} {statistics.median(timings):>11.1f} {min(timings):>8.1f} {max(timings):>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do tempo de importação")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    run_benchmark(args.modules, args.runs)
@@ -1,38 +1,103 @@
 #!/usr/bin/env python3
 """
 Script para verificar arquivos de upload salvos
+
+Uso:
+    python check_uploads.py          # lista cada arquivo com tamanho e data
+    python check_uploads.py --fast   # inventário rápido: disco x tabela photos
 """
 
 import os
+import sys
 import json
 from datetime import datetime
 
+# Diretórios onde as fotos são salvas
+UPLOAD_DIRS = [
+    "midiaz_uploads",
+    "midiaz_reference_faces"
+]
+
+def iter_stored_files(dir_name: str):
+    """Percorre recursivamente (layout plano ou em shards) sem stat por arquivo"""
+    stack = [dir_name]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue  # Temporários de uploads em andamento
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    yield entry
+
+def inventory_uploads():
+    """
+    Inventário rápido dos arquivos armazenados
+    
+    Os caminhos no disco vêm do os.scandir (o tipo da entrada já vem do
+    diretório, sem stat) e os tamanhos vêm de Photo.file_size, então o custo
+    é uma listagem de diretórios mais uma leitura sequencial da tabela.
+    """
+    from database import SessionLocal, Photo
+    
+    print("⚡ INVENTÁRIO RÁPIDO DE UPLOADS")
+    print("=" * 50)
+    
+    on_disk = set()
+    for dir_name in UPLOAD_DIRS:
+        if not os.path.exists(dir_name):
+            print(f"📁 {dir_name}: ❌ Diretório não existe")
+            continue
+        count = len(on_disk)
+        on_disk.update(os.path.normpath(entry.path) for entry in iter_stored_files(dir_name))
+        print(f"📁 {dir_name}: {len(on_disk) - count} arquivos")
+    
+    db = SessionLocal()
+    try:
+        photos = total_size = 0
+        referenced = set()
+        missing = []
+        for file_path, file_size in db.query(Photo.file_path, Photo.file_size).yield_per(10000):
+            photos += 1
+            total_size += file_size or 0
+            file_path = os.path.normpath(file_path)
+            referenced.add(file_path)
+            if file_path not in on_disk:
+                missing.append(file_path)
+    finally:
+        db.close()
+    
+    orphans = on_disk - referenced
+    print(f"\n📊 Fotos no banco: {photos} ({total_size / 1024 / 1024:.1f} MB)")
+    print(f"📊 Arquivos distintos referenciados: {len(referenced)}")
+    print(f"❌ Fotos sem arquivo: {len(missing)}")
+    for file_path in missing[:20]:
+        print(f"  • {file_path}")
+    print(f"⚠️ Arquivos sem foto no banco: {len(orphans)}")
+    for file_path in sorted(orphans)[:20]:
+        print(f"  • {file_path}")
+
 def check_uploads():
     """Verifica arquivos de upload salvos"""
     
-    # Diretórios onde as fotos são salvas
-    upload_dirs = [
-        "midiaz_uploads",
-        "midiaz_reference_faces"
-    ]
-    
     print("🔍 VERIFICANDO ARQUIVOS DE UPLOAD")
     print("=" * 50)
     
-    for dir_name in upload_dirs:
+    for dir_name in UPLOAD_DIRS:
         if os.path.exists(dir_name):
-            files = os.listdir(dir_name)
+            files = list(iter_stored_files(dir_name))
             print(f"\n📁 Diretório: {dir_name}")
             print(f"📊 Total de arquivos: {len(files)}")
             
             if files:
                 print("📋 Arquivos encontrados:")
-                for file in files:
-                    file_path = os.path.join(dir_name, file)
-                    file_size = os.path.getsize(file_path)
-                    file_date = datetime.fromtimestamp(os.path.getctime(file_path))
+                for entry in files:
+                    stat = entry.stat()
+                    file_size = stat.st_size
+                    file_date = datetime.fromtimestamp(stat.st_ctime)
                     
-                    print(f"  • {file}")
+                    print(f"  • {os.path.relpath(entry.path, dir_name)}")
                     print(f"    Tamanho: {file_size} bytes")
                     print(f"    Data: {file_date.strftime('%d/%m/%Y %H:%M:%S')}")
             else:
@@ -47,7 +112,8 @@ def check_uploads():
     print("=" * 50)
     
     try:
-        from auth import users_db
+        from auth import get_mock_users
+        users_db = get_mock_users()
         print(f"👥 Total de usuários: {len(users_db)}")
         
         for email, user in users_db.items():
@@ -61,4 +127,7 @@ def check_uploads():
         print("❌ Não foi possível acessar o banco de dados simulado")
 
 if __name__ == "__main__":
-    check_uploads() 
\ No newline at end of file
+    if "--fast" in sys.argv:
+        inventory_uploads()
+    else:
+        check_uploads() 
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Configuração do pytest para os testes que não precisam da API rodando
+
+Banco SQLite e diretórios de arquivos num diretório temporário por sessão,
+sem o worker facial embutido (os testes chamam as funções diretamente).
+"""
+
+import os
+import sys
+import uuid
+import asyncio
+import tempfile
+
+# Antes de importar qualquer módulo do projeto: caminhos relativos e DATABASE_URL
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="midiaz-tests-"))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./midiaz_test.db")
+os.environ.setdefault("FACE_WORKER_EMBEDDED", "0")
+
+import pytest
+import numpy as np
+
+# Scripts que testam um servidor já rodando (python test_integration.py)
+collect_ignore = ["test_integration.py", "test_photo_upload.py"]
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    from database import create_tables
+    create_tables()
+
+@pytest.fixture(scope="session")
+def password_hash():
+    from password_hashing import hash_password
+    return hash_password("senha123")
+
+@pytest.fixture
+def make_user(password_hash):
+    """Cria usuários com email e CPF únicos; retorna (usuário, cabeçalhos com token)"""
+    from auth import create_user, create_access_token
+
+    def factory(user_type: str = "consumer"):
+        suffix = uuid.uuid4().hex[:12]
+        user = create_user("Teste", f"teste-{suffix}@midiaz.local", "senha123", user_type, suffix,
+                           "(00) 00000-0000", password_hash=password_hash)
+        return user, {"Authorization": f"Bearer {create_access_token({'sub': user['email']})}"}
+    return factory
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main_simple
+    with TestClient(main_simple.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def add_event_faces():
+    """Grava fotos de evento com encodings sintéticos (banco, contadores, shard e índice); retorna os ids das fotos"""
+    from database import SessionLocal, Photo, FaceEncoding
+    from events import add_event_counts
+    from face_index import add_event_encodings
+    from face_matcher import pack_encoding
+
+    def factory(user_id: int, event_id: str, faces_per_photo) -> list:
+        db = SessionLocal()
+        photo_ids, face_photo_ids, vectors = [], [], []
+        try:
+            for faces in faces_per_photo:
+                photo = Photo(user_id=user_id, event_id=event_id, filename="foto.jpg", file_path="uploads/inexistente.jpg",
+                              file_size=1, mime_type="image/jpeg", face_detected=len(faces) > 0)
+                db.add(photo)
+                db.flush()
+                photo_ids.append(photo.id)
+                for vector in faces:
+                    db.add(FaceEncoding(user_id=user_id, photo_id=photo.id, encoding_blob=pack_encoding(vector), confidence=100))
+                    face_photo_ids.append(photo.id)
+                    vectors.append(vector)
+            add_event_counts(db, event_id, photos=len(photo_ids), faces=len(vectors))
+            db.commit()
+        finally:
+            db.close()
+        if vectors:
+            add_event_encodings(event_id, face_photo_ids, np.asarray(vectors, dtype=np.float32))
+        return photo_ids
+    return factory
+
+@pytest.fixture
+def run_with_async_db():
+    """Executa await func(db, *args) numa AsyncSession, num event loop próprio"""
+    from database import AsyncSessionLocal, dispose_async_engine
+
+    def run(func, *args, **kwargs):
+        async def call():
+            try:
+                async with AsyncSessionLocal() as db:
+                    return await func(db, *args, **kwargs)
+            finally:
+                # O engine fica preso ao event loop em que foi usado
+                await dispose_async_engine()
+        return asyncio.run(call())
+    return run
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Fila de escrita única para o SQLite
+
+O SQLite aceita um escritor por vez: com várias threads gravando, cada uma
+disputa o lock do arquivo e fica esperando (busy_timeout) ou falha com
+"database is locked". As funções marcadas com @single_writer rodam numa
+thread dedicada, em ordem de chegada e com sessão própria; em modo WAL as
+leituras continuam em paralelo sem esperar pelos uploads.
+
+Em outros bancos (PostgreSQL) ou com SQLITE_SINGLE_WRITER=0 a chamada é direta.
+"""
+
+import os
+import time
+import queue
+import threading
+import functools
+from concurrent.futures import Future
+from typing import Optional
+from database import DATABASE_URL
+
+SQLITE_SINGLE_WRITER = DATABASE_URL.startswith("sqlite") and os.getenv("SQLITE_SINGLE_WRITER", "1") == "1"
+
+_queue: "queue.Queue" = queue.Queue()
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+_stats = {"queued": 0, "max_queued": 0, "completed": 0, "wait_ms": 0.0, "run_ms": 0.0}
+
+def _writer_loop():
+    """Executa as escritas uma a uma, na ordem em que chegaram"""
+    while True:
+        future, func, args, kwargs, submitted = _queue.get()
+        started = time.perf_counter()
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            finished = time.perf_counter()
+            with _lock:
+                _stats["queued"] -= 1
+                _stats["completed"] += 1
+                _stats["wait_ms"] += (started - submitted) * 1000
+                _stats["run_ms"] += (finished - started) * 1000
+
+def _ensure_writer():
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_writer_loop, name="sqlite-writer", daemon=True)
+            _thread.start()
+
+def run_write(func, *args, **kwargs):
+    """Executa func na thread de escrita e espera o resultado"""
+    if not SQLITE_SINGLE_WRITER or threading.current_thread() is _thread:
+        return func(*args, **kwargs)  # Escrita aninhada já está na thread de escrita
+
+    _ensure_writer()
+    future: Future = Future()
+    with _lock:
+        _stats["queued"] += 1
+        _stats["max_queued"] = max(_stats["max_queued"], _stats["queued"])
+    _queue.put((future, func, args, kwargs, time.perf_counter()))
+    return future.result()
+
+def single_writer(func):
+    """Decorador: a função passa a ser executada pela fila de escrita"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_write(func, *args, **kwargs)
+    return wrapper
+
+def get_writer_stats() -> dict:
+    """Métricas da fila: pendências, pico, concluídas e tempos médios de espera/execução"""
+    with _lock:
+        completed = _stats["completed"]
+        return {
+            "enabled": SQLITE_SINGLE_WRITER,
+            "queued": _stats["queued"],
+            "max_queued": _stats["max_queued"],
+            "completed": completed,
+            "avg_wait_ms": round(_stats["wait_ms"] / completed, 2) if completed else 0.0,
+            "avg_run_ms": round(_stats["run_ms"] / completed, 2) if completed else 0.0
+        }
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Shards de embeddings por evento, append-only e mapeados em memória
+
+Cada evento tem um arquivo em EMBEDDINGS_DIR com um cabeçalho de 16 bytes
+seguido de registros de tamanho fixo (photo_id int64 + vetor float32). Os
+workers do uvicorn abrem os shards com np.memmap, então os vetores ficam no
+page cache do sistema operacional e são compartilhados entre processos em
+vez de serem copiados do SQLite para o heap de cada worker.
+
+Uso:
+    python embedding_shards.py <event_id>   # recria o shard a partir do banco
+"""
+
+import os
+import re
+import sys
+import struct
+import hashlib
+from contextlib import contextmanager
+from typing import Dict
+import numpy as np
+from face_matcher import EncodingMatrix, load_event_encodings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# Shards ficam ao lado de UPLOAD_DIR
+SHARD_DIR = os.getenv("EMBEDDINGS_DIR", "midiaz_embeddings")
+
+# Cabeçalho: magic, versão, reservado, dimensão, padding (16 bytes)
+SHARD_HEADER = struct.Struct("<4sHHI4x")
+SHARD_MAGIC = b"MZEM"
+SHARD_VERSION = 1
+
+# Shards já mapeados neste processo: caminho -> (inode, linhas, registros, normas)
+_mapped_shards: Dict[str, tuple] = {}
+
+def event_file_stem(event_id: str) -> str:
+    """Nome de arquivo seguro e único para um evento"""
+    safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", event_id)[:64]
+    digest = hashlib.sha1(event_id.encode()).hexdigest()[:8]
+    return f"{safe_name}-{digest}"
+
+def shard_path(event_id: str) -> str:
+    """Caminho do shard de embeddings de um evento"""
+    return os.path.join(SHARD_DIR, f"{event_file_stem(event_id)}.emb")
+
+def record_dtype(dim: int) -> np.dtype:
+    """Tipo de um registro do shard"""
+    return np.dtype([("photo_id", "<i8"), ("vector", "<f4", (dim,))])
+
+def _as_matrix(photo_ids, vectors) -> np.ndarray:
+    """Garante uma matriz float32 (n, dim) com uma linha por id"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors if vectors.ndim == 2 else vectors.reshape(len(photo_ids), -1)
+
+def _pack_records(photo_ids, vectors) -> bytes:
+    """Serializa ids e vetores no formato de registros do shard"""
+    vectors = _as_matrix(photo_ids, vectors)
+    records = np.empty(len(photo_ids), dtype=record_dtype(vectors.shape[1]))
+    records["photo_id"] = photo_ids
+    records["vector"] = vectors
+    return records.tobytes()
+
+def _read_dim(f) -> int:
+    """Lê e valida o cabeçalho de um shard aberto"""
+    magic, version, _, dim = SHARD_HEADER.unpack(f.read(SHARD_HEADER.size))
+    if magic != SHARD_MAGIC or version != SHARD_VERSION:
+        raise ValueError(f"Shard de embeddings inválido: {f.name}")
+    return dim
+
+def write_shard(path: str, photo_ids, vectors):
+    """Grava um shard completo de forma atômica (arquivo temporário + rename)"""
+    vectors = _as_matrix(photo_ids, vectors)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(SHARD_HEADER.pack(SHARD_MAGIC, SHARD_VERSION, 0, vectors.shape[1]))
+        f.write(_pack_records(photo_ids, vectors))
+    os.replace(tmp_path, path)
+
+def _open_locked(path: str):
+    """
+    Abre o shard para acréscimo com lock exclusivo
+
+    Se o arquivo foi substituído (rebuild) enquanto esperávamos o lock,
+    reabre o novo: gravar no inode antigo perderia os registros.
+    """
+    while True:
+        f = open(path, "ab+")
+        if not fcntl:
+            return f
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+def append_to_shard(path: str, photo_ids, vectors):
+    """Acrescenta registros no fim do shard (cria o arquivo se necessário)"""
+    vectors = _as_matrix(photo_ids, vectors)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _open_locked(path) as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            f.write(SHARD_HEADER.pack(SHARD_MAGIC, SHARD_VERSION, 0, vectors.shape[1]))
+        else:
+            f.seek(0)
+            if _read_dim(f) != vectors.shape[1]:
+                raise ValueError("Dimensão do embedding diferente da do shard")
+        # Um único write por lote: leitores só enxergam registros completos
+        f.write(_pack_records(photo_ids, vectors))
+        f.flush()
+
+def open_shard(path: str, start: int = 0) -> EncodingMatrix:
+    """
+    Mapeia um shard em memória (somente leitura) a partir da linha start
+
+    O mapeamento é reaproveitado enquanto o arquivo não muda; quando o
+    shard cresce, só as normas das linhas novas são calculadas.
+    """
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        dim = _read_dim(f)
+    dtype = record_dtype(dim)
+    rows = (stat.st_size - SHARD_HEADER.size) // dtype.itemsize
+
+    cached = _mapped_shards.get(path)
+    if cached and cached[0] == stat.st_ino and cached[1] == rows:
+        records, sq_norms = cached[2], cached[3]
+    else:
+        if rows == 0:
+            records = np.empty(0, dtype=dtype)
+        else:
+            records = np.memmap(path, dtype=dtype, mode="r", offset=SHARD_HEADER.size, shape=(rows,))
+        vectors = records["vector"]
+        known = cached[1] if cached and cached[0] == stat.st_ino and cached[1] < rows else 0
+        new_norms = np.einsum("ij,ij->i", vectors[known:], vectors[known:])
+        sq_norms = np.concatenate((cached[3], new_norms)) if known else new_norms
+        _mapped_shards[path] = (stat.st_ino, rows, records, sq_norms)
+
+    return EncodingMatrix(records["photo_id"][start:], records["vector"][start:], sq_norms[start:])
+
+@contextmanager
+def file_lock(path: str):
+    """Lock exclusivo entre processos e threads num arquivo auxiliar"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+@contextmanager
+def shard_lock(event_id: str):
+    """Segura os acréscimos ao shard do evento (entre ler o banco e trocar o arquivo)"""
+    path = shard_path(event_id)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _open_locked(path):
+        yield
+
+def replace_event_shard(event_id: str, encodings: EncodingMatrix) -> EncodingMatrix:
+    """Troca o shard do evento pelos encodings informados (use dentro de shard_lock)"""
+    path = shard_path(event_id)
+    if encodings.matrix.shape[1] == 0:
+        os.remove(path)  # Evento sem rostos: sem shard (nem registros antigos)
+        return encodings
+    write_shard(path, encodings.photo_ids, encodings.matrix)
+    return open_shard(path)
+
+def rebuild_event_shard(event_id: str) -> EncodingMatrix:
+    """
+    Recria o shard de um evento a partir da tabela face_encodings
+
+    O shard é só de acréscimo: rostos apagados do banco saem regravando o
+    arquivo inteiro (ver face_index.remove_event_encodings).
+    """
+    with shard_lock(event_id):
+        return replace_event_shard(event_id, load_event_encodings(event_id))
+
+def append_event_embeddings(event_id: str, photo_ids, vectors):
+    """
+    Acrescenta embeddings recém-gravados no banco ao shard do evento
+
+    Deve ser chamado depois do commit: se o evento ainda não tem shard, ele
+    é criado a partir do banco, que já contém os embeddings novos.
+    """
+    path = shard_path(event_id)
+    if os.path.exists(path):
+        append_to_shard(path, photo_ids, vectors)
+    else:
+        rebuild_event_shard(event_id)
+
+def load_event_embeddings(event_id: str) -> EncodingMatrix:
+    """Embeddings de um evento a partir do shard mapeado (criado na primeira leitura)"""
+    path = shard_path(event_id)
+    if os.path.exists(path) and os.path.getsize(path) >= SHARD_HEADER.size:
+        return open_shard(path)
+    return rebuild_event_shard(event_id)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python embedding_shards.py <event_id>")
+        sys.exit(1)
+    shard = rebuild_event_shard(sys.argv[1])
+    print(f"✅ Shard do evento {sys.argv[1]}: {len(shard.photo_ids)} embeddings")
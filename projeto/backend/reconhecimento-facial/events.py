@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Eventos: cadastro implícito, contadores desnormalizados e consultas da galeria
+
+Um evento nasce quando chega a primeira foto com aquele event_id. Os
+contadores de Event (fotos, rostos e pessoas) e de FaceCluster são
+atualizados na mesma transação que grava fotos, encodings e clusters, então
+a página do evento não conta linhas de photos/face_encodings. Event.version
+sobe a cada alteração, inclusive rostos que só mudaram de pessoa, e invalida
+os resultados de busca em cache (match_cache.py).
+
+"Fotos do evento X com a pessoa Y" é uma varredura de intervalo em
+ix_event_photos_event_cluster_photo seguida de buscas pela chave primária
+de photos.
+
+Uso:
+    python events.py --rebuild   # recria eventos e contadores a partir das fotos
+"""
+
+import argparse
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import func, select, update
+from database import SessionLocal, Event, EventPhoto, FaceCluster, FaceEncoding, Photo, create_tables
+
+EVENT_PEOPLE_LIMIT = 500
+EVENT_PHOTOS_PAGE_SIZE = 100
+EVENT_PHOTOS_MAX_PAGE_SIZE = 500
+
+def ensure_events(db, event_ids: Iterable[str]):
+    """Cria os eventos que ainda não existem (sem falhar se outro processo criar antes)"""
+    event_ids = sorted({event_id for event_id in event_ids if event_id})
+    if not event_ids:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        existing = {row[0] for row in db.query(Event.id).filter(Event.id.in_(event_ids))}
+        db.add_all([Event(id=event_id) for event_id in event_ids if event_id not in existing])
+        db.flush()
+        return
+    db.execute(insert(Event).values([{"id": event_id} for event_id in event_ids]).on_conflict_do_nothing())
+
+def add_event_counts(db, event_id: Optional[str], photos: int = 0, faces: int = 0, clusters: int = 0, changed: bool = False):
+    """Soma (ou subtrai) fotos, rostos e pessoas nos contadores de um evento (changed: sobe a versão mesmo sem deltas)"""
+    if not event_id or not (photos or faces or clusters or changed):
+        return
+    ensure_events(db, [event_id])
+    db.execute(
+        update(Event)
+        .where(Event.id == event_id)
+        .values(
+            photo_count=Event.photo_count + photos,
+            face_count=Event.face_count + faces,
+            cluster_count=Event.cluster_count + clusters,
+            version=func.coalesce(Event.version, 0) + 1
+        )
+    )
+
+def remove_event_photo(db, photo: Photo):
+    """Desconta uma foto removida do evento e das pessoas em que ela aparecia"""
+    if not photo.event_id or photo.is_reference_photo:
+        return
+    faces = db.query(func.count(FaceEncoding.id)).filter(FaceEncoding.photo_id == photo.id).scalar()
+    for cluster_id, face_count in db.query(EventPhoto.face_cluster_id, EventPhoto.face_count).filter(EventPhoto.photo_id == photo.id).all():
+        db.execute(
+            update(FaceCluster)
+            .where(FaceCluster.id == cluster_id)
+            .values(photo_count=FaceCluster.photo_count - 1, face_count=FaceCluster.face_count - face_count)
+        )
+    db.query(EventPhoto).filter(EventPhoto.photo_id == photo.id).delete(synchronize_session=False)
+    add_event_counts(db, photo.event_id, photos=-1, faces=-faces)
+
+def rebuild_event_counters() -> int:
+    """Cria os eventos que faltam e recalcula todos os contadores; retorna quantos eventos existem"""
+    db = SessionLocal()
+    try:
+        ensure_events(db, [row[0] for row in db.query(Photo.event_id).filter(Photo.event_id.isnot(None)).distinct()])
+
+        event_photos = (Photo.event_id == Event.id) & (Photo.is_reference_photo == False)
+        db.execute(update(Event).values(
+            photo_count=select(func.count(Photo.id)).where(event_photos).scalar_subquery(),
+            face_count=select(func.count(FaceEncoding.id))
+                .join(Photo, Photo.id == FaceEncoding.photo_id)
+                .where(event_photos)
+                .scalar_subquery(),
+            cluster_count=select(func.count(FaceCluster.id)).where(FaceCluster.event_id == Event.id).scalar_subquery(),
+            version=func.coalesce(Event.version, 0) + 1
+        ))
+        db.execute(update(FaceCluster).values(
+            photo_count=select(func.count(EventPhoto.id))
+                .where(EventPhoto.face_cluster_id == FaceCluster.id)
+                .scalar_subquery(),
+            face_count=select(func.coalesce(func.sum(EventPhoto.face_count), 0))
+                .where(EventPhoto.face_cluster_id == FaceCluster.id)
+                .scalar_subquery()
+        ))
+        db.commit()
+        return db.query(func.count(Event.id)).scalar()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _event_dict(event: Event) -> dict:
+    return {
+        "id": event.id,
+        "name": event.name,
+        "owner_id": event.owner_id,
+        "event_date": event.event_date.isoformat() if event.event_date else None,
+        "photo_count": event.photo_count,
+        "face_count": event.face_count,
+        "cluster_count": event.cluster_count,
+        "version": event.version or 0,
+        "created_at": event.created_at.isoformat() if event.created_at else None
+    }
+
+async def get_event_async(db, event_id: str) -> Optional[dict]:
+    """Dados e contadores de um evento (uma busca pela chave primária)"""
+    async with db.begin():
+        event = await db.get(Event, event_id)
+        return _event_dict(event) if event else None
+
+async def get_event_people_async(db, event_id: str, limit: int = EVENT_PEOPLE_LIMIT) -> list:
+    """Pessoas (clusters) de um evento, das que aparecem em mais fotos para as que aparecem em menos"""
+    statement = (
+        select(FaceCluster.id, FaceCluster.photo_count, FaceCluster.face_count, FaceCluster.cover_photo_id)
+        .where(FaceCluster.event_id == event_id)
+        .order_by(FaceCluster.photo_count.desc(), FaceCluster.id.desc())
+        .limit(limit)
+    )
+    async with db.begin():
+        rows = (await db.execute(statement)).all()
+    return [
+        {"id": cluster_id, "photo_count": photo_count, "face_count": face_count, "cover_photo_id": cover_photo_id}
+        for cluster_id, photo_count, face_count, cover_photo_id in rows
+    ]
+
+def person_photos_statement(event_id: str, cluster_id: int, limit: int, after_id: Optional[int] = None):
+    """SELECT das fotos do evento com a pessoa, em ordem de id (uma linha a mais para a próxima página)"""
+    statement = (
+        select(Photo.id, Photo.filename, Photo.created_at, EventPhoto.face_count)
+        .join(Photo, Photo.id == EventPhoto.photo_id)
+        .where(EventPhoto.event_id == event_id, EventPhoto.face_cluster_id == cluster_id)
+    )
+    if after_id is not None:
+        statement = statement.where(EventPhoto.photo_id > after_id)
+    return statement.order_by(EventPhoto.photo_id).limit(limit + 1)
+
+async def get_person_photos_async(
+    db,
+    event_id: str,
+    cluster_id: int,
+    limit: int = EVENT_PHOTOS_PAGE_SIZE,
+    after_id: Optional[int] = None
+) -> Tuple[list, Optional[int]]:
+    """
+    Uma página das fotos do evento em que a pessoa aparece
+
+    Returns:
+        Tuple[list, Optional[int]]: (linhas, after_id da próxima página)
+    """
+    limit = max(1, min(limit, EVENT_PHOTOS_MAX_PAGE_SIZE))
+    async with db.begin():
+        rows = (await db.execute(person_photos_statement(event_id, cluster_id, limit, after_id))).all()
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1].id
+    return rows, next_after
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção dos eventos")
+    parser.add_argument("--rebuild", action="store_true", help="Recria eventos e contadores a partir das fotos")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        create_tables()
+        total = rebuild_event_counters()
+        print(f"✅ Contadores recalculados: {total} eventos")
+    else:
+        parser.print_help()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Agrupamento dos rostos de um evento em pessoas (FaceCluster)
+
+Os rostos do evento formam um grafo k-NN (arestas só entre rostos a no
+máximo CLUSTER_THRESHOLD de distância) e o Chinese Whispers rotula os
+grupos, tudo vetorizado em NumPy. Cada pessoa guarda o centróide dos seus
+rostos, então a busca do consumidor compara a referência com algumas
+centenas de centróides e depois só com os rostos das pessoas parecidas, em
+vez de todos os rostos do evento.
+
+Rostos novos entram de forma incremental, em blocos de até
+CLUSTER_MAX_FACES_PER_PASS: cada um vai para o centróide mais próximo, se
+estiver dentro do limiar, e os que sobram são agrupados entre si em pessoas
+novas. O agrupamento completo refaz o evento do zero.
+
+Uso:
+    python face_clustering.py <event_id>   # reagrupa todos os rostos do evento
+"""
+
+import os
+import sys
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import select, update
+from database import SessionLocal, Event, EventPhoto, FaceCluster, FaceEncoding, Photo, create_tables
+from db_writer import single_writer
+from events import add_event_counts
+from face_matcher import (
+    FACE_RECOGNITION_TOLERANCE, build_encoding_matrix, compute_distances, decode_rows,
+    match_encodings, pack_encoding, unpack_encoding, unpack_encodings
+)
+
+# Agrupar os rostos novos assim que o worker grava os resultados
+FACE_CLUSTERING = os.getenv("FACE_CLUSTERING", "1") == "1"
+
+# Distância máxima entre dois rostos da mesma pessoa (0.5 é o valor usado
+# pelo dlib para agrupar encodings do face_recognition)
+CLUSTER_THRESHOLD = float(os.getenv("FACE_CLUSTER_THRESHOLD", "0.5"))
+
+# Vizinhos por rosto no grafo
+CLUSTER_KNN = int(os.getenv("FACE_CLUSTER_KNN", "32"))
+
+CLUSTER_ITERATIONS = 20
+
+# Rostos sem pessoa agrupados por transação do escritor; um evento grande
+# agrupado pela primeira vez é dividido em várias, e as escritas da API
+# entram entre elas
+CLUSTER_MAX_FACES_PER_PASS = int(os.getenv("FACE_CLUSTER_MAX_FACES_PER_PASS", "5000"))
+
+# Folga além da tolerância da busca para escolher as pessoas candidatas
+CLUSTER_SEARCH_MARGIN = float(os.getenv("FACE_CLUSTER_SEARCH_MARGIN", "0.1"))
+
+# Rostos atualizados juntos em cada passo do Chinese Whispers: blocos pequenos
+# convergem como a versão sequencial (um bloco único oscila), blocos grandes
+# aproveitam a vetorização. Todo grafo é dividido em pelo menos CLUSTER_MIN_BLOCKS
+CLUSTER_BLOCK_SIZE = 1024
+CLUSTER_MIN_BLOCKS = 32
+
+# Elementos da matriz de distâncias calculados por vez (limita a memória)
+CLUSTER_CHUNK_ELEMENTS = 1 << 24
+
+def knn_graph(vectors: np.ndarray, k: int = CLUSTER_KNN, threshold: float = CLUSTER_THRESHOLD) -> tuple:
+    """
+    Vizinhos mais próximos de cada rosto
+
+    Returns:
+        tuple: (vizinhos (n, k), pesos (n, k)); peso 0 = vizinho além do limiar
+    """
+    n = len(vectors)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.int64), np.empty((n, 0), dtype=np.float32)
+
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+    neighbors = np.empty((n, k), dtype=np.int64)
+    weights = np.empty((n, k), dtype=np.float32)
+    chunk_rows = max(1, CLUSTER_CHUNK_ELEMENTS // n)
+    for start in range(0, n, chunk_rows):
+        block = vectors[start:start + chunk_rows]
+        rows = np.arange(len(block))
+        sq_distances = sq_norms[start:start + len(block), None] - 2.0 * (block @ vectors.T) + sq_norms[None, :]
+        sq_distances[rows, rows + start] = np.inf  # Sem laço no próprio rosto
+        nearest = np.argpartition(sq_distances, k - 1, axis=1)[:, :k]
+        distances = np.sqrt(np.maximum(np.take_along_axis(sq_distances, nearest, axis=1), 0.0))
+        neighbors[start:start + len(block)] = nearest
+        weights[start:start + len(block)] = np.where(distances <= threshold, 1.0 - distances, 0.0)
+    return neighbors, weights
+
+def chinese_whispers(neighbors: np.ndarray, weights: np.ndarray, iterations: int = CLUSTER_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """
+    Rotula o grafo com Chinese Whispers
+
+    Cada rosto começa com o próprio rótulo e, em ordem aleatória, adota o
+    rótulo de maior peso somado entre os seus vizinhos. Os rostos são
+    atualizados em blocos aleatórios (vetorizado dentro do bloco).
+
+    Returns:
+        np.ndarray: rótulo (0..m-1) de cada rosto
+    """
+    n = len(neighbors)
+    labels = np.arange(n, dtype=np.int64)
+    if n == 0 or neighbors.shape[1] == 0:
+        return labels
+
+    rng = np.random.default_rng(seed)
+    has_edges = weights.max(axis=1) > 0
+    block_size = min(CLUSTER_BLOCK_SIZE, max(1, n // CLUSTER_MIN_BLOCKS))
+    for _ in range(iterations):
+        changed = 0
+        order = rng.permutation(n)
+        for block in np.array_split(order, -(-n // block_size)):
+            neighbor_labels = labels[neighbors[block]]
+            # Peso somado do rótulo de cada vizinho: (b, k, k) -> (b, k)
+            same_label = neighbor_labels[:, :, None] == neighbor_labels[:, None, :]
+            scores = (same_label * weights[block][:, None, :]).sum(axis=2)
+            best = neighbor_labels[np.arange(len(block)), scores.argmax(axis=1)]
+            new_labels = np.where(has_edges[block], best, labels[block])
+            changed += int((new_labels != labels[block]).sum())
+            labels[block] = new_labels
+        if changed == 0:
+            break
+
+    return np.unique(labels, return_inverse=True)[1]
+
+def cluster_vectors(vectors: np.ndarray) -> np.ndarray:
+    """Agrupa encodings em pessoas; retorna o rótulo de cada um"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return chinese_whispers(*knn_graph(vectors))
+
+def _load_event_faces(db, event_id: str, unassigned_only: bool, limit: Optional[int] = None) -> tuple:
+    """(ids dos encodings, ids das fotos, vetores) dos rostos do evento, em ordem de id"""
+    query = (
+        db.query(FaceEncoding.id, FaceEncoding.photo_id, FaceEncoding.encoding_blob, FaceEncoding.encoding_data)
+        .join(Photo, Photo.id == FaceEncoding.photo_id)
+        .filter(Photo.event_id == event_id, Photo.is_reference_photo == False)
+    )
+    if unassigned_only:
+        query = query.filter(FaceEncoding.face_cluster_id.is_(None))
+    rows = query.order_by(FaceEncoding.id).limit(limit).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+
+    encoding_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    photo_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    return encoding_ids, photo_ids, decode_rows([row[2:] for row in rows])
+
+def _reset_event_clusters(db, event_id: str) -> int:
+    """Apaga as pessoas do evento e solta os rostos; retorna quantas pessoas existiam"""
+    db.query(EventPhoto).filter(EventPhoto.event_id == event_id).delete(synchronize_session=False)
+    event_photo_ids = select(Photo.id).where(Photo.event_id == event_id)
+    db.query(FaceEncoding).filter(FaceEncoding.photo_id.in_(event_photo_ids)).update(
+        {FaceEncoding.face_cluster_id: None}, synchronize_session=False
+    )
+    return db.query(FaceCluster).filter(FaceCluster.event_id == event_id).delete(synchronize_session=False)
+
+def _assign_faces(db, event_id: str, clusters: List[FaceCluster], targets: np.ndarray,
+                  encoding_ids: np.ndarray, photo_ids: np.ndarray, vectors: np.ndarray, existing: int):
+    """Grava rostos em pessoas: centróides, contadores, FaceEncoding e EventPhoto"""
+    order = np.argsort(targets, kind="stable")
+    touched, starts, counts = np.unique(targets[order], return_index=True, return_counts=True)
+    sums = np.add.reduceat(vectors[order], starts, axis=0)
+
+    for target, total, count, start in zip(touched, sums, counts, starts):
+        cluster = clusters[target]
+        previous = cluster.face_count or 0
+        centroid = total / count
+        if previous > 0 and cluster.centroid_blob is not None:
+            centroid = (unpack_encoding(cluster.centroid_blob) * previous + total) / (previous + count)
+        cluster.centroid_blob = pack_encoding(centroid)
+        cluster.face_count = previous + int(count)
+        if cluster.cover_photo_id is None:
+            # Capa: o rosto mais próximo do centróide
+            members = order[start:start + count]
+            closest = members[np.argmin(np.einsum("ij,ij->i", vectors[members] - centroid, vectors[members] - centroid))]
+            cluster.cover_photo_id = int(photo_ids[closest])
+
+    db.execute(update(FaceEncoding), [
+        {"id": int(encoding_id), "face_cluster_id": clusters[target].id}
+        for encoding_id, target in zip(encoding_ids, targets)
+    ])
+
+    # Uma linha de EventPhoto por (pessoa, foto); fotos já ligadas à pessoa só somam rostos
+    pairs, pair_counts = np.unique(np.stack((targets, photo_ids), axis=1), axis=0, return_counts=True)
+    current = {}
+    existing_pairs = pairs[pairs[:, 0] < existing]
+    if len(existing_pairs):
+        current = {
+            (row.face_cluster_id, row.photo_id): row
+            for row in db.query(EventPhoto).filter(
+                EventPhoto.event_id == event_id,
+                EventPhoto.face_cluster_id.in_({clusters[target].id for target in existing_pairs[:, 0]}),
+                EventPhoto.photo_id.in_({int(photo_id) for photo_id in existing_pairs[:, 1]})
+            )
+        }
+    for (target, photo_id), count in zip(pairs, pair_counts):
+        cluster = clusters[target]
+        row = current.get((cluster.id, int(photo_id)))
+        if row is not None:
+            row.face_count += int(count)
+            continue
+        db.add(EventPhoto(event_id=event_id, face_cluster_id=cluster.id, photo_id=int(photo_id), face_count=int(count)))
+        cluster.photo_count = (cluster.photo_count or 0) + 1
+
+def _cluster_event_faces(event_id: str, rebuild: bool, limit: Optional[int] = None) -> int:
+    """Agrupa até limit rostos sem pessoa do evento (todos, se rebuild); retorna quantos foram agrupados"""
+    db = SessionLocal()
+    try:
+        removed = _reset_event_clusters(db, event_id) if rebuild else 0
+        encoding_ids, photo_ids, vectors = _load_event_faces(db, event_id, unassigned_only=True, limit=limit)
+        if len(encoding_ids) == 0:
+            add_event_counts(db, event_id, clusters=-removed)
+            db.commit()
+            return 0
+
+        clusters = [] if rebuild else db.query(FaceCluster).filter(FaceCluster.event_id == event_id).order_by(FaceCluster.id).all()
+        targets = np.full(len(encoding_ids), -1, dtype=np.int64)
+        if clusters:
+            centroids = build_encoding_matrix(
+                np.array([cluster.id for cluster in clusters]),
+                unpack_encodings([cluster.centroid_blob for cluster in clusters])
+            )
+            sq_distances = centroids.sq_norms[None, :] - 2.0 * (vectors @ centroids.matrix.T) + np.einsum("ij,ij->i", vectors, vectors)[:, None]
+            nearest = sq_distances.argmin(axis=1)
+            close = np.sqrt(np.maximum(sq_distances[np.arange(len(nearest)), nearest], 0.0)) <= CLUSTER_THRESHOLD
+            targets[close] = nearest[close]
+
+        existing = len(clusters)
+        remaining = np.flatnonzero(targets < 0)
+        new_clusters = []
+        if len(remaining):
+            labels = cluster_vectors(vectors[remaining])
+            new_clusters = [FaceCluster(event_id=event_id, face_count=0, photo_count=0) for _ in range(int(labels.max()) + 1)]
+            db.add_all(new_clusters)
+            db.flush()
+            targets[remaining] = existing + labels
+
+        _assign_faces(db, event_id, clusters + new_clusters, targets, encoding_ids, photo_ids, vectors, existing)
+        # Rostos em pessoas existentes não mudam os contadores, mas mudam a busca
+        add_event_counts(db, event_id, clusters=len(new_clusters) - removed, changed=True)
+        db.commit()
+        return len(encoding_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@single_writer
+def update_event_clusters(event_id: str) -> int:
+    """Agrupa de forma incremental até CLUSTER_MAX_FACES_PER_PASS rostos novos de um evento"""
+    return _cluster_event_faces(event_id, rebuild=False, limit=CLUSTER_MAX_FACES_PER_PASS)
+
+def refresh_event_clusters(event_ids):
+    """Agrupamento incremental depois de gravar rostos novos (falhas ficam para a próxima vez)"""
+    if not FACE_CLUSTERING:
+        return
+    for event_id in event_ids:
+        try:
+            # Uma transação do escritor por bloco, até não sobrar rosto sem pessoa
+            while update_event_clusters(event_id) >= CLUSTER_MAX_FACES_PER_PASS:
+                pass
+        except Exception as e:
+            # Os rostos continuam sem pessoa e entram no próximo agrupamento
+            print(f"❌ Erro ao agrupar rostos do evento {event_id}: {e}")
+
+@single_writer
+def cluster_event(event_id: str) -> int:
+    """Refaz todas as pessoas de um evento (os ids dos clusters mudam)"""
+    return _cluster_event_faces(event_id, rebuild=True)
+
+def _cluster_faces_statement(cluster_ids: List[int]):
+    return (
+        select(FaceEncoding.photo_id, FaceEncoding.encoding_blob, FaceEncoding.encoding_data)
+        .where(FaceEncoding.face_cluster_id.in_(cluster_ids))
+    )
+
+def _unassigned_faces_statement(event_id: str):
+    return (
+        select(FaceEncoding.photo_id, FaceEncoding.encoding_blob, FaceEncoding.encoding_data)
+        .join(Photo, Photo.id == FaceEncoding.photo_id)
+        .where(Photo.event_id == event_id, Photo.is_reference_photo == False, FaceEncoding.face_cluster_id.is_(None))
+    )
+
+async def search_event_clusters_async(db, event_id: str, query, top_k: int = 50, tolerance: Optional[float] = None) -> Optional[List[dict]]:
+    """
+    Busca as fotos de um evento usando as pessoas para escolher os rostos comparados
+
+    Os centróides só selecionam as pessoas candidatas (até CLUSTER_SEARCH_MARGIN
+    além da tolerância, já que um rosto da pessoa pode estar mais perto da
+    referência que o centróide); a distância de cada foto vem dos rostos
+    dessas pessoas e dos rostos ainda sem pessoa, comparados um a um.
+
+    Returns:
+        Optional[List[dict]]: mesmo formato de match_encodings; None se o
+        evento não tem pessoas
+    """
+    if tolerance is None:
+        tolerance = FACE_RECOGNITION_TOLERANCE
+    query = np.asarray(query, dtype=np.float32).ravel()
+
+    async with db.begin():
+        rows = (await db.execute(
+            select(FaceCluster.id, FaceCluster.centroid_blob, FaceCluster.face_count).where(FaceCluster.event_id == event_id)
+        )).all()
+        if not rows:
+            return None
+
+        centroids = build_encoding_matrix([row[0] for row in rows], unpack_encodings([row[1] for row in rows]))
+        if query.shape[0] != centroids.matrix.shape[1]:
+            raise ValueError("Dimensão do encoding de consulta não confere com o evento")
+        candidates = centroids.photo_ids[compute_distances(centroids, query) <= tolerance + CLUSTER_SEARCH_MARGIN]
+        face_rows = []
+        if len(candidates):
+            face_rows = (await db.execute(_cluster_faces_statement([int(cluster_id) for cluster_id in candidates]))).all()
+
+        # Rostos gravados depois do último agrupamento (ou ainda na fila de um evento grande)
+        clustered = sum(row[2] or 0 for row in rows)
+        event_faces = (await db.execute(select(Event.face_count).where(Event.id == event_id))).scalar()
+        if event_faces is None or event_faces > clustered:
+            face_rows += (await db.execute(_unassigned_faces_statement(event_id))).all()
+
+    if not face_rows:
+        return []
+    encodings = build_encoding_matrix([row[0] for row in face_rows], decode_rows([row[1:] for row in face_rows]))
+    return match_encodings(encodings, query, top_k=top_k, tolerance=tolerance)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python face_clustering.py <event_id>")
+        sys.exit(1)
+    create_tables()
+    faces = cluster_event(sys.argv[1])
+    db = SessionLocal()
+    try:
+        people = db.query(FaceCluster).filter(FaceCluster.event_id == sys.argv[1]).count()
+    finally:
+        db.close()
+    print(f"✅ Evento {sys.argv[1]}: {faces} rostos agrupados em {people} pessoas")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Detecção de rostos e cálculo de embeddings de uma foto
+
+Usa a biblioteca face_recognition (dlib) quando ela está instalada. As
+funções daqui rodam dentro dos processos do pool de face_jobs (decodificação,
+redução e detecção no mesmo processo), então este módulo não importa nada
+do banco de dados. A mesma imagem decodificada também gera as miniaturas
+e prévias da galeria (image_derivatives).
+"""
+
+import os
+import importlib
+from typing import List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from image_derivatives import pregenerate_derivatives
+from image_loader import load_image
+
+# Modelo de detecção: "hog" (CPU, rápido) ou "cnn" (mais preciso, ideal com GPU)
+FACE_DETECTION_MODEL = os.getenv("FACE_DETECTION_MODEL", "hog")
+
+# Maior lado da imagem entregue ao detector (fotos de câmera são reduzidas)
+DETECTION_MAX_SIDE = int(os.getenv("FACE_DETECTION_MAX_SIDE", "1600"))
+
+# Filtro da redução para a detecção: o detector não ganha nada com o bicúbico (2x mais lento)
+DETECTION_RESAMPLE = Image.Resampling.BILINEAR
+
+# Número máximo de rostos por foto
+MAX_FACES_PER_PHOTO = int(os.getenv("MAX_FACES_PER_PHOTO", "10"))
+
+_face_recognition = None
+
+def load_face_recognition():
+    """
+    Importa o face_recognition (dlib) no primeiro uso
+
+    A importação carrega os modelos do dlib e leva segundos; só os processos
+    que realmente detectam rostos (pool de face_jobs) pagam esse custo, não
+    a API nem os scripts.
+    """
+    global _face_recognition
+    if _face_recognition is None:
+        try:
+            _face_recognition = importlib.import_module("face_recognition")
+        except ImportError:  # Dependência opcional (ver README)
+            raise RuntimeError("Biblioteca face_recognition não está instalada")
+    return _face_recognition
+
+def load_detection_image(file_path: str) -> np.ndarray:
+    """Decodifica a foto já reduzida para o tamanho da detecção, com a orientação EXIF corrigida"""
+    return np.asarray(load_image(file_path, DETECTION_MAX_SIDE, DETECTION_RESAMPLE))
+
+def detect_face_encodings(file_path: str, image: Optional[np.ndarray] = None) -> List[np.ndarray]:
+    """Detecta os rostos de uma foto e retorna um embedding float32 por rosto"""
+    face_recognition = load_face_recognition()
+
+    if image is None:
+        image = load_detection_image(file_path)
+    locations = face_recognition.face_locations(image, model=FACE_DETECTION_MODEL)
+    encodings = face_recognition.face_encodings(image, locations[:MAX_FACES_PER_PHOTO])
+    return [np.asarray(encoding, dtype=np.float32) for encoding in encodings]
+
+def process_photo_file(file_path: str, derivative_key: Optional[str] = None) -> Tuple[List[np.ndarray], Optional[str]]:
+    """
+    Processa uma foto dentro de um worker do pool
+
+    Args:
+        file_path: Caminho do original
+        derivative_key: Se informado, gera também as miniaturas da galeria
+
+    Returns:
+        Tuple[List[np.ndarray], Optional[str]]: (embeddings, mensagem_de_erro)
+    """
+    try:
+        image = load_image(file_path, DETECTION_MAX_SIDE, DETECTION_RESAMPLE)
+    except Exception as e:
+        return [], str(e)
+
+    if derivative_key:
+        try:
+            pregenerate_derivatives(image, derivative_key)
+        except Exception as e:
+            # Derivados são só cache: a galeria gera de novo sob demanda
+            print(f"❌ Erro ao gerar miniaturas de {file_path}: {e}")
+
+    try:
+        return detect_face_encodings(file_path, np.asarray(image)), None
+    except Exception as e:
+        return [], str(e)
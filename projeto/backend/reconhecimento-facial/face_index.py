@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Índice aproximado (IVF) de encodings faciais por evento
+
+Os encodings de cada evento são particionados por k-means em listas
+invertidas. Uma busca compara a consulta apenas com os centróides e com as
+listas mais próximas (nprobe), então o custo cresce de forma sublinear com
+o número de rostos do evento.
+
+Cada evento tem dois arquivos em INDEX_DIR:
+    <evento>.npz          centróides, offsets e qual arquivo de listas usar
+    <evento>.<id>.lists   rostos ordenados por lista, no formato de shard
+
+Os rostos adicionados depois do último merge não são copiados: a cauda do
+índice é a parte final do shard de embeddings do evento (embedding_shards),
+e ambos são abertos com np.memmap e compartilhados entre os workers.
+
+Uso:
+    python face_index.py <event_id>   # (re)constrói o índice de um evento
+"""
+
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import numpy as np
+from face_matcher import EncodingMatrix, build_encoding_matrix, load_event_encodings, match_encodings
+from embedding_shards import (
+    append_event_embeddings, event_file_stem, file_lock, load_event_embeddings, open_shard,
+    replace_event_shard, shard_lock, shard_path, write_shard
+)
+
+# Índices ficam ao lado do midiaz.db
+INDEX_DIR = os.getenv("FACE_INDEX_DIR", "midiaz_indexes")
+
+# Abaixo deste número de rostos o evento é varrido de forma exata
+ANN_MIN_FACES = int(os.getenv("FACE_INDEX_MIN_FACES", "20000"))
+
+# Número de listas invertidas visitadas por busca (mais = maior recall)
+DEFAULT_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "16"))
+
+# Rostos pendentes acumulados antes de reorganizar as listas invertidas
+TAIL_MERGE_MIN = 5000
+TAIL_MERGE_RATIO = 0.1
+
+# Retreinar os centróides quando o evento crescer este fator desde o treino
+RETRAIN_GROWTH = 4.0
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+ASSIGN_CHUNK_ROWS = 65536
+
+# Índices já carregados neste processo: event_id -> (versão dos arquivos, índice)
+_loaded_indexes: Dict[str, tuple] = {}
+
+def _index_path(event_id: str) -> str:
+    """Caminho dos metadados do índice de um evento"""
+    return os.path.join(INDEX_DIR, f"{event_file_stem(event_id)}.npz")
+
+@contextmanager
+def index_lock(event_id: str):
+    """
+    Lock dos arquivos do índice de um evento
+
+    Só quem grava (build, merge, remoção) segura o lock; as leituras não
+    esperam (ver load_index). Sempre antes de shard_lock, nunca dentro dele.
+    """
+    with file_lock(os.path.join(INDEX_DIR, f"{event_file_stem(event_id)}.lock")):
+        yield
+
+def _save_npz(path: str, **arrays):
+    """Grava um .npz de forma atômica (arquivo temporário + rename)"""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def suggested_nlist(num_faces: int) -> int:
+    """Número de listas invertidas recomendado para um evento"""
+    if num_faces < ANN_MIN_FACES:
+        return 0
+    return int(min(65536, max(16, 4 * np.sqrt(num_faces))))
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Atribui cada vetor ao centróide mais próximo, em blocos para limitar memória"""
+    centroid_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = vectors[start:start + ASSIGN_CHUNK_ROWS]
+        # ||x||² é constante por linha e não altera o argmin
+        scores = centroid_sq_norms - 2.0 * (chunk @ centroids.T)
+        assignments[start:start + len(chunk)] = np.argmin(scores, axis=1)
+    return assignments
+
+def train_centroids(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Treina os centróides com k-means (Lloyd) sobre uma amostra dos vetores"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = nearest_centroids(sample, centroids)
+        counts = np.bincount(assignments, minlength=nlist)
+        order = np.argsort(assignments, kind="stable")
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        centroids[non_empty] = sums / counts[non_empty, None]
+
+        # Listas vazias recebem um ponto aleatório da amostra
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+
+    return centroids.astype(np.float32)
+
+class FaceIndex:
+    """Índice IVF de um evento: listas invertidas + cauda não particionada"""
+
+    def __init__(self, centroids, offsets, lists: EncodingMatrix, tail: EncodingMatrix, trained_size: int):
+        self.centroids = centroids          # (nlist, dim)
+        self.offsets = offsets              # (nlist + 1,) início de cada lista
+        self.lists = lists                  # rostos ordenados por lista invertida
+        self.tail = tail                    # rostos do shard ainda não particionados
+        self.trained_size = trained_size
+
+    @property
+    def size(self) -> int:
+        return len(self.lists.photo_ids) + len(self.tail.photo_ids)
+
+    @property
+    def covered_rows(self) -> int:
+        """Linhas iniciais do shard do evento que já estão nas listas invertidas"""
+        return len(self.lists.photo_ids)
+
+    @classmethod
+    def build(cls, photo_ids, vectors, nlist: Optional[int] = None) -> "FaceIndex":
+        """Constrói o índice completo a partir de todos os rostos do evento"""
+        photo_ids = np.asarray(photo_ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if nlist is None:
+            nlist = suggested_nlist(len(photo_ids))
+        if nlist == 0:
+            # Evento pequeno: tudo na cauda, busca exata
+            dim = vectors.shape[1] if vectors.ndim == 2 else 0
+            return cls(np.empty((0, dim), dtype=np.float32), np.zeros(1, dtype=np.int64),
+                       build_encoding_matrix(photo_ids[:0], vectors[:0]),
+                       build_encoding_matrix(photo_ids, vectors), 0)
+
+        return cls.assign(photo_ids, vectors, train_centroids(vectors, nlist), len(photo_ids))
+
+    @classmethod
+    def assign(cls, photo_ids, vectors, centroids: np.ndarray, trained_size: int) -> "FaceIndex":
+        """Distribui todos os rostos em centróides já treinados (sem cauda)"""
+        photo_ids = np.asarray(photo_ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        assignments = nearest_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=len(centroids))))).astype(np.int64)
+        return cls(centroids, offsets,
+                   build_encoding_matrix(photo_ids[order], vectors[order]),
+                   build_encoding_matrix(photo_ids[:0], vectors[:0]),
+                   trained_size)
+
+    def needs_merge(self) -> bool:
+        tail_size = len(self.tail.photo_ids)
+        if len(self.centroids) == 0:
+            return self.size >= ANN_MIN_FACES
+        return tail_size >= max(TAIL_MERGE_MIN, TAIL_MERGE_RATIO * len(self.lists.photo_ids))
+
+    def merged(self) -> "FaceIndex":
+        """Retorna um índice com a cauda distribuída nas listas invertidas"""
+        dim = self.tail.matrix.shape[1]
+        photo_ids = np.concatenate((self.lists.photo_ids, self.tail.photo_ids))
+        vectors = np.concatenate((self.lists.matrix.reshape(-1, dim), self.tail.matrix))
+        if len(self.centroids) == 0 or self.size > RETRAIN_GROWTH * self.trained_size:
+            return FaceIndex.build(photo_ids, vectors)
+
+        # Mesmos centróides: só atribuir a cauda e reordenar
+        nlist = len(self.centroids)
+        list_sizes = np.diff(self.offsets)
+        assignments = np.concatenate((
+            np.repeat(np.arange(nlist, dtype=np.int32), list_sizes),
+            nearest_centroids(self.tail.matrix, self.centroids)
+        ))
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=nlist)))).astype(np.int64)
+        return FaceIndex(self.centroids, offsets,
+                         build_encoding_matrix(photo_ids[order], vectors[order]),
+                         build_encoding_matrix(photo_ids[:0], vectors[:0]),
+                         self.trained_size)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> EncodingMatrix:
+        """Seleciona os rostos das nprobe listas mais próximas da consulta, mais a cauda"""
+        if len(self.centroids) == 0:
+            return self.tail
+
+        nprobe = min(nprobe, len(self.centroids))
+        centroid_scores = np.einsum("ij,ij->i", self.centroids, self.centroids) - 2.0 * (self.centroids @ query)
+        probes = np.argpartition(centroid_scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes])
+
+        photo_ids = np.concatenate((self.lists.photo_ids[rows], self.tail.photo_ids))
+        matrix = np.concatenate((self.lists.matrix[rows], self.tail.matrix))
+        sq_norms = np.concatenate((self.lists.sq_norms[rows], self.tail.sq_norms))
+        return EncodingMatrix(photo_ids, matrix, sq_norms)
+
+    def search(self, query, top_k: int = 50, tolerance: Optional[float] = None, nprobe: int = DEFAULT_NPROBE) -> List[dict]:
+        """Busca aproximada: distância exata apenas nos candidatos das listas visitadas"""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        return match_encodings(self.candidates(query, nprobe), query, top_k=top_k, tolerance=tolerance)
+
+def save_index(event_id: str, index: FaceIndex):
+    """Persiste o índice de um evento: listas num shard novo e metadados no .npz (segurando index_lock)"""
+    meta_path = _index_path(event_id)
+    previous_lists = _read_lists_file(meta_path)
+
+    lists_file = f"{event_file_stem(event_id)}.{uuid.uuid4().hex[:8]}.lists"
+    write_shard(os.path.join(INDEX_DIR, lists_file), index.lists.photo_ids,
+                index.lists.matrix.reshape(len(index.lists.photo_ids), index.centroids.shape[1]))
+    _save_npz(
+        meta_path,
+        centroids=index.centroids,
+        offsets=index.offsets,
+        trained_size=np.array(index.trained_size, dtype=np.int64),
+        lists_file=np.array(lists_file)
+    )
+    _loaded_indexes.pop(event_id, None)
+
+    # Processos que ainda mapeiam as listas antigas continuam lendo o arquivo removido
+    if previous_lists and previous_lists != lists_file:
+        try:
+            os.remove(os.path.join(INDEX_DIR, previous_lists))
+        except OSError:
+            pass
+
+def _read_lists_file(meta_path: str) -> Optional[str]:
+    """Nome do arquivo de listas referenciado pelos metadados, se existirem"""
+    try:
+        with np.load(meta_path) as meta:
+            return str(meta["lists_file"])
+    except OSError:
+        return None
+
+def _index_version(event_id: str) -> Optional[tuple]:
+    """Versão dos arquivos do índice (mtime dos metadados, tamanho do shard); None se não existir"""
+    try:
+        return os.path.getmtime(_index_path(event_id)), os.path.getsize(shard_path(event_id))
+    except OSError:
+        return None
+
+def load_index(event_id: str) -> Optional[FaceIndex]:
+    """
+    Carrega o índice de um evento (com cache por processo); None se não existir
+
+    Sem lock: um save_index concorrente pode apagar o .lists entre a leitura
+    do .npz e a abertura das listas. Nesse caso já existe um .npz novo, e a
+    leitura recomeça por ele.
+    """
+    meta_path = _index_path(event_id)
+    while True:
+        lists_file = _read_lists_file(meta_path)
+        try:
+            return _load_index(event_id)
+        except FileNotFoundError:
+            if _read_lists_file(meta_path) == lists_file:
+                raise
+
+def _load_index(event_id: str) -> Optional[FaceIndex]:
+    version = _index_version(event_id)
+    if version is None:
+        return None
+
+    cached = _loaded_indexes.get(event_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with np.load(_index_path(event_id)) as meta:
+        centroids, offsets = meta["centroids"], meta["offsets"]
+        trained_size = int(meta["trained_size"])
+        lists_file = str(meta["lists_file"])
+
+    # As listas são uma permutação das primeiras linhas do shard; o resto é a cauda
+    lists = open_shard(os.path.join(INDEX_DIR, lists_file))
+    index = FaceIndex(centroids, offsets, lists, open_shard(shard_path(event_id), start=len(lists.photo_ids)), trained_size)
+    _loaded_indexes[event_id] = (version, index)
+    return index
+
+def build_event_index(event_id: str, nlist: Optional[int] = None) -> Optional[FaceIndex]:
+    """(Re)constrói o índice de um evento a partir do shard de embeddings"""
+    with index_lock(event_id):
+        return _build_event_index(event_id, nlist)
+
+def _build_event_index(event_id: str, nlist: Optional[int] = None) -> Optional[FaceIndex]:
+    """build_event_index com o lock do índice já obtido"""
+    encodings = load_event_embeddings(event_id)
+    if len(encodings.photo_ids) == 0:
+        return None
+    index = FaceIndex.build(encodings.photo_ids, encodings.matrix, nlist=nlist)
+    save_index(event_id, index)
+    return load_index(event_id)
+
+def ensure_event_index(event_id: str) -> Optional[FaceIndex]:
+    """Índice do evento, construído uma única vez se ainda não existe (buscas simultâneas esperam a primeira)"""
+    index = load_index(event_id)
+    if index is not None:
+        return index
+    with index_lock(event_id):
+        return load_index(event_id) or _build_event_index(event_id)
+
+def update_event_index(event_id: str):
+    """
+    Atualiza o índice depois que novos rostos foram acrescentados ao shard
+
+    Os rostos novos já aparecem na cauda (linhas do shard depois de
+    covered_rows); as listas invertidas só são regravadas quando a cauda
+    fica grande.
+    """
+    with index_lock(event_id):
+        index = load_index(event_id)
+        if index is None:
+            _build_event_index(event_id)
+        elif index.needs_merge():
+            save_index(event_id, index.merged())
+
+def add_event_encodings(event_id: str, photo_ids, vectors):
+    """Acrescenta rostos já gravados no banco ao shard e ao índice do evento"""
+    append_event_embeddings(event_id, photo_ids, vectors)
+    update_event_index(event_id)
+
+def _remove_index(event_id: str):
+    """Apaga os arquivos do índice de um evento"""
+    meta_path = _index_path(event_id)
+    lists_file = _read_lists_file(meta_path)
+    for path in (meta_path, lists_file and os.path.join(INDEX_DIR, lists_file)):
+        if path and os.path.exists(path):
+            os.remove(path)
+    _loaded_indexes.pop(event_id, None)
+
+def remove_event_encodings(event_id: str):
+    """
+    Tira do shard e do índice os rostos que foram apagados do banco
+
+    Chamar depois do commit. Shard e listas são só de acréscimo, então os dois
+    são regravados a partir do banco (com os centróides atuais, sem retreinar).
+    As listas novas são salvas antes do shard: no intervalo, a cauda ainda vem
+    do shard antigo, que contém todos os rostos atuais, e nenhum some da busca.
+    """
+    with index_lock(event_id), shard_lock(event_id):
+        encodings = load_event_encodings(event_id)
+        if len(encodings.photo_ids) == 0:
+            _remove_index(event_id)
+        else:
+            meta_path = _index_path(event_id)
+            try:
+                with np.load(meta_path) as meta:
+                    centroids, trained_size = meta["centroids"], int(meta["trained_size"])
+            except OSError:
+                centroids, trained_size = None, 0
+            if centroids is not None and len(centroids):
+                index = FaceIndex.assign(encodings.photo_ids, encodings.matrix, centroids, trained_size)
+            else:
+                index = FaceIndex.build(encodings.photo_ids, encodings.matrix)
+            save_index(event_id, index)
+        replace_event_shard(event_id, encodings)
+
+def search_event_index(event_id: str, query, top_k: int = 50, tolerance: Optional[float] = None) -> List[dict]:
+    """Busca no índice do evento (eventos pequenos são varridos de forma exata)"""
+    index = ensure_event_index(event_id)
+    if index is None:
+        return []
+    return index.search(query, top_k=top_k, tolerance=tolerance)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python face_index.py <event_id>")
+        sys.exit(1)
+    built = build_event_index(sys.argv[1])
+    if built is None:
+        print(f"❌ Evento {sys.argv[1]} não tem rostos")
+    else:
+        print(f"✅ Índice do evento {sys.argv[1]}: {built.size} rostos em {len(built.centroids)} listas")
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Fila local de processamento facial
+
+Os uploads só gravam um FaceJob pendente e retornam. Um despachante em
+uma thread separada pega os jobs em lotes, envia as fotos para um
+ProcessPoolExecutor (detecção e embedding fora do event loop e do GIL) e
+grava os resultados de cada lote numa única transação.
+
+Uso:
+    python face_jobs.py   # roda o worker fora da API (use com FACE_WORKER_EMBEDDED=0)
+"""
+
+import os
+import uuid
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy import func, select
+from database import SessionLocal, Photo, FaceEncoding, FaceJob, create_tables, session_scope
+from db_writer import single_writer
+from events import add_event_counts
+from face_embedding import process_photo_file
+from face_matcher import pack_encoding, decode_rows, store_reference_encodings, invalidate_reference_cache
+from image_derivatives import derivative_key
+from face_index import add_event_encodings
+from face_clustering import refresh_event_clusters
+
+# Processos de detecção (CPU-bound)
+FACE_WORKERS = int(os.getenv("FACE_WORKERS", str(os.cpu_count() or 1)))
+
+# Jobs pegos por vez: o suficiente para manter todos os processos ocupados
+FACE_JOB_BATCH_SIZE = int(os.getenv("FACE_JOB_BATCH_SIZE", str(FACE_WORKERS * 2)))
+
+# Intervalo de verificação da fila quando não há jobs novos neste processo
+FACE_JOB_POLL_SECONDS = float(os.getenv("FACE_JOB_POLL_SECONDS", "1.0"))
+
+# Rodar o worker dentro da API (desligar quando usar vários workers do uvicorn)
+FACE_WORKER_EMBEDDED = os.getenv("FACE_WORKER_EMBEDDED", "1") == "1"
+
+FACE_JOB_MAX_ATTEMPTS = 3
+FACE_JOB_TIMEOUT = timedelta(minutes=10)
+
+JOB_PENDING = "pending"
+JOB_PROCESSING = "processing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_STATUSES = (JOB_PENDING, JOB_PROCESSING, JOB_DONE, JOB_FAILED)
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_dispatcher: Optional[threading.Thread] = None
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _find_previous_detections(db, photos) -> Dict[str, tuple]:
+    """
+    Detecções já concluídas para o mesmo conteúdo (Photo.content_hash)
+
+    Returns:
+        Dict[str, tuple]: content_hash -> (faces_found, [(blob, json, confiança), ...])
+    """
+    new_ids = [photo.id for photo in photos]
+    hashes = {photo.content_hash for photo in photos if getattr(photo, "content_hash", None)}
+    if not hashes:
+        return {}
+
+    sources = {}
+    for photo_id, content_hash, faces_found in (
+        db.query(FaceJob.photo_id, Photo.content_hash, FaceJob.faces_found)
+        .join(Photo, Photo.id == FaceJob.photo_id)
+        .filter(Photo.content_hash.in_(hashes), FaceJob.status == JOB_DONE, ~Photo.id.in_(new_ids))
+        .order_by(FaceJob.id.desc())
+    ):
+        sources.setdefault(content_hash, (photo_id, faces_found))
+    if not sources:
+        return {}
+
+    encodings = defaultdict(list)
+    for photo_id, blob, data, confidence in (
+        db.query(FaceEncoding.photo_id, FaceEncoding.encoding_blob,
+                 FaceEncoding.encoding_data, FaceEncoding.confidence)
+        .filter(FaceEncoding.photo_id.in_([photo_id for photo_id, _ in sources.values()]))
+        .order_by(FaceEncoding.id)
+    ):
+        encodings[photo_id].append((blob, data, confidence))
+
+    return {
+        content_hash: (faces_found or 0, encodings[photo_id])
+        for content_hash, (photo_id, faces_found) in sources.items()
+    }
+
+def enqueue_face_jobs(photos) -> List[int]:
+    """
+    Cria um job por foto e acorda o despachante
+
+    Fotos com o mesmo conteúdo de uma foto já processada não voltam para o
+    pool: os encodings são copiados e o job já nasce concluído.
+    """
+    job_ids, new_faces, pending = _create_jobs(photos)
+
+    for event_id, (photo_ids, vectors) in new_faces.items():
+        add_event_encodings(event_id, photo_ids, np.concatenate(vectors))
+    refresh_event_clusters(new_faces)
+
+    if pending:
+        _wakeup.set()
+    return job_ids
+
+@single_writer
+def _create_jobs(photos) -> tuple:
+    """Grava os jobs (e os encodings copiados) numa transação; retorna (ids, encodings por evento, pendentes)"""
+    new_faces: Dict[str, tuple] = defaultdict(lambda: ([], []))
+    reference_users = set()
+    pending = 0
+    with session_scope() as db:
+        try:
+            previous = _find_previous_detections(db, photos)
+            now = datetime.utcnow()
+            jobs = []
+            for photo in photos:
+                detection = previous.get(getattr(photo, "content_hash", None))
+                if detection is None:
+                    jobs.append(FaceJob(photo_id=photo.id, user_id=photo.user_id, status=JOB_PENDING))
+                    pending += 1
+                    continue
+
+                faces_found, rows = detection
+                for blob, data, confidence in rows:
+                    db.add(FaceEncoding(
+                        user_id=photo.user_id,
+                        photo_id=photo.id,
+                        encoding_blob=blob,
+                        encoding_data=data,
+                        confidence=confidence
+                    ))
+                db.query(Photo).filter(Photo.id == photo.id).update(
+                    {Photo.face_detected: faces_found > 0}, synchronize_session=False
+                )
+                jobs.append(FaceJob(
+                    photo_id=photo.id, user_id=photo.user_id, status=JOB_DONE,
+                    faces_found=faces_found, started_at=now, finished_at=now
+                ))
+                if rows and photo.is_reference_photo:
+                    reference_users.add(photo.user_id)
+                elif rows and photo.event_id:
+                    photo_ids, vectors = new_faces[photo.event_id]
+                    photo_ids.extend([photo.id] * len(rows))
+                    vectors.append(decode_rows([row[:2] for row in rows]))
+
+            db.add_all(jobs)
+            for event_id, (photo_ids, _) in new_faces.items():
+                add_event_counts(db, event_id, faces=len(photo_ids))
+            store_reference_encodings(db, reference_users)
+            # Ids lidos antes do commit: o commit expira os objetos
+            db.flush()
+            job_ids = [job.id for job in jobs]
+            db.commit()
+            invalidate_reference_cache(reference_users)
+        except Exception:
+            db.rollback()
+            raise
+    return job_ids, new_faces, pending
+
+def _requeue_stale_jobs(db):
+    """Jobs presos em processamento (worker caiu) voltam para a fila ou falham"""
+    stale = db.query(FaceJob).filter(
+        FaceJob.status == JOB_PROCESSING,
+        FaceJob.started_at < datetime.utcnow() - FACE_JOB_TIMEOUT
+    ).all()
+    for job in stale:
+        if job.attempts >= FACE_JOB_MAX_ATTEMPTS:
+            job.status = JOB_FAILED
+            job.error = "Tempo de processamento esgotado"
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = JOB_PENDING
+    # SessionLocal não faz autoflush: sem isto a reserva abaixo não vê os jobs devolvidos
+    db.flush()
+
+@single_writer
+def claim_jobs(limit: int) -> List[dict]:
+    """
+    Reserva até limit jobs pendentes para este processo
+
+    A reserva é um UPDATE condicional com um token único, então vários
+    workers podem consumir a mesma fila sem processar um job duas vezes.
+    """
+    db = SessionLocal()
+    try:
+        _requeue_stale_jobs(db)
+        candidate_ids = [
+            row[0] for row in db.query(FaceJob.id)
+            .filter(FaceJob.status == JOB_PENDING)
+            .order_by(FaceJob.id)
+            .limit(limit)
+            .all()
+        ]
+        if not candidate_ids:
+            db.commit()
+            return []
+
+        token = uuid.uuid4().hex
+        db.query(FaceJob).filter(
+            FaceJob.id.in_(candidate_ids),
+            FaceJob.status == JOB_PENDING
+        ).update({
+            FaceJob.status: JOB_PROCESSING,
+            FaceJob.worker_token: token,
+            FaceJob.started_at: datetime.utcnow(),
+            FaceJob.attempts: FaceJob.attempts + 1
+        }, synchronize_session=False)
+        db.commit()
+
+        rows = (
+            db.query(FaceJob.id, FaceJob.attempts, Photo.id, Photo.user_id, Photo.event_id,
+                     Photo.is_reference_photo, Photo.file_path, Photo.content_hash)
+            .join(Photo, Photo.id == FaceJob.photo_id)
+            .filter(FaceJob.worker_token == token, FaceJob.status == JOB_PROCESSING)
+            .order_by(FaceJob.id)
+            .all()
+        )
+        return [
+            {
+                "job_id": job_id,
+                "worker_token": token,
+                "attempts": attempts,
+                "photo_id": photo_id,
+                "user_id": user_id,
+                "event_id": event_id,
+                "is_reference": is_reference,
+                "file_path": file_path,
+                "derivative_key": None if is_reference else derivative_key(content_hash, photo_id)
+            }
+            for job_id, attempts, photo_id, user_id, event_id, is_reference, file_path, content_hash in rows
+        ]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@single_writer
+def release_jobs(jobs: List[dict]) -> int:
+    """
+    Devolve à fila jobs reservados que não chegaram ao pool
+
+    Só jobs ainda reservados pelo mesmo lote; a tentativa não conta para
+    FACE_JOB_MAX_ATTEMPTS, já que a foto nem foi processada.
+    """
+    db = SessionLocal()
+    try:
+        released = db.query(FaceJob).filter(
+            FaceJob.id.in_([job["job_id"] for job in jobs]),
+            FaceJob.worker_token.in_({job["worker_token"] for job in jobs}),
+            FaceJob.status == JOB_PROCESSING
+        ).update({
+            FaceJob.status: JOB_PENDING,
+            FaceJob.worker_token: None,
+            FaceJob.started_at: None,
+            FaceJob.attempts: FaceJob.attempts - 1
+        }, synchronize_session=False)
+        db.commit()
+        return released
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def store_results(jobs: List[dict], results: List[tuple]):
+    """Grava encodings, Photo.face_detected e o status dos jobs de um lote numa transação"""
+    new_faces = _save_results(jobs, results)
+
+    # Depois do commit: shards e índices de cada evento afetado
+    for event_id, (photo_ids, vectors) in new_faces.items():
+        add_event_encodings(event_id, photo_ids, np.asarray(vectors, dtype=np.float32))
+    refresh_event_clusters(new_faces)
+
+@single_writer
+def _save_results(jobs: List[dict], results: List[tuple]) -> Dict[str, tuple]:
+    """Transação de store_results; retorna os encodings novos por evento"""
+    db = SessionLocal()
+    new_faces: Dict[str, tuple] = defaultdict(lambda: ([], []))
+    reference_users = set()
+    try:
+        # Só jobs ainda reservados por este lote: um job que expirou e foi
+        # reservado de novo (ou cuja foto foi apagada) pertence a outro lote
+        job_rows = {
+            job.id: job for job in db.query(FaceJob).filter(
+                FaceJob.id.in_([j["job_id"] for j in jobs]),
+                FaceJob.worker_token.in_({j["worker_token"] for j in jobs}),
+                FaceJob.status == JOB_PROCESSING
+            )
+        }
+        photo_rows = {photo.id: photo for photo in db.query(Photo).filter(Photo.id.in_([j["photo_id"] for j in jobs]))}
+        now = datetime.utcnow()
+
+        for job, (encodings, error) in zip(jobs, results):
+            job_row = job_rows.get(job["job_id"])
+            if job_row is None or job_row.worker_token != job["worker_token"]:
+                continue
+            if error:
+                job_row.error = error
+                if job["attempts"] >= FACE_JOB_MAX_ATTEMPTS:
+                    job_row.status = JOB_FAILED
+                    job_row.finished_at = now
+                else:
+                    job_row.status = JOB_PENDING
+                continue
+
+            for encoding in encodings:
+                db.add(FaceEncoding(
+                    user_id=job["user_id"],
+                    photo_id=job["photo_id"],
+                    encoding_blob=pack_encoding(encoding),
+                    confidence=100
+                ))
+            if job["photo_id"] in photo_rows:
+                photo_rows[job["photo_id"]].face_detected = len(encodings) > 0
+            job_row.status = JOB_DONE
+            job_row.faces_found = len(encodings)
+            job_row.error = None
+            job_row.finished_at = now
+
+            if encodings and job["is_reference"]:
+                reference_users.add(job["user_id"])
+            elif encodings and job["event_id"]:
+                photo_ids, vectors = new_faces[job["event_id"]]
+                photo_ids.extend([job["photo_id"]] * len(encodings))
+                vectors.extend(encodings)
+
+        for event_id, (photo_ids, _) in new_faces.items():
+            add_event_counts(db, event_id, faces=len(photo_ids))
+        store_reference_encodings(db, reference_users)
+        db.commit()
+        invalidate_reference_cache(reference_users)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return new_faces
+
+def _create_pool() -> ProcessPoolExecutor:
+    """Cria o pool de detecção"""
+    # spawn: os filhos não herdam threads nem conexões abertas do processo da API
+    return ProcessPoolExecutor(max_workers=FACE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def _restart_pool(broken_pool: ProcessPoolExecutor):
+    """Substitui um pool quebrado (ex.: processo morto por falta de memória)"""
+    global _pool
+    if _pool is broken_pool:
+        print("❌ Pool de detecção reiniciado")
+        broken_pool.shutdown(wait=False)
+        _pool = _create_pool()
+
+def submit_batch(jobs: List[dict]) -> tuple:
+    """Envia as fotos de um lote para o pool (decodificação, miniaturas e detecção)"""
+    pool = _pool
+    try:
+        futures = [pool.submit(process_photo_file, job["file_path"], job["derivative_key"]) for job in jobs]
+    except BrokenProcessPool:
+        _restart_pool(pool)
+        pool = _pool
+        futures = [pool.submit(process_photo_file, job["file_path"], job["derivative_key"]) for job in jobs]
+    return jobs, futures, pool
+
+def finish_batch(jobs: List[dict], futures: list, pool: ProcessPoolExecutor):
+    """Espera os resultados de um lote e grava tudo numa transação"""
+    results = []
+    broken = False
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool as e:
+            broken = True
+            results.append(([], f"Processo de detecção encerrado: {e}"))
+    if broken:
+        _restart_pool(pool)
+
+    store_results(jobs, results)
+    done = sum(1 for _, error in results if not error)
+    print(f"✅ Lote facial processado: {done}/{len(jobs)} fotos")
+
+def _dispatch_loop():
+    """
+    Consome a fila até stop_face_worker ser chamado
+
+    Pipeline: o lote seguinte é reservado e enviado ao pool antes de gravar
+    os resultados do lote atual, então os processos não ficam parados
+    esperando o banco.
+    """
+    in_flight = None
+    while not _stop.is_set() or in_flight:
+        submitted = None
+        if not _stop.is_set():
+            jobs = []
+            try:
+                jobs = claim_jobs(FACE_JOB_BATCH_SIZE)
+            except Exception as e:
+                print(f"❌ Erro ao reservar jobs faciais: {e}")
+            if jobs:
+                try:
+                    submitted = submit_batch(jobs)
+                except Exception as e:
+                    print(f"❌ Erro ao enviar jobs faciais ao pool: {e}")
+                    if isinstance(e, BrokenProcessPool):
+                        _restart_pool(_pool)
+                    try:
+                        # Sem isso os jobs ficariam em processamento até FACE_JOB_TIMEOUT
+                        release_jobs(jobs)
+                    except Exception as e:
+                        print(f"❌ Erro ao devolver jobs faciais à fila: {e}")
+
+        if in_flight:
+            try:
+                finish_batch(*in_flight)
+            except Exception as e:
+                print(f"❌ Erro no processamento facial: {e}")
+
+        in_flight = submitted
+        if in_flight is None:
+            _wakeup.wait(FACE_JOB_POLL_SECONDS)
+            _wakeup.clear()
+
+def start_face_worker():
+    """Inicia o pool de processos e a thread despachante"""
+    global _dispatcher, _pool
+    if _dispatcher and _dispatcher.is_alive():
+        return
+    _pool = _create_pool()
+    _stop.clear()
+    _dispatcher = threading.Thread(target=_dispatch_loop, name="face-jobs", daemon=True)
+    _dispatcher.start()
+    print(f"✅ Worker facial iniciado ({FACE_WORKERS} processos)")
+
+def stop_face_worker():
+    """Para a thread despachante e encerra o pool"""
+    global _dispatcher, _pool
+    _stop.set()
+    _wakeup.set()
+    if _dispatcher:
+        _dispatcher.join()
+        _dispatcher = None
+    if _pool:
+        _pool.shutdown()
+        _pool = None
+
+async def get_job_status_async(db, job_id: int, user_id: int) -> Optional[dict]:
+    """Status de um job do usuário"""
+    async with db.begin():
+        job = (await db.execute(
+            select(FaceJob).where(FaceJob.id == job_id, FaceJob.user_id == user_id)
+        )).scalars().first()
+        return _job_dict(job) if job else None
+
+def _job_dict(job: FaceJob) -> dict:
+    return {
+        "id": job.id,
+        "photo_id": job.photo_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "faces_found": job.faces_found,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def _job_progress_statement(user_id: int):
+    return (
+        select(FaceJob.status, func.count(FaceJob.id))
+        .where(FaceJob.user_id == user_id)
+        .group_by(FaceJob.status)
+    )
+
+async def get_job_progress_async(db, user_id: int) -> dict:
+    """Quantidade de jobs do usuário por status"""
+    async with db.begin():
+        return _job_progress((await db.execute(_job_progress_statement(user_id))).all())
+
+def _job_progress(rows) -> dict:
+    counts = dict(rows)
+    progress = {status: counts.get(status, 0) for status in JOB_STATUSES}
+    progress["total"] = sum(progress.values())
+    return progress
+
+if __name__ == "__main__":
+    create_tables()
+    start_face_worker()
+    try:
+        while _dispatcher.is_alive():
+            _dispatcher.join(timeout=1)
+    except KeyboardInterrupt:
+        print("\n⏹️ Parando worker facial...")
+    finally:
+        stop_face_worker()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Motor de comparação de encodings faciais para o Midiaz
+
+Carrega todos os encodings de um evento em uma única matriz float32 contígua
+e compara o rosto de referência contra todas as linhas de uma só vez.
+
+Os encodings são gravados em binário (FaceEncoding.encoding_blob): um
+cabeçalho de 8 bytes seguido dos valores float32 ou float16, para que um
+evento inteiro seja carregado com uma leitura e um np.frombuffer.
+
+A média dos encodings de referência de cada usuário fica gravada em User e
+num cache LRU em memória, então a busca não relê nem decodifica as fotos de
+referência a cada requisição.
+"""
+
+import os
+import json
+import time
+import struct
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+import numpy as np
+from sqlalchemy import select, update
+from database import SessionLocal, Photo, FaceEncoding, User
+
+# Tolerância para reconhecimento facial (0.0 = muito restritivo, 1.0 = muito permissivo)
+FACE_RECOGNITION_TOLERANCE = float(os.getenv("FACE_RECOGNITION_TOLERANCE", "0.6"))
+
+# Métricas suportadas: distância euclidiana (padrão do face_recognition) ou cosseno
+SUPPORTED_METRICS = ("euclidean", "cosine")
+
+# Formato binário: magic "FE", versão, tipo dos valores, dimensão (8 bytes)
+ENCODING_HEADER = struct.Struct("<2sBBI")
+ENCODING_MAGIC = b"FE"
+ENCODING_VERSION = 1
+ENCODING_DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2")}
+ENCODING_DTYPE_CODES = {"float32": 0, "float16": 1}
+
+# Precisão usada ao gravar novos encodings (float16 ocupa metade do espaço)
+STORAGE_DTYPE = os.getenv("FACE_ENCODING_DTYPE", "float32")
+
+# Cache do encoding de referência: user_id -> média (0 desliga). O processo
+# que grava os resultados invalida na hora; o TTL limita o atraso quando o
+# worker roda em outro processo.
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_CACHE_SIZE", "10000"))
+
+# user_id -> (expira_em, encoding); ordem = uso mais recente por último (LRU)
+_reference_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_reference_lock = threading.Lock()
+
+def pack_encoding(encoding, dtype: str = STORAGE_DTYPE) -> bytes:
+    """Serializa um encoding no formato binário (cabeçalho + valores)"""
+    code = ENCODING_DTYPE_CODES[dtype]
+    values = np.asarray(encoding, dtype=ENCODING_DTYPES[code]).ravel()
+    return ENCODING_HEADER.pack(ENCODING_MAGIC, ENCODING_VERSION, code, len(values)) + values.tobytes()
+
+def _parse_header(blob) -> tuple:
+    """Valida o cabeçalho e retorna (tipo dos valores, dimensão)"""
+    magic, version, code, dim = ENCODING_HEADER.unpack_from(blob)
+    if magic != ENCODING_MAGIC or version != ENCODING_VERSION or code not in ENCODING_DTYPES:
+        raise ValueError("Encoding binário inválido")
+    return ENCODING_DTYPES[code], dim
+
+def unpack_encoding(blob) -> np.ndarray:
+    """Lê um único encoding binário como float32"""
+    dtype, dim = _parse_header(blob)
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=ENCODING_HEADER.size).astype(np.float32)
+
+def unpack_encodings(blobs: Sequence[bytes]) -> np.ndarray:
+    """
+    Converte vários encodings binários numa matriz (n, dim) com um único frombuffer
+
+    Todos os registros têm o mesmo tamanho, então o buffer concatenado é
+    visto como uma matriz de registros e o cabeçalho é descartado por fatia
+    (sem cópia para float32).
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+
+    dtype, dim = _parse_header(blobs[0])
+    record_size = ENCODING_HEADER.size + dim * dtype.itemsize
+    buffer = b"".join(blobs)
+    if len(buffer) != record_size * len(blobs):
+        raise ValueError("Encodings com dimensões diferentes no mesmo lote")
+
+    records = np.frombuffer(buffer, dtype=np.uint8).reshape(len(blobs), record_size)
+    if not (records[:, :ENCODING_HEADER.size] == records[0, :ENCODING_HEADER.size]).all():
+        raise ValueError("Encodings com formatos diferentes no mesmo lote")
+
+    header_items = ENCODING_HEADER.size // dtype.itemsize
+    values = np.frombuffer(buffer, dtype=dtype).reshape(len(blobs), -1)[:, header_items:]
+    return values if dtype == np.float32 else values.astype(np.float32)
+
+def decode_rows(rows) -> np.ndarray:
+    """Decodifica linhas (blob, json) vindas do banco; JSON só para linhas ainda não migradas"""
+    blobs = [row[0] for row in rows]
+    if all(blob is not None for blob in blobs):
+        return unpack_encodings(blobs)
+    return np.array([
+        unpack_encoding(blob) if blob is not None else json.loads(data)
+        for blob, data in rows
+    ], dtype=np.float32)
+
+class EncodingMatrix(NamedTuple):
+    """Encodings de um evento: uma linha por rosto detectado"""
+    photo_ids: np.ndarray  # int64, shape (n,)
+    matrix: np.ndarray     # float32, shape (n, dim), linhas com valores contíguos
+    sq_norms: np.ndarray   # float32, shape (n,), normas ao quadrado pré-calculadas
+
+def build_encoding_matrix(photo_ids, matrix) -> EncodingMatrix:
+    """Monta a estrutura de busca a partir de ids e vetores já carregados"""
+    photo_ids = np.asarray(photo_ids, dtype=np.int64)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(photo_ids), -1)
+    if matrix.strides[1] != matrix.itemsize:
+        # Linhas espaçadas (ex.: fatia sem cabeçalho) são aceitas pelo BLAS; colunas não
+        matrix = np.ascontiguousarray(matrix)
+    sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+    return EncodingMatrix(photo_ids, matrix, sq_norms)
+
+def load_event_encodings(event_id: str) -> EncodingMatrix:
+    """Carrega todos os encodings faciais de um evento numa matriz float32"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(FaceEncoding.photo_id, FaceEncoding.encoding_blob, FaceEncoding.encoding_data)
+            .join(Photo, Photo.id == FaceEncoding.photo_id)
+            .filter(Photo.event_id == event_id)
+            .all()
+        )
+    finally:
+        db.close()
+
+    if not rows:
+        return build_encoding_matrix(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+
+    photo_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    matrix = decode_rows([row[1:] for row in rows])
+    return build_encoding_matrix(photo_ids, matrix)
+
+def _reference_rows_statement(user_id: int):
+    return (
+        select(FaceEncoding.encoding_blob, FaceEncoding.encoding_data)
+        .join(Photo, Photo.id == FaceEncoding.photo_id)
+        .where(FaceEncoding.user_id == user_id, Photo.is_reference_photo == True)
+    )
+
+def _stored_reference_statement(user_id: int):
+    return select(User.reference_encoding_blob, User.reference_face_count).where(User.id == user_id)
+
+def _mean_encoding(rows) -> Optional[np.ndarray]:
+    return decode_rows(rows).mean(axis=0) if rows else None
+
+def _stored_reference(row) -> tuple:
+    """(calculada, encoding) a partir da linha de User; calculada=False em bancos antigos"""
+    if row is None:
+        return True, None
+    blob, face_count = row
+    if blob is not None:
+        return True, unpack_encoding(blob)
+    return face_count is not None, None
+
+def _cached_reference(user_id: int) -> Optional[np.ndarray]:
+    """Encoding de referência do cache, se ainda estiver válido"""
+    with _reference_lock:
+        entry = _reference_cache.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _reference_cache[user_id]
+            return None
+        _reference_cache.move_to_end(user_id)
+        return entry[1]
+
+def _cache_reference(user_id: int, encoding: np.ndarray):
+    encoding.setflags(write=False)  # Compartilhado entre requisições
+    with _reference_lock:
+        _reference_cache[user_id] = (time.time() + REFERENCE_CACHE_TTL, encoding)
+        _reference_cache.move_to_end(user_id)
+        while len(_reference_cache) > REFERENCE_CACHE_SIZE:
+            _reference_cache.popitem(last=False)
+
+def invalidate_reference_cache(user_ids: Optional[Iterable[int]] = None):
+    """Remove do cache o encoding de referência dos usuários (ou de todos)"""
+    with _reference_lock:
+        if user_ids is None:
+            _reference_cache.clear()
+            return
+        for user_id in user_ids:
+            _reference_cache.pop(user_id, None)
+
+def store_reference_encodings(db, user_ids: Iterable[int]):
+    """
+    Recalcula e grava em User a média dos encodings de referência
+
+    Roda na transação de quem alterou as fotos de referência (resultado da
+    detecção ou remoção); depois do commit chame invalidate_reference_cache.
+    """
+    db.flush()
+    for user_id in set(user_ids):
+        rows = db.execute(_reference_rows_statement(user_id)).all()
+        encoding = _mean_encoding(rows)
+        db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(
+                reference_encoding_blob=pack_encoding(encoding, "float32") if encoding is not None else None,
+                reference_face_count=len(rows)
+            )
+        )
+
+async def load_reference_encoding_async(db, user_id: int) -> Optional[np.ndarray]:
+    """Retorna o encoding médio das fotos de referência do usuário (cache, User e, em bancos antigos, os encodings)"""
+    if REFERENCE_CACHE_TTL > 0:
+        encoding = _cached_reference(user_id)
+        if encoding is not None:
+            return encoding
+
+    async with db.begin():
+        computed, encoding = _stored_reference((await db.execute(_stored_reference_statement(user_id))).first())
+        if not computed:
+            encoding = _mean_encoding((await db.execute(_reference_rows_statement(user_id))).all())
+
+    if encoding is not None and REFERENCE_CACHE_TTL > 0:
+        _cache_reference(user_id, encoding)
+    return encoding
+
+def compute_distances(encodings: EncodingMatrix, query: np.ndarray, metric: str = "euclidean") -> np.ndarray:
+    """Calcula a distância do encoding de consulta para todas as linhas em lote"""
+    if metric not in SUPPORTED_METRICS:
+        raise ValueError(f"Métrica não suportada: {metric}")
+
+    dots = encodings.matrix @ query
+    query_sq_norm = float(query @ query)
+
+    if metric == "cosine":
+        norms = np.sqrt(encodings.sq_norms * query_sq_norm)
+        return 1.0 - dots / np.maximum(norms, 1e-12)
+
+    # ||a - b||² = ||a||² - 2a·b + ||b||², sem materializar a matriz de diferenças
+    sq_distances = encodings.sq_norms - 2.0 * dots + query_sq_norm
+    return np.sqrt(np.maximum(sq_distances, 0.0))
+
+def match_encodings(
+    encodings: EncodingMatrix,
+    query,
+    top_k: int = 50,
+    tolerance: Optional[float] = None,
+    metric: str = "euclidean"
+) -> List[dict]:
+    """
+    Compara um encoding de consulta contra todos os rostos de um evento
+
+    Args:
+        encodings: Matriz de encodings do evento
+        query: Encoding de consulta (rosto de referência do usuário)
+        top_k: Número máximo de fotos retornadas
+        tolerance: Distância máxima aceita (padrão: FACE_RECOGNITION_TOLERANCE)
+        metric: "euclidean" ou "cosine"
+
+    Returns:
+        List[dict]: fotos ordenadas da mais parecida para a menos parecida,
+        com a menor distância encontrada entre os rostos de cada foto
+    """
+    if len(encodings.photo_ids) == 0 or top_k <= 0:
+        return []
+
+    query = np.asarray(query, dtype=np.float32).ravel()
+    if query.shape[0] != encodings.matrix.shape[1]:
+        raise ValueError("Dimensão do encoding de consulta não confere com o evento")
+
+    if tolerance is None:
+        tolerance = FACE_RECOGNITION_TOLERANCE
+
+    distances = compute_distances(encodings, query, metric)
+    candidates = np.flatnonzero(distances <= tolerance)
+    if len(candidates) == 0:
+        return []
+
+    # Ordenar candidatos e manter apenas o melhor rosto de cada foto
+    candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+    _, first_seen = np.unique(encodings.photo_ids[candidates], return_index=True)
+    best = candidates[np.sort(first_seen)][:top_k]
+
+    return [
+        {"photo_id": int(photo_id), "distance": round(float(distance), 4)}
+        for photo_id, distance in zip(encodings.photo_ids[best], distances[best])
+    ]
+
+def search_event(event_id: str, query, top_k: int = 50, tolerance: Optional[float] = None) -> List[dict]:
+    """Busca as fotos de um evento onde o rosto de consulta aparece"""
+    encodings = load_event_encodings(event_id)
+    return match_encodings(encodings, query, top_k=top_k, tolerance=tolerance)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Envio de arquivos armazenados (originais e derivados) pela API
+
+- ETag forte a partir do hash do conteúdo e 304 para If-None-Match
+- Requisições Range (um intervalo) com 206, para downloads retomáveis
+- Corpo enviado sem passar pelo Python quando possível: extensão ASGI
+  http.response.zerocopy (sendfile) ou X-Accel-Redirect/X-Sendfile de um
+  proxy reverso configurado em SENDFILE_HEADER
+"""
+
+import os
+from typing import Optional, Tuple
+import anyio
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+# Cabeçalho de sendfile do proxy (ex.: "X-Accel-Redirect" no nginx, "X-Sendfile" no Apache)
+SENDFILE_HEADER = os.getenv("SENDFILE_HEADER", "")
+
+# Prefixo interno do proxy que aponta para o diretório de trabalho da API
+SENDFILE_PREFIX = os.getenv("SENDFILE_PREFIX", "/protected/")
+
+# Arquivos endereçados por conteúdo nunca mudam no mesmo caminho
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+CHUNK_SIZE = 64 * 1024
+
+def content_etag(content_hash: Optional[str], file_path: str, suffix: str = "") -> str:
+    """ETag forte do hash do conteúdo (fracas só para arquivos antigos sem hash)"""
+    if content_hash:
+        return f'"{content_hash}{suffix}"'
+    stat = os.stat(file_path)
+    return f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}{suffix}"'
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Compara If-None-Match com a ETag (comparação fraca, como pede o RFC 9110)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (tag[2:] if tag.startswith("W/") else tag) == opaque
+        for tag in (part.strip() for part in header.split(","))
+    )
+
+def if_range_matches(header: str, etag: str) -> bool:
+    """Compara If-Range com a ETag (comparação forte: ETags fracas ou datas nunca casam)"""
+    header = header.strip()
+    return header == etag and not etag.startswith("W/")
+
+def parse_range(header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta um cabeçalho Range com um único intervalo
+
+    Returns:
+        Optional[Tuple[int, int]]: (início, fim inclusivo) ou None para
+        enviar o arquivo inteiro (cabeçalho ausente, com vários intervalos
+        ou arquivo vazio)
+
+    Raises:
+        ValueError: intervalo fora do arquivo (resposta 416)
+    """
+    if not header or not header.startswith("bytes=") or "," in header or file_size == 0:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start_text:
+            # Sufixo: os últimos N bytes
+            length = int(end_text)
+            if length < 0:
+                raise ValueError("Sufixo inválido")
+            start, end = max(file_size - length, 0), file_size - 1
+        else:
+            length = None
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+    except ValueError:
+        return None
+    if length == 0 or start >= file_size or end < start:
+        raise ValueError("Intervalo fora do arquivo")
+    return start, min(end, file_size - 1)
+
+class FileRangeResponse(FileResponse):
+    """FileResponse que envia só um trecho do arquivo (sendfile quando o servidor suporta)"""
+
+    def __init__(self, path: str, start: int, end: int, file_size: int, **kwargs):
+        super().__init__(path, status_code=206, **kwargs)
+        self.start = start
+        self.length = end - start + 1
+        self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+        self.headers["content-length"] = str(self.length)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": file.wrapped.fileno(),
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False
+                })
+                return
+
+            await file.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class ZeroCopyFileResponse(FileResponse):
+    """FileResponse que usa a extensão ASGI de sendfile quando o servidor a oferece"""
+
+    async def __call__(self, scope, receive, send):
+        if "http.response.zerocopy" not in scope.get("extensions", {}) or self.send_header_only:
+            await super().__call__(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await send({
+                "type": "http.response.zerocopy",
+                "file": file.wrapped.fileno(),
+                "more_body": False
+            })
+
+def not_modified(request: Request, etag: str, cache_control: str = IMMUTABLE_CACHE_CONTROL) -> Optional[Response]:
+    """Resposta 304 se If-None-Match já tem a ETag (dá para checar antes de gerar ou abrir o arquivo)"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"})
+    return None
+
+def serve_file(
+    request: Request,
+    file_path: str,
+    etag: str,
+    media_type: Optional[str] = None,
+    download_name: Optional[str] = None,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL
+) -> Response:
+    """
+    Monta a resposta para um arquivo armazenado
+
+    Args:
+        request: Requisição (If-None-Match, Range, If-Range)
+        file_path: Caminho do arquivo no disco
+        etag: ETag do conteúdo (ver content_etag)
+        media_type: Tipo MIME do arquivo
+        download_name: Nome sugerido para download (Content-Disposition)
+        cache_control: Política de cache do navegador
+
+    Raises:
+        FileNotFoundError: arquivo não existe mais no disco
+    """
+    response = not_modified(request, etag, cache_control)
+    if response is not None:
+        return response
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+
+    stat_result = os.stat(file_path)
+    file_size = stat_result.st_size
+
+    if SENDFILE_HEADER:
+        # O proxy lê o arquivo (e trata Range) sem ocupar o worker
+        internal_path = SENDFILE_PREFIX + os.path.relpath(file_path).replace(os.sep, "/")
+        headers[SENDFILE_HEADER] = internal_path if SENDFILE_HEADER.lower() == "x-accel-redirect" else os.path.abspath(file_path)
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    # If-Range: só responde o trecho se o arquivo ainda é o mesmo da primeira parte
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range_matches(if_range, etag):
+        try:
+            byte_range = parse_range(request.headers.get("range"), file_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file_size}"})
+        if byte_range:
+            return FileRangeResponse(
+                file_path, *byte_range, file_size,
+                headers=headers, media_type=media_type, filename=download_name, method=request.method
+            )
+
+    return ZeroCopyFileResponse(
+        file_path, headers=headers, media_type=media_type, filename=download_name,
+        stat_result=stat_result, method=request.method
+    )
@@ -5,155 +5,513 @@ Sistema de upload e gerenciamento de arquivos para o Midiaz
 
 import os
 import uuid
-import shutil
+import base64
+import hashlib
+import zipfile
+import mimetypes
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import case, func, select, tuple_
 from fastapi import UploadFile
-from database import SessionLocal, Photo, User
+from fastapi.concurrency import run_in_threadpool
+from database import SessionLocal, FaceEncoding, FaceJob, Photo, User, session_scope
+from db_writer import single_writer
+from events import add_event_counts, remove_event_photo
+from face_matcher import store_reference_encodings, invalidate_reference_cache
+from face_index import remove_event_encodings
 
 # Configurações de diretórios
 UPLOAD_DIR = "midiaz_uploads"
 REFERENCE_FACES_DIR = "midiaz_reference_faces"
 
+# Limite de fotos por lote (multipart ou ZIP)
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "5000"))
+
+# Tamanho dos blocos copiados para o disco
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_directories_ready = False
+
 def ensure_directories():
-    """Cria os diretórios necessários se não existirem"""
+    """Cria os diretórios necessários se não existirem (uma vez por processo)"""
+    global _directories_ready
+    if _directories_ready:
+        return
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     os.makedirs(REFERENCE_FACES_DIR, exist_ok=True)
+    _directories_ready = True
     print(f"✅ Diretórios criados: {UPLOAD_DIR}, {REFERENCE_FACES_DIR}")
 
-def save_uploaded_file(file: UploadFile, user_id: int, is_reference: bool = False) -> Tuple[bool, str, Optional[Photo]]:
+def _temp_path(is_reference: bool) -> str:
+    """Arquivo temporário no diretório de destino (o nome final depende do hash)"""
+    ensure_directories()
+    dest_dir = REFERENCE_FACES_DIR if is_reference else UPLOAD_DIR
+    return os.path.join(dest_dir, f".upload-{uuid.uuid4().hex}.tmp")
+
+# Grafias da mesma extensão: o mesmo conteúdo enviado como .jpeg e .JPG vira um arquivo só
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".jfif": ".jpg", ".tif": ".tiff"}
+
+def file_extension(filename: Optional[str]) -> str:
+    """Extensão normalizada usada nos nomes dos arquivos armazenados"""
+    extension = (os.path.splitext(filename)[1] if filename else '').lower() or '.jpg'
+    return EXTENSION_ALIASES.get(extension, extension)
+
+def content_path(dest_dir: str, content_hash: str, file_extension: str) -> str:
+    """Caminho endereçado pelo conteúdo: <dir>/ab/cd/<sha256><extensão>"""
+    return os.path.join(dest_dir, content_hash[:2], content_hash[2:4], f"{content_hash}{file_extension}")
+
+def store_content(temp_path: str, content_hash: str, filename: Optional[str], is_reference: bool) -> Tuple[str, bool]:
     """
-    Salva um arquivo enviado e registra no banco de dados
+    Move o arquivo temporário para o endereço do seu conteúdo
     
-    Args:
-        file: Arquivo enviado via FastAPI
-        user_id: ID do usuário que fez o upload
-        is_reference: Se é uma foto de referência para reconhecimento facial
+    Chamado só na fila de escrita, junto com o registro da foto: delete_photo
+    apaga o arquivo quando a última foto que o usa sai do banco, e decidir o
+    reaproveitamento fora da fila poderia apontar uma foto nova para um
+    arquivo recém-apagado.
     
     Returns:
-        Tuple[bool, str, Optional[Photo]]: (sucesso, mensagem, objeto_photo)
+        Tuple[str, bool]: (caminho_final, duplicado) — se o conteúdo já existia,
+        o temporário é descartado e o arquivo existente é reaproveitado
     """
+    dest_dir = REFERENCE_FACES_DIR if is_reference else UPLOAD_DIR
+    file_path = content_path(dest_dir, content_hash, file_extension(filename))
+    
+    if os.path.exists(file_path):
+        os.remove(temp_path)
+        return file_path, True
+    
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    os.replace(temp_path, file_path)
+    return file_path, False
+
+def copy_stream(source, buffer) -> Tuple[int, str]:
+    """Copia um stream para o disco em blocos, calculando tamanho e SHA-256 no caminho"""
+    hasher = hashlib.sha256()
+    file_size = 0
+    while True:
+        chunk = source.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        buffer.write(chunk)
+        file_size += len(chunk)
+    return file_size, hasher.hexdigest()
+
+@single_writer
+def register_upload(
+    user_id: int,
+    temp_path: str,
+    filename: Optional[str],
+    file_size: int,
+    mime_type: str,
+    content_hash: str,
+    is_reference: bool = False,
+    event_id: Optional[str] = None
+) -> Tuple[bool, str, Optional[Photo]]:
+    """Move o arquivo temporário para o endereço do conteúdo e registra a foto, na mesma chamada da fila de escrita"""
     try:
-        # Verificar se o arquivo é uma imagem
-        if not file.content_type.startswith('image/'):
-            return False, "Arquivo deve ser uma imagem", None
-        
-        # Gerar nome único para o arquivo
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else '.jpg'
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        
-        # Determinar diretório de destino
-        if is_reference:
-            dest_dir = REFERENCE_FACES_DIR
-        else:
-            dest_dir = UPLOAD_DIR
-        
-        # Caminho completo do arquivo
-        file_path = os.path.join(dest_dir, unique_filename)
-        
-        # Salvar arquivo no sistema de arquivos
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Obter tamanho do arquivo
-        file_size = os.path.getsize(file_path)
-        
-        # Salvar no banco de dados
-        db = SessionLocal()
+        file_path, is_duplicate = store_content(temp_path, content_hash, filename, is_reference)
+    except OSError as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False, f"Erro ao salvar arquivo: {str(e)}", None
+    return register_photo(user_id, file_path, file_size, mime_type, content_hash, is_reference, event_id, is_duplicate)
+
+@single_writer
+def register_photo(
+    user_id: int,
+    file_path: str,
+    file_size: int,
+    mime_type: str,
+    content_hash: str,
+    is_reference: bool = False,
+    event_id: Optional[str] = None,
+    is_duplicate: bool = False
+) -> Tuple[bool, str, Optional[Photo]]:
+    """Registra no banco um arquivo já gravado (remove o arquivo novo se o banco falhar)"""
+    with session_scope() as db:
         try:
             photo = Photo(
                 user_id=user_id,
-                filename=unique_filename,
+                event_id=event_id,
+                filename=os.path.basename(file_path),
                 file_path=file_path,
                 file_size=file_size,
-                mime_type=file.content_type,
+                mime_type=mime_type,
+                content_hash=content_hash,
                 is_reference_photo=is_reference,
                 face_detected=False  # Será atualizado pelo reconhecimento facial
             )
             
             db.add(photo)
+            if not is_reference:
+                add_event_counts(db, event_id, photos=1)
             db.commit()
             db.refresh(photo)
             
-            print(f"✅ Foto salva: {unique_filename} ({file_size} bytes)")
+            if is_duplicate:
+                print(f"♻️ Foto duplicada, arquivo reaproveitado: {photo.filename}")
+                return True, "Foto salva com sucesso (arquivo já existente reaproveitado)", photo
+            
+            print(f"✅ Foto salva: {photo.filename} ({file_size} bytes)")
             return True, "Foto salva com sucesso", photo
             
         except Exception as e:
             db.rollback()
-            # Remover arquivo se falhou no banco
-            if os.path.exists(file_path):
+            # Remover arquivo se falhou no banco (arquivos reaproveitados pertencem a outras fotos)
+            if not is_duplicate and os.path.exists(file_path):
                 os.remove(file_path)
             return False, f"Erro ao salvar no banco: {str(e)}", None
-            
-        finally:
-            db.close()
+
+def save_uploaded_file(file: UploadFile, user_id: int, is_reference: bool = False, event_id: Optional[str] = None) -> Tuple[bool, str, Optional[Photo]]:
+    """
+    Salva um arquivo enviado e registra no banco de dados
+    
+    Args:
+        file: Arquivo enviado via FastAPI
+        user_id: ID do usuário que fez o upload
+        is_reference: Se é uma foto de referência para reconhecimento facial
+        event_id: Evento ao qual a foto pertence (opcional)
+    
+    Returns:
+        Tuple[bool, str, Optional[Photo]]: (sucesso, mensagem, objeto_photo)
+    """
+    try:
+        # Verificar se o arquivo é uma imagem
+        if not file.content_type.startswith('image/'):
+            return False, "Arquivo deve ser uma imagem", None
+        
+        # Salvar arquivo no sistema de arquivos (nome final = hash do conteúdo)
+        temp_path = _temp_path(is_reference)
+        with open(temp_path, "wb") as buffer:
+            file_size, content_hash = copy_stream(file.file, buffer)
+        return register_upload(user_id, temp_path, file.filename, file_size, file.content_type,
+                               content_hash, is_reference, event_id)
             
     except Exception as e:
         return False, f"Erro ao processar arquivo: {str(e)}", None
 
-def get_user_photos(user_id: int) -> list:
-    """Retorna todas as fotos de um usuário"""
-    db = SessionLocal()
-    try:
-        photos = db.query(Photo).filter(Photo.user_id == user_id).all()
-        return photos
-    finally:
-        db.close()
-
-def get_photo_by_id(photo_id: int) -> Optional[Photo]:
-    """Retorna uma foto específica por ID"""
-    db = SessionLocal()
-    try:
-        photo = db.query(Photo).filter(Photo.id == photo_id).first()
-        return photo
-    finally:
-        db.close()
+def _write_chunk(buffer, hasher, chunk: bytes):
+    """Grava um bloco e atualiza o hash (roda no threadpool; hashlib libera o GIL)"""
+    hasher.update(chunk)
+    buffer.write(chunk)
 
-def delete_photo(photo_id: int, user_id: int) -> Tuple[bool, str]:
-    """Deleta uma foto (apenas se pertencer ao usuário)"""
-    db = SessionLocal()
+async def save_uploaded_file_async(file: UploadFile, user_id: int, is_reference: bool = False, event_id: Optional[str] = None) -> Tuple[bool, str, Optional[Photo]]:
+    """
+    Versão assíncrona de save_uploaded_file para os handlers da API
+    
+    Lê o UploadFile em blocos, grava e calcula o hash fora do event loop e
+    registra a foto no banco pelo threadpool, então uploads simultâneos não
+    bloqueiam as outras requisições.
+    """
     try:
-        photo = db.query(Photo).filter(
-            Photo.id == photo_id,
-            Photo.user_id == user_id
-        ).first()
+        if not file.content_type.startswith('image/'):
+            return False, "Arquivo deve ser uma imagem", None
         
-        if not photo:
-            return False, "Foto não encontrada ou não pertence ao usuário"
+        temp_path = _temp_path(is_reference)
+        hasher = hashlib.sha256()
+        file_size = 0
         
-        # Remover arquivo do sistema
-        if os.path.exists(photo.file_path):
-            os.remove(photo.file_path)
+        buffer = await run_in_threadpool(open, temp_path, "wb")
+        try:
+            while True:
+                chunk = await file.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+                file_size += len(chunk)
+        except Exception:
+            await run_in_threadpool(buffer.close)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        await run_in_threadpool(buffer.close)
         
-        # Remover do banco
-        db.delete(photo)
-        db.commit()
+        return await run_in_threadpool(
+            register_upload, user_id, temp_path, file.filename, file_size, file.content_type,
+            hasher.hexdigest(), is_reference, event_id
+        )
         
-        return True, "Foto deletada com sucesso"
+    except Exception as e:
+        return False, f"Erro ao processar arquivo: {str(e)}", None
+
+def _is_zip(file: UploadFile) -> bool:
+    """Verifica se o arquivo enviado é um ZIP"""
+    if file.content_type in ("application/zip", "application/x-zip-compressed"):
+        return True
+    return bool(file.filename) and file.filename.lower().endswith(".zip")
+
+def iter_batch_images(files: List[UploadFile]) -> Iterator[Tuple[str, object, str]]:
+    """Gera (nome, stream, content_type) de cada arquivo do lote, expandindo ZIPs"""
+    for file in files:
+        if not _is_zip(file):
+            yield file.filename or "", file.file, file.content_type or ""
+            continue
         
+        with zipfile.ZipFile(file.file) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX"):
+                    continue
+                content_type = mimetypes.guess_type(name)[0] or ""
+                with archive.open(info) as member:
+                    yield name, member, content_type
+
+def save_uploaded_files(files: List[UploadFile], user_id: int, event_id: Optional[str] = None) -> Tuple[bool, str, List[Photo], List[str]]:
+    """
+    Salva um lote de fotos (vários arquivos e/ou ZIPs) com uma única transação
+    
+    Args:
+        files: Arquivos enviados via FastAPI (imagens ou ZIPs de imagens)
+        user_id: ID do usuário que fez o upload
+        event_id: Evento ao qual as fotos pertencem (opcional)
+    
+    Returns:
+        Tuple[bool, str, List[Photo], List[str]]: (sucesso, mensagem, fotos, arquivos_ignorados)
+    """
+    saved = []
+    skipped = []
+    
+    def remove_saved_files():
+        # Temporários ainda não movidos (o endereço final é decidido em _insert_photos)
+        for _, temp_path, _, _, _ in saved:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    try:
+        # Gravar cada arquivo em blocos, sem carregar o lote na memória
+        for name, stream, content_type in iter_batch_images(files):
+            if not content_type.startswith('image/'):
+                skipped.append(name)
+                continue
+            if len(saved) >= MAX_BATCH_FILES:
+                remove_saved_files()
+                return False, f"Lote excede o limite de {MAX_BATCH_FILES} fotos", [], skipped
+            
+            temp_path = _temp_path(False)
+            with open(temp_path, "wb") as buffer:
+                file_size, content_hash = copy_stream(stream, buffer)
+            saved.append((content_hash, temp_path, name, file_size, content_type))
+            
+    except (zipfile.BadZipFile, OSError) as e:
+        remove_saved_files()
+        return False, f"Erro ao processar lote: {str(e)}", [], skipped
+    
+    if not saved:
+        return False, "Nenhuma imagem encontrada no lote", [], skipped
+    
+    try:
+        photos, duplicates = _insert_photos(user_id, event_id, saved)
     except Exception as e:
+        remove_saved_files()
+        return False, f"Erro ao salvar no banco: {str(e)}", [], skipped
+    
+    print(f"✅ Lote salvo: {len(photos)} fotos ({duplicates} duplicadas)")
+    return True, f"{len(photos)} fotos salvas com sucesso", photos, skipped
+
+@single_writer
+def _insert_photos(user_id: int, event_id: Optional[str], saved: list) -> Tuple[List[Photo], int]:
+    """Move os temporários para o endereço do conteúdo e registra o lote numa única transação; retorna (fotos, duplicadas)"""
+    stored = []
+    created_files = []
+    # Sessão própria que não expira no commit: os objetos do lote são lidos
+    # depois sem uma consulta por foto
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        for content_hash, temp_path, name, file_size, content_type in saved:
+            file_path, is_duplicate = store_content(temp_path, content_hash, name, False)
+            if not is_duplicate:
+                created_files.append(file_path)
+            stored.append((content_hash, file_path, file_size, content_type))
+        photos = [
+            Photo(
+                user_id=user_id,
+                event_id=event_id,
+                filename=os.path.basename(file_path),
+                file_path=file_path,
+                file_size=file_size,
+                mime_type=content_type,
+                content_hash=content_hash,
+                is_reference_photo=False,
+                face_detected=False
+            )
+            for content_hash, file_path, file_size, content_type in stored
+        ]
+        db.add_all(photos)
+        add_event_counts(db, event_id, photos=len(photos))
+        db.commit()
+        return photos, len(photos) - len(created_files)
+    except Exception:
         db.rollback()
-        return False, f"Erro ao deletar foto: {str(e)}"
+        # Só os arquivos criados por este lote; duplicados pertencem a outras fotos
+        for file_path in created_files:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        raise
     finally:
         db.close()
 
-def get_upload_stats() -> dict:
-    """Retorna estatísticas dos uploads"""
-    db = SessionLocal()
+# Tamanho padrão e máximo de uma página da galeria
+PHOTOS_PAGE_SIZE = 50
+PHOTOS_MAX_PAGE_SIZE = 500
+
+def encode_photos_cursor(created_at: datetime, photo_id: int) -> str:
+    """Cursor opaco com a posição da última foto da página"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{photo_id}".encode()).decode()
+
+def decode_photos_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Lê um cursor gerado por encode_photos_cursor (ValueError se inválido)"""
     try:
-        total_photos = db.query(Photo).count()
-        total_size = db.query(Photo.file_size).all()
-        total_size_bytes = sum(size[0] for size in total_size if size[0])
-        
-        reference_photos = db.query(Photo).filter(Photo.is_reference_photo == True).count()
-        
-        return {
-            "total_photos": total_photos,
-            "total_size_mb": round(total_size_bytes / (1024 * 1024), 2),
-            "reference_photos": reference_photos
-        }
-    finally:
-        db.close()
+        created_at, photo_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(photo_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+def get_user_photos(
+    user_id: int,
+    limit: int = PHOTOS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    is_reference: Optional[bool] = None,
+    face_detected: Optional[bool] = None
+) -> Tuple[list, Optional[str]]:
+    """
+    Retorna uma página das fotos de um usuário, da mais recente para a mais antiga
+    
+    Paginação por chave (created_at, id) sobre o índice ix_photos_user_created:
+    cada página custa o mesmo, não importa quantas fotos vieram antes. Só as
+    colunas da listagem são lidas (sem montar objetos Photo).
+    
+    Args:
+        user_id: ID do usuário
+        limit: Fotos por página (até PHOTOS_MAX_PAGE_SIZE)
+        cursor: next_cursor da página anterior
+        is_reference: Filtrar por fotos de referência
+        face_detected: Filtrar por fotos com rosto detectado
+    
+    Returns:
+        Tuple[list, Optional[str]]: (linhas, cursor_da_próxima_página)
+    """
+    limit = max(1, min(limit, PHOTOS_MAX_PAGE_SIZE))
+    statement = _user_photos_statement(user_id, limit, cursor, is_reference, face_detected)
+    with session_scope() as db:
+        rows = db.execute(statement).all()
+    return _photos_page(rows, limit)
+
+async def get_user_photos_async(
+    db,
+    user_id: int,
+    limit: int = PHOTOS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    is_reference: Optional[bool] = None,
+    face_detected: Optional[bool] = None
+) -> Tuple[list, Optional[str]]:
+    """Versão assíncrona de get_user_photos (AsyncSession da requisição)"""
+    limit = max(1, min(limit, PHOTOS_MAX_PAGE_SIZE))
+    statement = _user_photos_statement(user_id, limit, cursor, is_reference, face_detected)
+    async with db.begin():
+        rows = (await db.execute(statement)).all()
+    return _photos_page(rows, limit)
+
+def _user_photos_statement(user_id: int, limit: int, cursor: Optional[str], is_reference: Optional[bool], face_detected: Optional[bool]):
+    """SELECT de uma página da galeria (uma linha a mais para saber se há próxima)"""
+    statement = select(
+        Photo.id,
+        Photo.filename,
+        Photo.file_size,
+        Photo.event_id,
+        Photo.is_reference_photo,
+        Photo.face_detected,
+        Photo.created_at
+    ).where(Photo.user_id == user_id)
+    
+    if is_reference is not None:
+        statement = statement.where(Photo.is_reference_photo == is_reference)
+    if face_detected is not None:
+        statement = statement.where(Photo.face_detected == face_detected)
+    if cursor:
+        statement = statement.where(tuple_(Photo.created_at, Photo.id) < tuple_(*decode_photos_cursor(cursor)))
+    
+    return statement.order_by(Photo.created_at.desc(), Photo.id.desc()).limit(limit + 1)
+
+def _photos_page(rows: list, limit: int) -> Tuple[list, Optional[str]]:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_photos_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+async def get_photo_by_id_async(db, photo_id: int) -> Optional[Photo]:
+    """Retorna uma foto específica por ID"""
+    async with db.begin():
+        return await db.get(Photo, photo_id)
+
+@single_writer
+def _delete_photo(photo_id: int, user_id: int) -> Tuple[bool, str, Optional[str]]:
+    """Remove a foto, seus rostos e jobs numa transação; retorna o evento cujo índice precisa ser refeito"""
+    with session_scope() as db:
+        try:
+            photo = db.query(Photo).filter(
+                Photo.id == photo_id,
+                Photo.user_id == user_id
+            ).first()
+            
+            if not photo:
+                return False, "Foto não encontrada ou não pertence ao usuário", None
+            
+            # Remover arquivo do sistema, se nenhuma outra foto usa o mesmo conteúdo
+            shared = photo.content_hash and db.query(Photo.id).filter(
+                Photo.content_hash == photo.content_hash,
+                Photo.file_path == photo.file_path,
+                Photo.id != photo.id
+            ).first()
+            if not shared and os.path.exists(photo.file_path):
+                os.remove(photo.file_path)
+            
+            # Remover do banco (e dos contadores do evento / média de referência)
+            is_reference = photo.is_reference_photo
+            indexed_event = None
+            if photo.event_id and not is_reference:
+                has_faces = db.query(FaceEncoding.id).filter(FaceEncoding.photo_id == photo.id).first()
+                indexed_event = photo.event_id if has_faces else None
+            remove_event_photo(db, photo)
+            db.query(FaceEncoding).filter(FaceEncoding.photo_id == photo.id).delete(synchronize_session=False)
+            db.query(FaceJob).filter(FaceJob.photo_id == photo.id).delete(synchronize_session=False)
+            db.delete(photo)
+            if is_reference:
+                store_reference_encodings(db, [user_id])
+            db.commit()
+            if is_reference:
+                invalidate_reference_cache([user_id])
+            
+            return True, "Foto deletada com sucesso", indexed_event
+            
+        except Exception as e:
+            db.rollback()
+            return False, f"Erro ao deletar foto: {str(e)}", None
+
+def delete_photo(photo_id: int, user_id: int) -> Tuple[bool, str]:
+    """Deleta uma foto (apenas se pertencer ao usuário)"""
+    success, message, event_id = _delete_photo(photo_id, user_id)
+    if event_id:
+        # Shard e índice do evento são só de acréscimo: regravar sem os rostos apagados
+        remove_event_encodings(event_id)
+    return success, message
+
+UPLOAD_STATS_STATEMENT = select(
+    func.count(Photo.id),
+    func.coalesce(func.sum(Photo.file_size), 0),
+    func.coalesce(func.sum(case((Photo.is_reference_photo == True, 1), else_=0)), 0)
+)
+
+async def get_upload_stats_async(db) -> dict:
+    """Retorna estatísticas dos uploads (uma única agregação no banco)"""
+    async with db.begin():
+        return _upload_stats((await db.execute(UPLOAD_STATS_STATEMENT)).one())
 
-# Inicializar diretórios quando o módulo for importado
-ensure_directories() 
\ No newline at end of file
+def _upload_stats(row) -> dict:
+    total_photos, total_size_bytes, reference_photos = row
+    return {
+        "total_photos": total_photos,
+        "total_size_mb": round(total_size_bytes / (1024 * 1024), 2),
+        "reference_photos": reference_photos
+    }
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Miniaturas e prévias com marca d'água das fotos do Midiaz
+
+As galerias do frontend recebem derivados JPEG em tamanhos fixos em vez dos
+originais. Os derivados são gerados sob demanda (ou já na ingestão, pelo
+worker facial, que decodifica a foto de qualquer jeito) e guardados num
+cache em disco com limite de tamanho: quando o limite é ultrapassado, os
+arquivos menos usados recentemente (mtime) são removidos.
+
+Este módulo não importa o banco de dados: ele roda também dentro dos
+processos do pool de face_jobs.
+
+Uso:
+    python image_derivatives.py   # aplica o limite do cache e mostra o uso
+"""
+
+import os
+import uuid
+import threading
+from typing import Dict, Optional
+from PIL import Image, ImageDraw, ImageFont
+from image_loader import load_image
+
+# Cache de derivados (pode ser apagado a qualquer momento)
+DERIVATIVES_DIR = os.getenv("DERIVATIVES_DIR", "midiaz_derivatives")
+
+# Tamanho máximo do cache em disco
+DERIVATIVE_CACHE_MAX_BYTES = int(os.getenv("DERIVATIVE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# Tamanhos servidos: nome -> maior lado em pixels
+DERIVATIVE_SIZES: Dict[str, int] = {
+    "thumb": 320,
+    "preview": 1024
+}
+
+# Tamanhos gerados já na ingestão (os usados pelas galerias)
+PREGENERATED_SIZES = ("thumb", "preview")
+
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "80"))
+WATERMARK_TEXT = os.getenv("WATERMARK_TEXT", "MIDIAZ")
+
+# Bytes gravados por este processo desde a última verificação do limite
+_written_since_check = 0
+_cache_lock = threading.Lock()
+
+def derivative_key(content_hash: Optional[str], photo_id: int) -> str:
+    """Chave do derivado: hash do conteúdo (fotos iguais compartilham o cache)"""
+    return content_hash or f"photo-{photo_id}"
+
+def derivative_path(key: str, size: str) -> str:
+    """Caminho de um derivado no cache: <dir>/<tamanho>/ab/<chave>.jpg"""
+    return os.path.join(DERIVATIVES_DIR, size, key[:2], f"{key}.jpg")
+
+def _apply_watermark(image: Image.Image) -> Image.Image:
+    """Escreve a marca d'água semitransparente no canto inferior direito"""
+    if not WATERMARK_TEXT:
+        return image
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    font = ImageFont.load_default()
+    left, top, right, bottom = draw.textbbox((0, 0), WATERMARK_TEXT, font=font)
+    margin = max(4, min(image.size) // 40)
+    position = (image.width - (right - left) - margin, image.height - (bottom - top) - margin)
+    draw.text(position, WATERMARK_TEXT, font=font, fill=(255, 255, 255, 160))
+    return Image.alpha_composite(image.convert("RGBA"), overlay).convert("RGB")
+
+def render_derivative(image: Image.Image, size: str, key: str) -> str:
+    """
+    Gera um derivado a partir de uma imagem já decodificada
+
+    Args:
+        image: Imagem RGB com a orientação EXIF já corrigida
+        size: Nome do tamanho (ver DERIVATIVE_SIZES)
+        key: Chave do derivado (ver derivative_key)
+
+    Returns:
+        str: Caminho do arquivo gerado
+    """
+    max_side = DERIVATIVE_SIZES[size]
+    derivative = image.copy()
+    derivative.thumbnail((max_side, max_side))
+    derivative = _apply_watermark(derivative)
+
+    path = derivative_path(key, size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    derivative.save(tmp_path, "JPEG", quality=DERIVATIVE_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp_path, path)
+
+    _track_written(os.path.getsize(path))
+    return path
+
+def get_derivative(file_path: str, key: str, size: str) -> str:
+    """Retorna o derivado do cache, gerando na primeira requisição"""
+    if size not in DERIVATIVE_SIZES:
+        raise ValueError(f"Tamanho não suportado: {size}")
+
+    path = derivative_path(key, size)
+    try:
+        os.utime(path)  # Acesso recente: último a ser removido pelo LRU
+        return path
+    except FileNotFoundError:
+        pass
+
+    return render_derivative(load_image(file_path, DERIVATIVE_SIZES[size]), size, key)
+
+def pregenerate_derivatives(image: Image.Image, key: str):
+    """Gera na ingestão os tamanhos usados pelas galerias (reaproveita a imagem decodificada)"""
+    for size in PREGENERATED_SIZES:
+        if not os.path.exists(derivative_path(key, size)):
+            render_derivative(image, size, key)
+
+def _track_written(file_size: int):
+    """Verifica o limite do cache a cada ~10% do limite gravado por este processo"""
+    global _written_since_check
+    with _cache_lock:
+        _written_since_check += file_size
+        if _written_since_check < DERIVATIVE_CACHE_MAX_BYTES // 10:
+            return
+        _written_since_check = 0
+    enforce_cache_limit()
+
+def enforce_cache_limit(max_bytes: int = DERIVATIVE_CACHE_MAX_BYTES) -> dict:
+    """
+    Remove os derivados menos usados até o cache ficar abaixo de 90% do limite
+
+    Returns:
+        dict: arquivos e bytes no cache e quantos foram removidos
+    """
+    entries = []
+    stack = [DERIVATIVES_DIR] if os.path.isdir(DERIVATIVES_DIR) else []
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_bytes:
+        target = max_bytes * 9 // 10
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+
+    return {"files": len(entries) - removed, "bytes": total, "removed": removed}
+
+if __name__ == "__main__":
+    usage = enforce_cache_limit()
+    print(f"📊 Cache de derivados: {usage['files']} arquivos, "
+          f"{usage['bytes'] / 1024 / 1024:.1f} MB ({usage['removed']} removidos)")
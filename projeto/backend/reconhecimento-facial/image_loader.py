@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Decodificação reduzida das fotos para a detecção facial e as miniaturas
+
+Uma foto de câmera (20+ megapixels) não precisa ser decodificada inteira
+para virar uma imagem de 1600 ou 320 pixels. Em JPEG, draft() escolhe a
+maior escala DCT (1/2, 1/4 ou 1/8) que ainda cobre o tamanho pedido e o
+libjpeg deixa de reconstruir os pixels descartados: menos tempo e um buffer
+decodificado até 64x menor.
+
+A orientação EXIF é aplicada depois da redução, na imagem já pequena (o
+maior lado é o mesmo em qualquer rotação). Transpor o original antes, como
+antes, decodificava a foto inteira e desligava o draft().
+
+Assim como image_derivatives, este módulo não importa o banco de dados:
+roda dentro dos processos do pool de face_jobs.
+"""
+
+import os
+from typing import Tuple
+from PIL import Image, ImageOps
+
+# Decodificação reduzida dos JPEGs (IMAGE_DRAFT_DECODING=0 decodifica sempre em tamanho real)
+DRAFT_DECODING = os.getenv("IMAGE_DRAFT_DECODING", "1") == "1"
+
+# Modos redimensionados direto; os demais (paleta, CMYK, alfa) viram RGB antes
+RESIZABLE_MODES = ("RGB", "L")
+
+def fit_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """Tamanho que cabe em max_side mantendo a proporção (nunca amplia)"""
+    width, height = size
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def load_image(file_path: str, max_side: int, resample: int = Image.Resampling.BICUBIC) -> Image.Image:
+    """
+    Decodifica uma foto já reduzida para caber em max_side
+
+    Args:
+        file_path: Caminho do original
+        max_side: Maior lado da imagem retornada
+        resample: Filtro da redução final (depois da escala DCT)
+
+    Returns:
+        Image.Image: imagem RGB com a orientação EXIF corrigida
+    """
+    with Image.open(file_path) as image:
+        if DRAFT_DECODING:
+            # Só define a escala do decodificador; os pixels são lidos no próximo passo
+            image.draft("RGB", fit_size(image.size, max_side))
+        if image.mode not in RESIZABLE_MODES:
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), resample=resample)
+        image = ImageOps.exif_transpose(image)
+        return image if image.mode == "RGB" else image.convert("RGB")
@@ -4,8 +4,7 @@ Script para inicializar o banco de dados SQLite
 """
 
 from database import create_tables, SessionLocal, User
-from auth import users_db
-import bcrypt
+from auth import get_mock_users
 
 def init_database():
     """Inicializa o banco de dados e migra dados do mock"""
@@ -26,7 +25,7 @@ def init_database():
         
         if existing_users == 0:
             # Inserir usuários do mock
-            for email, user_data in users_db.items():
+            for email, user_data in get_mock_users().items():
                 new_user = User(
                     name=user_data['name'],
                     email=user_data['email'],
@@ -49,7 +48,7 @@ def init_database():
         print(f"   👥 Total de usuários: {total_users}")
         
         # Mostrar usuários
-        users = db.query(User).all()
+        users = db.query(User.email, User.name, User.user_type).order_by(User.id).yield_per(1000)
         for user in users:
             print(f"   📧 {user.email} ({user.name}) - {user.user_type}")
         
@@ -1,13 +1,37 @@
-from fastapi import FastAPI, HTTPException, Depends, Form, Header, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, Form, Header, File, UploadFile, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
-from auth import authenticate_user, create_access_token, verify_token, create_user
-from database import SessionLocal, User, Photo, create_tables
-from file_upload import save_uploaded_file, get_user_photos, get_upload_stats
+from auth import authenticate_user_async, create_access_token, verify_token_async, create_user_async
+from stats import get_stats_snapshot_async
+from photo_export import iter_photo_ndjson_async
+from password_hashing import PasswordHasherBusy, get_hash_pool_stats, shutdown_hash_pool
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal, User, Photo, create_tables, get_async_db, dispose_async_engine
+from db_writer import get_writer_stats
+from file_upload import (
+    ensure_directories, save_uploaded_file_async, save_uploaded_files, get_user_photos_async, get_photo_by_id_async,
+    PHOTOS_PAGE_SIZE, PHOTOS_MAX_PAGE_SIZE
+)
+from image_derivatives import DERIVATIVE_SIZES, derivative_key, get_derivative
+from file_serving import content_etag, etag_matches, not_modified, serve_file
+from face_matcher import load_reference_encoding_async
+from match_cache import (
+    MATCH_CACHE_CONTROL, MATCH_CACHE_TOP_K, get_event_state_async, get_match_cache_stats,
+    match_etag, reference_tag, search_event_cached_async
+)
+from events import (
+    get_event_async, get_event_people_async, get_person_photos_async,
+    EVENT_PHOTOS_PAGE_SIZE, EVENT_PHOTOS_MAX_PAGE_SIZE
+)
+from face_jobs import (
+    FACE_WORKER_EMBEDDED, enqueue_face_jobs, get_job_progress_async, get_job_status_async,
+    start_face_worker, stop_face_worker
+)
 import io
 import uuid
 
@@ -25,24 +49,43 @@ app.add_middleware(
 # Configurar autenticação
 security = HTTPBearer()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Dependency para obter usuário atual"""
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Dependency para obter usuário atual (consulta no event loop, sem threadpool)"""
     token = credentials.credentials
-    user = verify_token(token)
+    user = await verify_token_async(db, token)
     if user is None:
         raise HTTPException(status_code=401, detail="Token inválido")
     return user
 
+@app.on_event("startup")
+async def startup():
+    ensure_directories()
+    if FACE_WORKER_EMBEDDED:
+        start_face_worker()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if FACE_WORKER_EMBEDDED:
+        stop_face_worker()
+    shutdown_hash_pool()
+    await dispose_async_engine()
+
 @app.get("/")
 async def root():
     return {"message": "Midiaz Auth API is running!"}
 
 @app.post("/api/auth/login")
-async def login(email: str = Form(...), password: str = Form(...)):
+async def login(email: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint de login
     """
-    user = authenticate_user(email, password)
+    try:
+        user = await authenticate_user_async(db, email, password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Muitos logins simultâneos, tente novamente", headers={"Retry-After": "1"})
     if not user:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
@@ -78,7 +121,7 @@ async def register(
     Endpoint de registro
     """
     try:
-        user = create_user(name, email, password, user_type, cpf, phone)
+        user = await create_user_async(name, email, password, user_type, cpf, phone)
         access_token_expires = timedelta(minutes=30)
         access_token = create_access_token(
             data={"sub": user["email"]}, expires_delta=access_token_expires
@@ -97,6 +140,8 @@ async def register(
                 "avatar": user["avatar"]
             }
         }
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Muitos cadastros simultâneos, tente novamente", headers={"Retry-After": "1"})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -125,7 +170,7 @@ async def register_face(
     """
     try:
         # Salvar foto no sistema de arquivos e banco
-        success, message, photo = save_uploaded_file(
+        success, message, photo = await save_uploaded_file_async(
             file=file,
             user_id=current_user["id"],
             is_reference=True
@@ -134,46 +179,46 @@ async def register_face(
         if not success:
             raise HTTPException(status_code=400, detail=message)
         
-        # Simular processamento de reconhecimento facial
-        # Em produção, aqui seria usado face_recognition e opencv
-        
-        # Atualizar flag de face detectada
-        db = SessionLocal()
-        try:
-            photo.face_detected = True
-            db.commit()
-        finally:
-            db.close()
+        # Detecção e embedding rodam na fila de processamento facial
+        job_ids = await run_in_threadpool(enqueue_face_jobs, [photo])
         
         return {
             "success": True,
-            "message": "Rosto registrado com sucesso",
+            "message": "Rosto recebido e em processamento",
             "user_id": current_user["id"],
-            "face_detected": True,
-            "photo_id": photo.id
+            "face_detected": False,
+            "photo_id": photo.id,
+            "job_id": job_ids[0],
+            "status": "pending"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
 
 @app.post("/api/upload-photo")
 async def upload_photo(
     file: UploadFile = File(...),
+    event_id: Optional[str] = Form(None),
     current_user: Dict = Depends(get_current_user)
 ):
     """
     Faz upload de uma foto do usuário
     """
     try:
-        success, message, photo = save_uploaded_file(
+        success, message, photo = await save_uploaded_file_async(
             file=file,
             user_id=current_user["id"],
-            is_reference=False
+            is_reference=False,
+            event_id=event_id
         )
         
         if not success:
             raise HTTPException(status_code=400, detail=message)
         
+        job_ids = await run_in_threadpool(enqueue_face_jobs, [photo])
+        
         return {
             "success": True,
             "message": "Foto enviada com sucesso",
@@ -181,20 +226,193 @@ async def upload_photo(
                 "id": photo.id,
                 "filename": photo.filename,
                 "file_size": photo.file_size,
+                "event_id": photo.event_id,
                 "created_at": photo.created_at.isoformat()
-            }
+            },
+            "job_id": job_ids[0]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao fazer upload: {str(e)}")
 
+@app.post("/api/upload-photos")
+async def upload_photos(
+    files: List[UploadFile] = File(...),
+    event_id: Optional[str] = Form(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    """
+    Faz upload de um lote de fotos (vários arquivos ou ZIPs) de um evento
+    """
+    try:
+        success, message, photos, skipped = await run_in_threadpool(
+            save_uploaded_files, files, current_user["id"], event_id
+        )
+        
+        if not success:
+            raise HTTPException(status_code=400, detail=message)
+        
+        job_ids = await run_in_threadpool(enqueue_face_jobs, photos)
+        
+        return {
+            "success": True,
+            "message": message,
+            "event_id": event_id,
+            "total_photos": len(photos),
+            "skipped": skipped,
+            "photos": [
+                {
+                    "id": photo.id,
+                    "filename": photo.filename,
+                    "file_size": photo.file_size,
+                    "job_id": job_id
+                }
+                for photo, job_id in zip(photos, job_ids)
+            ]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao fazer upload do lote: {str(e)}")
+
+@app.get("/api/events/{event_id}/search")
+async def search_event_photos(
+    request: Request,
+    event_id: str,
+    top_k: int = Query(50, ge=1, le=MATCH_CACHE_TOP_K),
+    current_user: Dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Busca as fotos de um evento onde o rosto do usuário aparece (ETag e If-None-Match)
+    """
+    reference = await load_reference_encoding_async(db, current_user["id"])
+    if reference is None:
+        raise HTTPException(status_code=404, detail="Nenhum rosto de referência registrado")
+    
+    try:
+        # Sem fotos/rostos novos desde a última busca, nem compara de novo
+        state = await get_event_state_async(db, event_id)
+        etag = match_etag(current_user["id"], event_id, state, reference_tag(reference), top_k)
+        headers = {"ETag": etag, "Cache-Control": MATCH_CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        
+        matches = await search_event_cached_async(db, current_user["id"], event_id, reference, state)
+        matches = matches[:top_k]
+        
+        return JSONResponse({
+            "success": True,
+            "event_id": event_id,
+            "photos_found": len(matches),
+            "matches": matches
+        }, headers=headers)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar fotos do evento: {str(e)}")
+
+@app.get("/api/events/{event_id}")
+async def get_event(event_id: str, current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Retorna os dados e contadores (fotos, rostos, pessoas) de um evento
+    """
+    event = await get_event_async(db, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Evento não encontrado")
+    
+    return {
+        "success": True,
+        "event": event
+    }
+
+@app.get("/api/events/{event_id}/people")
+async def get_event_people(event_id: str, current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Retorna as pessoas (rostos agrupados) identificadas em um evento
+    """
+    people = await get_event_people_async(db, event_id)
+    
+    return {
+        "success": True,
+        "event_id": event_id,
+        "people": people
+    }
+
+@app.get("/api/events/{event_id}/people/{cluster_id}/photos")
+async def get_event_person_photos(
+    event_id: str,
+    cluster_id: int,
+    limit: int = Query(EVENT_PHOTOS_PAGE_SIZE, ge=1, le=EVENT_PHOTOS_MAX_PAGE_SIZE),
+    after_id: Optional[int] = Query(None),
+    current_user: Dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Retorna as fotos de um evento em que uma pessoa aparece (use next_after_id para a próxima página)
+    """
+    rows, next_after_id = await get_person_photos_async(db, event_id, cluster_id, limit, after_id)
+    
+    return {
+        "success": True,
+        "event_id": event_id,
+        "cluster_id": cluster_id,
+        "photos": [
+            {
+                "id": row.id,
+                "filename": row.filename,
+                "faces": row.face_count,
+                "created_at": row.created_at.isoformat()
+            }
+            for row in rows
+        ],
+        "next_after_id": next_after_id
+    }
+
+@app.get("/api/face-jobs")
+async def get_face_jobs_progress(current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Retorna o progresso do processamento facial das fotos do usuário
+    """
+    return {
+        "success": True,
+        "jobs": await get_job_progress_async(db, current_user["id"])
+    }
+
+@app.get("/api/face-jobs/{job_id}")
+async def get_face_job(job_id: int, current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Retorna o status de um job de processamento facial
+    """
+    job = await get_job_status_async(db, job_id, current_user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    return {
+        "success": True,
+        "job": job
+    }
+
 @app.get("/api/user/photos")
-async def get_photos(current_user: Dict = Depends(get_current_user)):
+async def get_photos(
+    limit: int = Query(PHOTOS_PAGE_SIZE, ge=1, le=PHOTOS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    is_reference: Optional[bool] = Query(None),
+    face_detected: Optional[bool] = Query(None),
+    current_user: Dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Retorna todas as fotos do usuário
+    Retorna as fotos do usuário em páginas (use next_cursor para a próxima)
     """
     try:
-        photos = get_user_photos(current_user["id"])
+        photos, next_cursor = await get_user_photos_async(
+            db, current_user["id"], limit, cursor, is_reference, face_detected
+        )
         
         return {
             "success": True,
@@ -203,47 +421,117 @@ async def get_photos(current_user: Dict = Depends(get_current_user)):
                     "id": photo.id,
                     "filename": photo.filename,
                     "file_size": photo.file_size,
+                    "event_id": photo.event_id,
                     "is_reference": photo.is_reference_photo,
                     "face_detected": photo.face_detected,
                     "created_at": photo.created_at.isoformat()
                 }
                 for photo in photos
-            ]
+            ],
+            "next_cursor": next_cursor
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar fotos: {str(e)}")
 
+@app.get("/api/photos/export")
+async def export_photos(
+    event_id: Optional[str] = Query(None),
+    user_id: Optional[int] = Query(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    """
+    Exporta o catálogo de fotos em NDJSON (streaming, uma foto por linha)
+    
+    Usuários exportam as próprias fotos; administradores podem exportar as
+    de qualquer usuário ou um evento inteiro.
+    """
+    if current_user["type"] != "admin":
+        if user_id is not None and user_id != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Sem permissão para exportar fotos de outro usuário")
+        user_id = current_user["id"]
+    
+    # Gerador assíncrono: sessão e cursor ficam no event loop durante todo o envio
+    return StreamingResponse(
+        iter_photo_ndjson_async(user_id=user_id, event_id=event_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="fotos.ndjson"'}
+    )
+
+@app.get("/api/photos/{photo_id}/preview")
+async def get_photo_preview(
+    photo_id: int,
+    request: Request,
+    size: str = Query("thumb"),
+    current_user: Dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Retorna uma miniatura ou prévia com marca d'água de uma foto
+    """
+    if size not in DERIVATIVE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Tamanho inválido. Use: {', '.join(DERIVATIVE_SIZES)}")
+    
+    photo = await get_photo_by_id_async(db, photo_id)
+    # Fotos de evento aparecem nas galerias de todos; as demais só para o dono
+    if photo is None or (photo.user_id != current_user["id"] and (photo.is_reference_photo or not photo.event_id)):
+        raise HTTPException(status_code=404, detail="Foto não encontrada")
+    
+    try:
+        # ETag do original: o mtime do derivado muda a cada acesso (LRU do cache)
+        etag = content_etag(photo.content_hash, photo.file_path, suffix=f"-{size}")
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        path = await run_in_threadpool(
+            get_derivative, photo.file_path, derivative_key(photo.content_hash, photo.id), size
+        )
+        return serve_file(request, path, etag, media_type="image/jpeg")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Arquivo da foto não encontrado")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar prévia: {str(e)}")
+
+@app.get("/api/photos/{photo_id}/file")
+async def download_photo(
+    photo_id: int,
+    request: Request,
+    current_user: Dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Retorna o arquivo original de uma foto (suporta Range, ETag e If-None-Match)
+    """
+    photo = await get_photo_by_id_async(db, photo_id)
+    # Originais: só o dono (e administradores) até existir o registro de compras
+    if photo is None or (photo.user_id != current_user["id"] and current_user["type"] != "admin"):
+        raise HTTPException(status_code=404, detail="Foto não encontrada")
+    
+    try:
+        etag = content_etag(photo.content_hash, photo.file_path)
+        return serve_file(request, photo.file_path, etag, media_type=photo.mime_type, download_name=photo.filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Arquivo da foto não encontrado")
+
 @app.get("/api/stats")
-async def get_stats():
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
     """
     Retorna estatísticas do sistema
     """
     try:
-        # Estatísticas de upload
-        upload_stats = get_upload_stats()
-        
-        # Estatísticas de usuários
-        db = SessionLocal()
-        try:
-            total_users = db.query(User).count()
-            consumer_count = db.query(User).filter(User.user_type == "consumer").count()
-            photographer_count = db.query(User).filter(User.user_type == "photographer").count()
-            admin_count = db.query(User).filter(User.user_type == "admin").count()
-        finally:
-            db.close()
+        stats = await get_stats_snapshot_async(db)
         
         return {
-            "users": {
-                "total": total_users,
-                "consumers": consumer_count,
-                "photographers": photographer_count,
-                "admins": admin_count
-            },
-            "photos": upload_stats,
+            "users": stats["users"],
+            "photos": stats["photos"],
             "system": {
                 "uptime": "running",
-                "version": "1.0.0"
+                "version": "1.0.0",
+                "password_hashing": get_hash_pool_stats(),
+                "database_writer": get_writer_stats(),
+                "match_cache": get_match_cache_stats()
             }
         }
         
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Cache dos resultados de "minhas fotos no evento"
+
+A página de fotos encontradas é recarregada várias vezes seguidas. Cada
+usuário e evento guardam os resultados da última busca junto com a versão
+do evento (Event.version), o contador de rostos e o maior id de encoding
+já comparado:
+
+- mesma versão e mesma referência: resposta do cache (ou 304 pela ETag)
+- versão nova e só rostos adicionados: compara a referência apenas com os
+  encodings de id maior que o último visto e mescla com o resultado anterior
+- remoção de fotos ou referência nova: busca completa
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+import numpy as np
+from sqlalchemy import func, select
+from fastapi.concurrency import run_in_threadpool
+from database import Event, FaceEncoding, Photo
+from face_matcher import build_encoding_matrix, decode_rows, match_encodings
+from face_index import search_event_index
+from face_clustering import search_event_clusters_async
+
+# Entradas (usuário, evento) mantidas em memória (0 desliga)
+MATCH_CACHE_SIZE = int(os.getenv("MATCH_CACHE_SIZE", "5000"))
+
+# Resultados guardados por entrada: o maior top_k aceito pela rota de busca
+MATCH_CACHE_TOP_K = 500
+
+# Rostos novos (no banco todo) lidos por busca incremental; acima disso, busca completa
+MATCH_DELTA_MAX_FACES = int(os.getenv("MATCH_DELTA_MAX_FACES", "10000"))
+
+# Respostas revalidadas a cada recarga (If-None-Match), nunca reaproveitadas às cegas
+MATCH_CACHE_CONTROL = "private, no-cache"
+
+class EventState(NamedTuple):
+    """Versão e contador de rostos de um evento, e o maior id de encoding do banco"""
+    version: int
+    face_count: int
+    last_encoding_id: int
+
+class MatchEntry(NamedTuple):
+    state: EventState
+    reference_tag: str
+    matches: List[dict]
+
+# (user_id, event_id) -> MatchEntry; ordem = uso mais recente por último (LRU)
+_match_cache: "OrderedDict[tuple, MatchEntry]" = OrderedDict()
+_match_lock = threading.Lock()
+_stats = {"hits": 0, "deltas": 0, "misses": 0}
+
+def reference_tag(reference: np.ndarray) -> str:
+    """Identifica o encoding de referência (muda quando a média é recalculada)"""
+    return hashlib.sha1(np.asarray(reference, dtype=np.float32).tobytes()).hexdigest()[:16]
+
+def match_etag(user_id: int, event_id: str, state: EventState, tag: str, top_k: int) -> str:
+    """ETag fraca da resposta de busca (usuário, evento, versão, referência e top_k)"""
+    key = f"{user_id}\0{event_id}\0{state.version}\0{tag}\0{top_k}".encode("utf-8")
+    return f'W/"{hashlib.sha1(key).hexdigest()[:20]}"'
+
+async def get_event_state_async(db, event_id: str) -> EventState:
+    """Versão do evento (0 se ainda não existe) e o maior id de encoding, numa leitura"""
+    async with db.begin():
+        row = (await db.execute(select(Event.version, Event.face_count).where(Event.id == event_id))).first()
+        last_encoding_id = (await db.execute(select(func.max(FaceEncoding.id)))).scalar()
+    version, face_count = row if row is not None else (0, 0)
+    return EventState(version or 0, face_count or 0, last_encoding_id or 0)
+
+def _delta_statement(after_id: int):
+    """
+    Encodings gravados depois de after_id, de qualquer evento
+
+    Sem filtro por evento no SQL: o banco percorre só o intervalo da chave
+    primária de face_encodings em vez de todas as fotos do evento.
+    """
+    return (
+        select(FaceEncoding.photo_id, FaceEncoding.encoding_blob, FaceEncoding.encoding_data,
+               Photo.event_id, Photo.is_reference_photo)
+        .join(Photo, Photo.id == FaceEncoding.photo_id)
+        .where(FaceEncoding.id > after_id)
+        .order_by(FaceEncoding.id)
+        .limit(MATCH_DELTA_MAX_FACES + 1)
+    )
+
+def merge_matches(matches: List[dict], new_matches: List[dict], top_k: int = MATCH_CACHE_TOP_K) -> List[dict]:
+    """Junta dois resultados mantendo a menor distância de cada foto"""
+    best = {match["photo_id"]: match for match in matches}
+    for match in new_matches:
+        current = best.get(match["photo_id"])
+        if current is None or match["distance"] < current["distance"]:
+            best[match["photo_id"]] = match
+    return sorted(best.values(), key=lambda match: match["distance"])[:top_k]
+
+async def _search_event_async(db, event_id: str, reference: np.ndarray) -> List[dict]:
+    """Busca completa: pessoas do evento (centróides) quando já agrupado; senão, todos os rostos pelo índice"""
+    matches = await search_event_clusters_async(db, event_id, reference, top_k=MATCH_CACHE_TOP_K)
+    if matches is None:
+        matches = await run_in_threadpool(search_event_index, event_id, reference, top_k=MATCH_CACHE_TOP_K)
+    if not matches:
+        return matches
+    # Uma foto apagada some do shard só depois do commit (remove_event_encodings)
+    async with db.begin():
+        existing = set((await db.execute(select(Photo.id).where(Photo.id.in_([match["photo_id"] for match in matches])))).scalars())
+    return [match for match in matches if match["photo_id"] in existing]
+
+async def _search_delta_async(db, event_id: str, reference: np.ndarray, entry: MatchEntry, state: EventState) -> Optional[List[dict]]:
+    """Compara só os rostos novos; None se o evento também perdeu rostos ou há rostos novos demais (busca completa)"""
+    async with db.begin():
+        rows = (await db.execute(_delta_statement(entry.state.last_encoding_id))).all()
+    if len(rows) > MATCH_DELTA_MAX_FACES:
+        return None
+    rows = [row[:3] for row in rows if row[3] == event_id and not row[4]]
+    if len(rows) != state.face_count - entry.state.face_count:
+        return None
+    if not rows:
+        return entry.matches
+    encodings = build_encoding_matrix([row[0] for row in rows], decode_rows([row[1:] for row in rows]))
+    return merge_matches(entry.matches, match_encodings(encodings, reference, top_k=MATCH_CACHE_TOP_K))
+
+async def search_event_cached_async(db, user_id: int, event_id: str, reference: np.ndarray, state: EventState) -> List[dict]:
+    """
+    Fotos do evento com o rosto do usuário, reaproveitando a última busca
+
+    Args:
+        db: AsyncSession da requisição
+        user_id: Usuário que busca
+        event_id: Evento pesquisado
+        reference: Encoding de referência do usuário
+        state: Estado do evento lido antes da busca (get_event_state_async)
+
+    Returns:
+        List[dict]: até MATCH_CACHE_TOP_K fotos, da mais parecida para a menos parecida
+    """
+    key = (user_id, event_id)
+    tag = reference_tag(reference)
+    with _match_lock:
+        entry = _match_cache.get(key)
+        if entry is not None:
+            _match_cache.move_to_end(key)
+
+    matches = None
+    if entry is not None and entry.reference_tag == tag:
+        if entry.state.version == state.version:
+            _count("hits")
+            return entry.matches
+        matches = await _search_delta_async(db, event_id, reference, entry, state)
+    _count("deltas" if matches is not None else "misses")
+    if matches is None:
+        matches = await _search_event_async(db, event_id, reference)
+
+    if MATCH_CACHE_SIZE > 0:
+        with _match_lock:
+            _match_cache[key] = MatchEntry(state, tag, matches)
+            _match_cache.move_to_end(key)
+            while len(_match_cache) > MATCH_CACHE_SIZE:
+                _match_cache.popitem(last=False)
+    return matches
+
+def _count(outcome: str):
+    with _match_lock:
+        _stats[outcome] += 1
+
+def get_match_cache_stats() -> dict:
+    """Entradas em memória e quantas buscas vieram do cache, do delta ou foram completas"""
+    with _match_lock:
+        return {"entries": len(_match_cache), **_stats}
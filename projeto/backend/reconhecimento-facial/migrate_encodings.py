@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Script para migrar os encodings faciais de JSON (encoding_data) para binário (encoding_blob)
+
+Uso:
+    python migrate_encodings.py [--float16] [--vacuum]
+"""
+
+import sys
+import json
+from sqlalchemy import inspect, text
+from database import create_tables, engine, SessionLocal, FaceEncoding
+from face_matcher import pack_encoding
+
+BATCH_SIZE = 1000
+
+def rebuild_table_if_needed():
+    """Recria face_encodings quando encoding_data ainda é NOT NULL (SQLite não altera colunas)"""
+    columns = {column["name"]: column for column in inspect(engine).get_columns("face_encodings")}
+    if columns["encoding_data"]["nullable"]:
+        return
+
+    print("🔧 Recriando tabela face_encodings com encoding_data opcional...")
+    table = FaceEncoding.__table__
+    column_names = ", ".join(name for name in columns if name in table.columns)
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE face_encodings RENAME TO face_encodings_old"))
+        for index in inspect(conn).get_indexes("face_encodings_old"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+        table.create(bind=conn)
+        conn.execute(text(
+            f"INSERT INTO face_encodings ({column_names}) SELECT {column_names} FROM face_encodings_old"
+        ))
+        conn.execute(text("DROP TABLE face_encodings_old"))
+    print("✅ Tabela recriada")
+
+def migrate_encodings(dtype: str = "float32", vacuum: bool = False):
+    """Converte em lotes todas as linhas que ainda só têm o encoding em JSON"""
+    print("🔄 MIGRANDO ENCODINGS FACIAIS PARA BINÁRIO")
+    print("=" * 50)
+
+    create_tables()
+    rebuild_table_if_needed()
+
+    db = SessionLocal()
+    migrated = 0
+    try:
+        last_id = 0
+        while True:
+            rows = (
+                db.query(FaceEncoding.id, FaceEncoding.encoding_data)
+                .filter(FaceEncoding.id > last_id, FaceEncoding.encoding_blob.is_(None))
+                .order_by(FaceEncoding.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not rows:
+                break
+
+            db.bulk_update_mappings(FaceEncoding, [
+                {
+                    "id": row_id,
+                    "encoding_blob": pack_encoding(json.loads(data), dtype=dtype),
+                    "encoding_data": None
+                }
+                for row_id, data in rows
+            ])
+            db.commit()
+            migrated += len(rows)
+            last_id = rows[-1][0]
+            print(f"   ✅ {migrated} encodings migrados")
+
+    except Exception as e:
+        print(f"❌ Erro ao migrar encodings: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    if vacuum:
+        print("🧹 Compactando o banco (VACUUM)...")
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+    print(f"\n🎉 Migração concluída: {migrated} encodings convertidos ({dtype})")
+
+if __name__ == "__main__":
+    migrate_encodings(
+        dtype="float16" if "--float16" in sys.argv else "float32",
+        vacuum="--vacuum" in sys.argv
+    )
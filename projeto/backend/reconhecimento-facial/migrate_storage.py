@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Script para migrar os arquivos de upload do layout plano para o layout em shards
+
+Arquivos antigos (<dir>/<uuid>.jpg) passam para <dir>/ab/cd/<sha256><extensão>,
+o mesmo endereço usado pelos uploads novos. A migração pode rodar com a API
+no ar: o arquivo novo é criado como hard link, o banco é atualizado e só
+depois o caminho antigo é removido, então toda foto sempre tem um arquivo
+válido no caminho gravado em Photo.file_path.
+
+Uso:
+    python migrate_storage.py [--dry-run]
+"""
+
+import os
+import sys
+import shutil
+import hashlib
+from database import create_tables, SessionLocal, Photo
+from file_upload import UPLOAD_DIR, REFERENCE_FACES_DIR, COPY_CHUNK_SIZE, content_path, file_extension
+
+BATCH_SIZE = 500
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 de um arquivo lido em blocos"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def is_flat_path(file_path: str) -> bool:
+    """Arquivo gravado direto na raiz de um diretório de upload (layout antigo)"""
+    return os.path.dirname(os.path.normpath(file_path)) in (
+        os.path.normpath(UPLOAD_DIR), os.path.normpath(REFERENCE_FACES_DIR)
+    )
+
+def link_or_copy(source: str, destination: str):
+    """Cria o arquivo no endereço novo sem copiar os bytes quando possível"""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Sistemas de arquivos sem hard link: cópia para temporário + rename
+        tmp_path = f"{destination}.tmp.{os.getpid()}"
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, destination)
+
+def migrate_storage(dry_run: bool = False):
+    """Move em lotes os arquivos das fotos que ainda estão no layout plano"""
+    print("🔄 MIGRANDO ARQUIVOS PARA O LAYOUT EM SHARDS")
+    print("=" * 50)
+
+    create_tables()
+    db = SessionLocal()
+    migrated = missing = deduplicated = 0
+    try:
+        last_id = 0
+        while True:
+            photos = (
+                db.query(Photo)
+                .filter(Photo.id > last_id)
+                .order_by(Photo.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not photos:
+                break
+            last_id = photos[-1].id
+
+            old_paths = []
+            for photo in photos:
+                if not is_flat_path(photo.file_path):
+                    continue
+                if not os.path.exists(photo.file_path):
+                    missing += 1
+                    print(f"   ❌ Arquivo não encontrado: {photo.file_path}")
+                    continue
+
+                content_hash = photo.content_hash or hash_file(photo.file_path)
+                dest_dir = REFERENCE_FACES_DIR if photo.is_reference_photo else UPLOAD_DIR
+                new_path = content_path(dest_dir, content_hash, file_extension(photo.file_path))
+                migrated += 1
+                if dry_run:
+                    continue
+
+                if os.path.exists(new_path):
+                    deduplicated += 1
+                else:
+                    link_or_copy(photo.file_path, new_path)
+                old_paths.append(photo.file_path)
+                photo.file_path = new_path
+                photo.filename = os.path.basename(new_path)
+                photo.content_hash = content_hash
+
+            db.commit()
+
+            # Só depois do commit: nenhuma foto aponta mais para os caminhos antigos
+            for old_path in old_paths:
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+            if old_paths:
+                print(f"   ✅ {migrated} arquivos migrados")
+
+    except Exception as e:
+        print(f"❌ Erro ao migrar arquivos: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    action = "a migrar" if dry_run else "migrados"
+    print(f"\n🎉 Migração concluída: {migrated} arquivos {action}, "
+          f"{deduplicated} duplicados reaproveitados, {missing} não encontrados")
+
+if __name__ == "__main__":
+    migrate_storage(dry_run="--dry-run" in sys.argv)
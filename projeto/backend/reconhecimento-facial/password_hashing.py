@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Hash e verificação de senhas (bcrypt) fora do event loop
+
+Cada bcrypt custa ~100-300 ms de CPU. As versões assíncronas rodam num
+pool de threads dedicado e limitado (o bcrypt libera o GIL), separado do
+threadpool do FastAPI, e recusam trabalho quando a fila enche: um pico de
+logins recebe 503 em vez de travar as outras requisições.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import bcrypt
+
+# Custo do bcrypt (2^rounds iterações); hashes com outro custo são refeitos no login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Threads dedicadas a bcrypt
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Máximo de operações em andamento (executando + na fila) antes de recusar
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+class PasswordHasherBusy(Exception):
+    """Fila de hash cheia: o cliente deve tentar novamente mais tarde"""
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_stats = {"pending": 0, "max_pending": 0, "completed": 0, "rejected": 0, "total_ms": 0.0}
+
+def hash_password(password: str, rounds: int = None) -> str:
+    """Gera o hash bcrypt de uma senha (síncrono)"""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds or BCRYPT_ROUNDS)).decode()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verifica se a senha está correta (síncrono)"""
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+
+def hash_rounds(hashed_password: str) -> int:
+    """Custo gravado num hash bcrypt ($2b$12$...)"""
+    return int(hashed_password.split("$")[2])
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Indica se o hash foi gerado com um custo diferente do configurado"""
+    try:
+        return hash_rounds(hashed_password) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+        return _executor
+
+def _timed(func, *args):
+    """Executa no pool e acumula o tempo de CPU gasto"""
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            _stats["completed"] += 1
+            _stats["total_ms"] += elapsed_ms
+
+async def _submit(func, *args):
+    """Envia uma operação ao pool respeitando o limite de pendências"""
+    with _lock:
+        if _stats["pending"] >= PASSWORD_HASH_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise PasswordHasherBusy("Muitas operações de senha em andamento")
+        _stats["pending"] += 1
+        _stats["max_pending"] = max(_stats["max_pending"], _stats["pending"])
+    try:
+        return await asyncio.wrap_future(_get_executor().submit(_timed, func, *args))
+    finally:
+        with _lock:
+            _stats["pending"] -= 1
+
+async def hash_password_async(password: str) -> str:
+    """Gera o hash no pool de bcrypt"""
+    return await _submit(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifica a senha no pool de bcrypt"""
+    return await _submit(verify_password, plain_password, hashed_password)
+
+def get_hash_pool_stats() -> dict:
+    """Métricas do pool: pendências atuais, pico, fila, concluídas e recusadas"""
+    with _lock:
+        completed = _stats["completed"]
+        return {
+            "workers": PASSWORD_HASH_WORKERS,
+            "rounds": BCRYPT_ROUNDS,
+            "pending": _stats["pending"],
+            "queued": max(0, _stats["pending"] - PASSWORD_HASH_WORKERS),
+            "max_pending": _stats["max_pending"],
+            "completed": completed,
+            "rejected": _stats["rejected"],
+            "avg_ms": round(_stats["total_ms"] / completed, 1) if completed else 0.0
+        }
+
+def shutdown_hash_pool():
+    """Encerra o pool (shutdown da API)"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor:
+        executor.shutdown(wait=False)
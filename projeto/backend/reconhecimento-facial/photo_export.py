@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Exportação do catálogo de fotos em NDJSON (um objeto JSON por linha)
+
+As linhas são lidas com yield_per (cursor no servidor, lotes de
+EXPORT_BATCH_SIZE) e escritas conforme chegam, então exportar um milhão de
+fotos usa a mesma memória que exportar mil.
+
+A API usa a versão assíncrona (sessão assíncrona com stream): a sessão e o
+cursor ficam no event loop, em vez de passarem de uma thread do threadpool
+para outra a cada lote, como aconteceria com um gerador síncrono no
+StreamingResponse.
+
+Uso:
+    python photo_export.py [--user-id 3] [--event-id formatura-2024] [--output fotos.ndjson]
+"""
+
+import sys
+import json
+import argparse
+from typing import AsyncIterator, Iterator, Optional
+from sqlalchemy import select
+from database import AsyncSessionLocal, SessionLocal, Photo
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    Photo.id,
+    Photo.user_id,
+    Photo.event_id,
+    Photo.filename,
+    Photo.file_size,
+    Photo.mime_type,
+    Photo.content_hash,
+    Photo.is_reference_photo,
+    Photo.face_detected,
+    Photo.created_at
+)
+
+def _export_statement(user_id: Optional[int], event_id: Optional[str]):
+    statement = select(*EXPORT_COLUMNS)
+    if user_id is not None:
+        statement = statement.where(Photo.user_id == user_id)
+    if event_id is not None:
+        statement = statement.where(Photo.event_id == event_id)
+    return statement.order_by(Photo.id)
+
+def _photo_record(row) -> dict:
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "event_id": row.event_id,
+        "filename": row.filename,
+        "file_size": row.file_size,
+        "mime_type": row.mime_type,
+        "content_hash": row.content_hash,
+        "is_reference": row.is_reference_photo,
+        "face_detected": row.face_detected,
+        "created_at": row.created_at.isoformat() if row.created_at else None
+    }
+
+def _ndjson_chunk(rows) -> str:
+    return "".join(json.dumps(_photo_record(row), ensure_ascii=False) + "\n" for row in rows)
+
+def iter_photo_records(
+    user_id: Optional[int] = None,
+    event_id: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[dict]:
+    """Percorre as fotos (filtradas por usuário e/ou evento) em ordem de id"""
+    db = SessionLocal()
+    try:
+        statement = _export_statement(user_id, event_id).execution_options(yield_per=batch_size)
+        for row in db.execute(statement):
+            yield _photo_record(row)
+    finally:
+        db.close()
+
+def iter_photo_ndjson(
+    user_id: Optional[int] = None,
+    event_id: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[str]:
+    """Gera o NDJSON em blocos de batch_size linhas (poucos writes grandes)"""
+    db = SessionLocal()
+    try:
+        result = db.execute(_export_statement(user_id, event_id).execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            yield _ndjson_chunk(rows)
+    finally:
+        db.close()
+
+async def iter_photo_ndjson_async(
+    user_id: Optional[int] = None,
+    event_id: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[str]:
+    """Versão assíncrona de iter_photo_ndjson (usada pela API)"""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_export_statement(user_id, event_id).execution_options(yield_per=batch_size))
+        try:
+            async for rows in result.partitions():
+                yield _ndjson_chunk(rows)
+        finally:
+            await result.close()
+
+def export_photos(output, user_id: Optional[int] = None, event_id: Optional[str] = None) -> int:
+    """Escreve o catálogo num arquivo aberto e retorna quantas fotos foram exportadas"""
+    total = 0
+    for chunk in iter_photo_ndjson(user_id, event_id):
+        output.write(chunk)
+        total += chunk.count("\n")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta o catálogo de fotos em NDJSON")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--event-id")
+    parser.add_argument("--output", help="Arquivo de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            total = export_photos(f, args.user_id, args.event_id)
+        print(f"✅ {total} fotos exportadas para {args.output}")
+    else:
+        total = export_photos(sys.stdout, args.user_id, args.event_id)
+        print(f"✅ {total} fotos exportadas", file=sys.stderr)
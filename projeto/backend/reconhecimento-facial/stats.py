@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Estatísticas do sistema para o painel administrativo (/api/stats)
+
+As contagens saem de duas agregações (usuários por tipo e fotos) e o
+resultado fica num snapshot em memória por STATS_CACHE_TTL segundos, então
+um painel consultando a rota a cada poucos segundos não varre as tabelas
+a cada requisição. Uploads e remoções aparecem quando o snapshot vence.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from typing import Optional
+from sqlalchemy import func, select
+from database import User
+from file_upload import get_upload_stats_async
+
+# Validade do snapshot em segundos (0 desliga o cache)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "10"))
+
+USER_TYPES = {"consumer": "consumers", "photographer": "photographers", "admin": "admins"}
+
+_snapshot: Optional[dict] = None
+_snapshot_expires_at = 0.0
+_snapshot_lock = threading.Lock()
+_async_snapshot_lock: Optional[asyncio.Lock] = None
+
+USER_STATS_STATEMENT = select(User.user_type, func.count(User.id)).group_by(User.user_type)
+
+async def get_user_stats_async(db) -> dict:
+    """Total de usuários e quantidade por tipo (um GROUP BY)"""
+    async with db.begin():
+        return _user_stats((await db.execute(USER_STATS_STATEMENT)).all())
+
+def _user_stats(rows) -> dict:
+    counts = dict(rows)
+    stats = {"total": sum(counts.values())}
+    stats.update({key: counts.get(user_type, 0) for user_type, key in USER_TYPES.items()})
+    return stats
+
+async def compute_stats_async(db) -> dict:
+    """Calcula as estatísticas direto no banco"""
+    return {
+        "users": await get_user_stats_async(db),
+        "photos": await get_upload_stats_async(db)
+    }
+
+def _fresh_snapshot() -> Optional[dict]:
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() < _snapshot_expires_at:
+            return _snapshot
+        return None
+
+def _store_snapshot(stats: dict):
+    global _snapshot, _snapshot_expires_at
+    with _snapshot_lock:
+        _snapshot = stats
+        _snapshot_expires_at = time.monotonic() + STATS_CACHE_TTL
+
+async def get_stats_snapshot_async(db) -> dict:
+    """Estatísticas do snapshot em memória, recalculadas quando o TTL vence"""
+    global _async_snapshot_lock
+    if STATS_CACHE_TTL <= 0:
+        return await compute_stats_async(db)
+
+    snapshot = _fresh_snapshot()
+    if snapshot is not None:
+        return snapshot
+    if _async_snapshot_lock is None:
+        _async_snapshot_lock = asyncio.Lock()
+    async with _async_snapshot_lock:
+        # Só uma corrotina recalcula; as outras esperam e reaproveitam o resultado
+        snapshot = _fresh_snapshot()
+        if snapshot is None:
+            snapshot = await compute_stats_async(db)
+            _store_snapshot(snapshot)
+        return snapshot
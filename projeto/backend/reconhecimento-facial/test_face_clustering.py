@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Testes do agrupamento de rostos em pessoas (face_clustering)
+
+Encodings sintéticos: cada pessoa é um centro aleatório e seus rostos são o
+centro com um ruído bem menor que CLUSTER_THRESHOLD.
+
+    python -m pytest test_face_clustering.py
+"""
+
+import uuid
+import numpy as np
+import face_clustering
+from database import SessionLocal, Event, FaceEncoding
+from face_clustering import (
+    chinese_whispers, cluster_vectors, knn_graph,
+    refresh_event_clusters, search_event_clusters_async, update_event_clusters
+)
+from face_matcher import load_event_encodings, match_encodings
+
+def synthetic_faces(rng, centers: np.ndarray, per_person: int, noise: float = 0.02) -> tuple:
+    """Rostos de cada pessoa embaralhados; retorna (vetores, pessoa de cada rosto)"""
+    identities = rng.permutation(np.repeat(np.arange(len(centers)), per_person))
+    vectors = centers[identities] + rng.normal(0, noise, (len(identities), centers.shape[1]))
+    return vectors.astype(np.float32), identities
+
+def event_state(event_id: str) -> tuple:
+    db = SessionLocal()
+    try:
+        event = db.get(Event, event_id)
+        unassigned = db.query(FaceEncoding).filter(
+            FaceEncoding.photo_id.in_(load_event_encodings(event_id).photo_ids.tolist()),
+            FaceEncoding.face_cluster_id.is_(None)
+        ).count()
+        return event.version, event.cluster_count, unassigned
+    finally:
+        db.close()
+
+def test_cluster_vectors_separates_people():
+    """Um rótulo por pessoa, sem misturar pessoas"""
+    rng = np.random.default_rng(1)
+    vectors, identities = synthetic_faces(rng, rng.normal(0, 0.08, (8, 128)), per_person=20)
+    labels = cluster_vectors(vectors)
+    assert len(set(labels.tolist())) == 8
+    for person in range(8):
+        assert len(set(labels[identities == person].tolist())) == 1
+
+def test_chinese_whispers_keeps_isolated_faces_apart():
+    """Rostos sem vizinhos dentro do limiar ficam cada um na sua pessoa"""
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(0, 1.0, (10, 128)).astype(np.float32)
+    neighbors, weights = knn_graph(vectors)
+    assert not weights.any()
+    assert sorted(chinese_whispers(neighbors, weights).tolist()) == list(range(10))
+    assert chinese_whispers(np.empty((0, 0), dtype=np.int64), np.empty((0, 0), dtype=np.float32)).size == 0
+
+def test_incremental_assignment_bumps_version(make_user, add_event_faces):
+    """Rostos novos de pessoas conhecidas entram nelas e a versão do evento sobe"""
+    user, _ = make_user("photographer")
+    event_id = f"evento-{uuid.uuid4().hex[:8]}"
+    rng = np.random.default_rng(3)
+    centers = rng.normal(0, 0.08, (5, 128)).astype(np.float32)
+
+    vectors, _ = synthetic_faces(rng, centers, per_person=10)
+    add_event_faces(user["id"], event_id, [[vector] for vector in vectors])
+    assert update_event_clusters(event_id) == 50
+    version, clusters, unassigned = event_state(event_id)
+    assert (clusters, unassigned) == (5, 0)
+
+    vectors, _ = synthetic_faces(rng, centers, per_person=2)
+    add_event_faces(user["id"], event_id, [[vector] for vector in vectors])
+    added_version = event_state(event_id)[0]
+    assert update_event_clusters(event_id) == 10
+    new_version, clusters, unassigned = event_state(event_id)
+    assert (clusters, unassigned) == (5, 0)
+    assert new_version > added_version > version
+
+    # Nada novo: nenhuma pessoa muda e a versão fica
+    assert update_event_clusters(event_id) == 0
+    assert event_state(event_id)[0] == new_version
+
+def test_refresh_runs_chunked_passes(make_user, add_event_faces, monkeypatch):
+    """Eventos grandes são agrupados em várias transações até não sobrar rosto sem pessoa"""
+    user, _ = make_user("photographer")
+    event_id = f"evento-{uuid.uuid4().hex[:8]}"
+    rng = np.random.default_rng(4)
+    vectors, _ = synthetic_faces(rng, rng.normal(0, 0.08, (5, 128)).astype(np.float32), per_person=5)
+    add_event_faces(user["id"], event_id, [[vector] for vector in vectors])
+
+    passes = []
+    update = face_clustering.update_event_clusters
+    def spy(event_id):
+        passes.append(update(event_id))
+        return passes[-1]
+    monkeypatch.setattr(face_clustering, "CLUSTER_MAX_FACES_PER_PASS", 10)
+    monkeypatch.setattr(face_clustering, "update_event_clusters", spy)
+
+    refresh_event_clusters([event_id])
+    assert passes == [10, 10, 5]
+    assert event_state(event_id)[1:] == (5, 0)
+
+def test_cluster_search_matches_exact_search(make_user, add_event_faces, run_with_async_db):
+    """Busca pelas pessoas devolve o mesmo que comparar todos os rostos, inclusive os ainda sem pessoa"""
+    user, _ = make_user("photographer")
+    event_id = f"evento-{uuid.uuid4().hex[:8]}"
+    rng = np.random.default_rng(5)
+    centers = rng.normal(0, 0.08, (12, 128)).astype(np.float32)
+
+    def add_photos(count: int):
+        people_per_photo = [rng.choice(len(centers), rng.integers(1, 4), replace=False) for _ in range(count)]
+        add_event_faces(user["id"], event_id, [
+            centers[people] + rng.normal(0, 0.022, (len(people), 128)) for people in people_per_photo
+        ])
+
+    def compare():
+        for person in (0, 5, 11):
+            query = centers[person] + rng.normal(0, 0.022, 128).astype(np.float32)
+            matches = run_with_async_db(search_event_clusters_async, event_id, query, top_k=500)
+            assert matches, "a pessoa tem fotos no evento"
+            assert matches == match_encodings(load_event_encodings(event_id), query, top_k=500)
+
+    assert run_with_async_db(search_event_clusters_async, event_id, centers[0]) is None
+    add_photos(120)
+    update_event_clusters(event_id)
+    compare()
+    add_photos(30)  # Gravados depois do agrupamento
+    assert event_state(event_id)[2] > 0
+    compare()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Testes da fila de detecção facial (reserva com token, jobs presos e devolução)
+
+Sem o pool de processos: os resultados são passados direto para store_results.
+
+    python -m pytest test_face_jobs.py
+"""
+
+import numpy as np
+from datetime import datetime
+from database import SessionLocal, FaceEncoding, FaceJob, Photo
+from face_jobs import (
+    FACE_JOB_MAX_ATTEMPTS, FACE_JOB_TIMEOUT, JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_PROCESSING,
+    claim_jobs, release_jobs, store_results
+)
+
+def create_job(user_id: int, attempts: int = 0) -> int:
+    db = SessionLocal()
+    try:
+        photo = Photo(user_id=user_id, filename="foto.jpg", file_path="uploads/inexistente.jpg", file_size=1, mime_type="image/jpeg")
+        db.add(photo)
+        db.flush()
+        job = FaceJob(photo_id=photo.id, user_id=user_id, status=JOB_PENDING, attempts=attempts)
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+def claim(job_id: int) -> list:
+    """Reserva a fila toda (outros testes deixam jobs pendentes) e devolve só o job pedido"""
+    return [job for job in claim_jobs(10000) if job["job_id"] == job_id]
+
+def expire(job_id: int):
+    """Simula um worker que caiu: started_at além de FACE_JOB_TIMEOUT"""
+    update_job(job_id, started_at=datetime.utcnow() - FACE_JOB_TIMEOUT * 2)
+
+def update_job(job_id: int, **values):
+    db = SessionLocal()
+    try:
+        db.query(FaceJob).filter(FaceJob.id == job_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+def job_row(job_id: int) -> tuple:
+    db = SessionLocal()
+    try:
+        job = db.get(FaceJob, job_id)
+        faces = db.query(FaceEncoding).filter(FaceEncoding.photo_id == job.photo_id).count()
+        return job.status, job.attempts, job.worker_token, faces
+    finally:
+        db.close()
+
+def test_claim_is_exclusive(make_user):
+    user, _ = make_user()
+    job_id = create_job(user["id"])
+    [job] = claim(job_id)
+    assert job["worker_token"]
+    assert job_row(job_id)[:3] == (JOB_PROCESSING, 1, job["worker_token"])
+    assert claim(job_id) == []
+
+def test_stale_batch_cannot_store_results(make_user):
+    """Job expirado e reservado de novo: só o lote dono do token grava"""
+    user, _ = make_user()
+    job_id = create_job(user["id"])
+    [first] = claim(job_id)
+    expire(job_id)
+    [second] = claim(job_id)
+    assert second["worker_token"] != first["worker_token"]
+    assert second["attempts"] == 2
+
+    encodings = [np.ones(128, dtype=np.float32)]
+    store_results([first], [(encodings, None)])
+    assert job_row(job_id) == (JOB_PROCESSING, 2, second["worker_token"], 0)
+    store_results([second], [(encodings, None)])
+    assert job_row(job_id)[0] == JOB_DONE
+    assert job_row(job_id)[3] == 1
+    store_results([second], [(encodings, None)])
+    assert job_row(job_id)[3] == 1
+
+def test_stale_job_fails_after_max_attempts(make_user):
+    user, _ = make_user()
+    job_id = create_job(user["id"], attempts=FACE_JOB_MAX_ATTEMPTS - 1)
+    claim(job_id)
+    expire(job_id)
+    assert claim(job_id) == []
+    status, attempts, _, _ = job_row(job_id)
+    assert (status, attempts) == (JOB_FAILED, FACE_JOB_MAX_ATTEMPTS)
+
+def test_release_returns_jobs_without_counting_attempt(make_user):
+    user, _ = make_user()
+    job_id = create_job(user["id"])
+    jobs = claim(job_id)
+    assert release_jobs(jobs) == 1
+    assert job_row(job_id) == (JOB_PENDING, 0, None, 0)
+
+    # Lote antigo não devolve um job que já foi reservado de novo
+    [again] = claim(job_id)
+    assert release_jobs(jobs) == 0
+    assert job_row(job_id)[:3] == (JOB_PROCESSING, 1, again["worker_token"])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Testes das funções puras do envio de arquivos e da paginação da galeria
+
+Não precisa da API rodando:
+    python test_file_serving.py
+"""
+
+from datetime import datetime
+from file_serving import etag_matches, if_range_matches, parse_range
+from file_upload import decode_photos_cursor, encode_photos_cursor
+
+def expect_range_error(header: str, file_size: int) -> bool:
+    """True se o intervalo é recusado (resposta 416)"""
+    try:
+        parse_range(header, file_size)
+    except ValueError:
+        return True
+    return False
+
+def test_parse_range():
+    """Testa os intervalos aceitos, ignorados e recusados"""
+    print("\n1️⃣ Testando parse_range...")
+    assert parse_range(None, 1000) is None
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=900-5000", 1000) == (900, 999)
+
+    # Sufixo: os últimos N bytes (maior que o arquivo = arquivo inteiro)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+    assert expect_range_error("bytes=-0", 1000)
+
+    # Vários intervalos ou unidade desconhecida: arquivo inteiro
+    assert parse_range("bytes=0-9,20-29", 1000) is None
+    assert parse_range("items=0-9", 1000) is None
+    assert parse_range("bytes=a-b", 1000) is None
+    assert parse_range("bytes=--5", 1000) is None
+
+    # Fora do arquivo
+    assert expect_range_error("bytes=1000-", 1000)
+    assert expect_range_error("bytes=50-10", 1000)
+
+    # Arquivo vazio: nunca um 206 com "bytes 0--1/0"
+    assert parse_range("bytes=-100", 0) is None
+    assert parse_range("bytes=0-", 0) is None
+    print("✅ parse_range OK")
+
+def test_etag_matches():
+    """Testa If-None-Match (comparação fraca) e If-Range (comparação forte)"""
+    print("\n2️⃣ Testando etag_matches e if_range_matches...")
+    strong, weak = '"abc"', 'W/"abc"'
+    assert not etag_matches(None, strong)
+    assert etag_matches("*", strong)
+    assert etag_matches('"abc"', strong)
+    assert etag_matches('W/"abc"', strong)
+    assert etag_matches('"abc"', weak)
+    assert etag_matches('"x", "abc"', strong)
+    assert not etag_matches('"abcd"', strong)
+
+    assert if_range_matches(' "abc" ', strong)
+    assert not if_range_matches('W/"abc"', strong)
+    assert not if_range_matches('W/"abc"', weak)
+    assert not if_range_matches('"abc"', weak)
+    assert not if_range_matches("Wed, 21 Oct 2015 07:28:00 GMT", strong)
+    print("✅ ETags OK")
+
+def test_photos_cursor():
+    """Testa a ida e volta do cursor da galeria"""
+    print("\n3️⃣ Testando cursor da galeria...")
+    created_at = datetime(2024, 5, 17, 14, 30, 5, 123456)
+    cursor = encode_photos_cursor(created_at, 42)
+    assert decode_photos_cursor(cursor) == (created_at, 42)
+    assert decode_photos_cursor(encode_photos_cursor(datetime(2024, 1, 1), 7)) == (datetime(2024, 1, 1), 7)
+
+    for invalid in ("", "não-é-base64", encode_photos_cursor(created_at, 1)[:-4], "MjAyNC0wMS0wMQ=="):
+        try:
+            decode_photos_cursor(invalid)
+        except ValueError:
+            continue
+        raise AssertionError(f"cursor aceito: {invalid!r}")
+    print("✅ Cursor OK")
+
+def main():
+    print("🧪 TESTES DO ENVIO DE ARQUIVOS")
+    print("=" * 50)
+    test_parse_range()
+    test_etag_matches()
+    test_photos_cursor()
+    print("\n🎉 Todos os testes passaram")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Testes do cache de buscas por evento (match_cache)
+
+    python -m pytest test_match_cache.py
+"""
+
+import uuid
+import numpy as np
+from face_clustering import cluster_event
+from face_matcher import load_event_encodings, match_encodings
+from file_upload import delete_photo
+from match_cache import (
+    MATCH_CACHE_TOP_K, get_event_state_async, get_match_cache_stats, merge_matches, search_event_cached_async
+)
+
+def match(photo_id: int, distance: float) -> dict:
+    return {"photo_id": photo_id, "distance": distance, "confidence": 1.0 - distance}
+
+def test_merge_matches_keeps_best_distance_per_photo():
+    merged = merge_matches([match(1, 0.3), match(2, 0.5)], [match(2, 0.1), match(3, 0.4), match(1, 0.35)])
+    assert [(m["photo_id"], m["distance"]) for m in merged] == [(2, 0.1), (1, 0.3), (3, 0.4)]
+    assert [m["photo_id"] for m in merge_matches(merged, [], top_k=2)] == [2, 1]
+
+class EventSearch:
+    """Busca em cache de um usuário num evento, contando de onde veio cada resposta"""
+
+    def __init__(self, run_with_async_db, user_id: int, event_id: str, reference: np.ndarray):
+        self.run = run_with_async_db
+        self.user_id, self.event_id, self.reference = user_id, event_id, reference
+
+    def state(self):
+        return self.run(get_event_state_async, self.event_id)
+
+    def search(self) -> tuple:
+        """Retorna (resultado, estado usado, hits/deltas/misses da busca)"""
+        state = self.state()
+        before = get_match_cache_stats()
+        matches = self.run(search_event_cached_async, self.user_id, self.event_id, self.reference, state)
+        after = get_match_cache_stats()
+        outcome = next(name for name in ("hits", "deltas", "misses") if after[name] > before[name])
+        return matches, state, outcome
+
+    def exact(self) -> list:
+        return match_encodings(load_event_encodings(self.event_id), self.reference, top_k=MATCH_CACHE_TOP_K)
+
+def photo_distances(matches: list) -> dict:
+    return {m["photo_id"]: round(m["distance"], 5) for m in matches}
+
+def test_cached_search_uses_delta_and_invalidates(make_user, add_event_faces, run_with_async_db):
+    """Mesma versão = cache; só rostos novos = delta; rostos apagados = busca completa"""
+    photographer, _ = make_user("photographer")
+    consumer, _ = make_user("consumer")
+    event_id = f"evento-{uuid.uuid4().hex[:8]}"
+    rng = np.random.default_rng(6)
+    centers = rng.normal(0, 0.08, (4, 128)).astype(np.float32)
+
+    def add_photos(person: int, count: int) -> list:
+        return add_event_faces(photographer["id"], event_id, [
+            [centers[person] + rng.normal(0, 0.02, 128), centers[(person + 1) % 4] + rng.normal(0, 0.02, 128)]
+            for _ in range(count)
+        ])
+
+    own_photos = add_photos(0, 5)
+    add_photos(2, 5)
+    search = EventSearch(run_with_async_db, consumer["id"], event_id, centers[0] + rng.normal(0, 0.02, 128).astype(np.float32))
+
+    matches, state, outcome = search.search()
+    assert outcome == "misses"
+    assert {m["photo_id"] for m in matches} == set(own_photos)
+    assert search.search()[2] == "hits"
+
+    # Rostos novos: só eles são comparados e juntados ao resultado anterior
+    new_photos = add_photos(0, 3)
+    matches, new_state, outcome = search.search()
+    assert new_state.version > state.version
+    assert outcome == "deltas"
+    assert {m["photo_id"] for m in matches} == set(own_photos + new_photos)
+    assert photo_distances(matches) == photo_distances(search.exact())
+
+    # Pessoas refeitas: a versão sobe sem rostos novos e o resultado não muda
+    cluster_event(event_id)
+    clustered, _, outcome = search.search()
+    assert outcome == "deltas"
+    assert clustered == matches
+
+    # Foto apagada: o delta não sabe tirar rostos, então a busca é completa
+    assert delete_photo(own_photos[0], photographer["id"])[0]
+    matches, _, outcome = search.search()
+    assert outcome == "misses"
+    assert own_photos[0] not in {m["photo_id"] for m in matches}
+    assert photo_distances(matches) == photo_distances(search.exact())
+    assert search.search()[2] == "hits"
+
+def test_cache_key_includes_reference(make_user, add_event_faces, run_with_async_db):
+    """Referência nova (média recalculada) não reaproveita a busca antiga"""
+    photographer, _ = make_user("photographer")
+    consumer, _ = make_user("consumer")
+    event_id = f"evento-{uuid.uuid4().hex[:8]}"
+    rng = np.random.default_rng(7)
+    centers = rng.normal(0, 0.08, (2, 128)).astype(np.float32)
+    photos = add_event_faces(photographer["id"], event_id, [[center] for center in centers])
+
+    first = EventSearch(run_with_async_db, consumer["id"], event_id, centers[0])
+    assert [m["photo_id"] for m in first.search()[0]] == [photos[0]]
+    second = EventSearch(run_with_async_db, consumer["id"], event_id, centers[1])
+    matches, _, outcome = second.search()
+    assert outcome == "misses"
+    assert [m["photo_id"] for m in matches] == [photos[1]]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Testes da exportação NDJSON (photo_export e /api/photos/export)
+
+    python -m pytest test_photo_export.py
+"""
+
+import json
+import asyncio
+from database import SessionLocal, Photo, dispose_async_engine
+from photo_export import iter_photo_ndjson, iter_photo_ndjson_async
+
+def add_photos(user_id: int, count: int) -> list:
+    db = SessionLocal()
+    try:
+        photos = [
+            Photo(user_id=user_id, filename=f"foto-{i}.jpg", file_path=f"uploads/foto-{user_id}-{i}.jpg",
+                  file_size=1000 + i, mime_type="image/jpeg")
+            for i in range(count)
+        ]
+        db.add_all(photos)
+        db.commit()
+        return [photo.id for photo in photos]
+    finally:
+        db.close()
+
+async def collect_async(**kwargs) -> list:
+    """Consome o gerador num event loop próprio (o engine assíncrono é descartado no fim)"""
+    try:
+        return [chunk async for chunk in iter_photo_ndjson_async(**kwargs)]
+    finally:
+        await dispose_async_engine()
+
+def test_async_export_matches_sync(make_user):
+    """Versão assíncrona gera os mesmos blocos que a síncrona (CLI)"""
+    user, _ = make_user("photographer")
+    ids = add_photos(user["id"], 7)
+
+    chunks = asyncio.run(collect_async(user_id=user["id"], batch_size=3))
+    assert chunks == list(iter_photo_ndjson(user_id=user["id"], batch_size=3))
+    assert [chunk.count("\n") for chunk in chunks] == [3, 3, 1]
+    records = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert [record["id"] for record in records] == ids
+    assert records[0]["filename"] == "foto-0.jpg"
+
+def test_export_route_streams_own_photos(client, make_user):
+    user, headers = make_user("photographer")
+    other, _ = make_user("photographer")
+    ids = add_photos(user["id"], 5)
+    add_photos(other["id"], 2)
+
+    response = client.get("/api/photos/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ids
+
+    response = client.get(f"/api/photos/export?user_id={other['id']}", headers=headers)
+    assert response.status_code == 403
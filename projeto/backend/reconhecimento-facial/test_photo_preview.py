@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Testes da rota de prévias (/api/photos/{id}/preview): ETag e 304
+
+    python -m pytest test_photo_preview.py
+"""
+
+import io
+import time
+from PIL import Image
+import main_simple
+from database import SessionLocal, Photo
+
+def upload_photo(client, headers, color=(200, 30, 30)) -> int:
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), color).save(buffer, "JPEG")
+    response = client.post("/api/upload-photo", files={"file": ("foto.jpg", buffer.getvalue(), "image/jpeg")}, headers=headers)
+    assert response.status_code == 200
+    return response.json()["photo"]["id"]
+
+def fetch_preview_twice(client, headers, photo_id: int):
+    first = client.get(f"/api/photos/{photo_id}/preview?size=thumb", headers=headers)
+    assert first.status_code == 200
+    # O cache de derivados atualiza o mtime a cada acesso; a ETag usa segundos inteiros
+    second_started = int(time.time())
+    while int(time.time()) == second_started:
+        time.sleep(0.05)
+    second = client.get(f"/api/photos/{photo_id}/preview?size=thumb",
+                        headers={**headers, "If-None-Match": first.headers["etag"]})
+    return first, second
+
+def test_preview_revalidates_with_304(client, make_user, monkeypatch):
+    """Segunda requisição com If-None-Match recebe 304 sem abrir o derivado"""
+    _, headers = make_user("photographer")
+    photo_id = upload_photo(client, headers)
+    first = client.get(f"/api/photos/{photo_id}/preview?size=thumb", headers=headers)
+    assert first.status_code == 200
+    assert not first.headers["etag"].startswith("W/")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("get_derivative chamado numa revalidação")
+    monkeypatch.setattr(main_simple, "get_derivative", fail)
+    second = client.get(f"/api/photos/{photo_id}/preview?size=thumb",
+                        headers={**headers, "If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+    assert second.headers["etag"] == first.headers["etag"]
+
+def test_preview_without_content_hash_revalidates_with_304(client, make_user):
+    """Fotos antigas (sem content_hash) têm ETag fraca estável, do arquivo original"""
+    _, headers = make_user("photographer")
+    photo_id = upload_photo(client, headers, color=(30, 200, 30))
+    db = SessionLocal()
+    try:
+        db.query(Photo).filter(Photo.id == photo_id).update({Photo.content_hash: None})
+        db.commit()
+    finally:
+        db.close()
+
+    first, second = fetch_preview_twice(client, headers, photo_id)
+    assert first.headers["etag"].startswith("W/")
+    assert second.status_code == 304
+
+def test_preview_etag_changes_with_size(client, make_user):
+    _, headers = make_user("photographer")
+    photo_id = upload_photo(client, headers, color=(30, 30, 200))
+    thumb = client.get(f"/api/photos/{photo_id}/preview?size=thumb", headers=headers)
+    response = client.get(f"/api/photos/{photo_id}/preview?size=preview",
+                          headers={**headers, "If-None-Match": thumb.headers["etag"]})
+    assert response.status_code == 200
+    assert response.headers["etag"] != thumb.headers["etag"]
@@ -32,7 +32,7 @@ def view_database():
             print("\n📋 Lista de usuários:")
             print("-" * 50)
             
-            users = db.query(User).all()
+            users = db.query(User).order_by(User.id).yield_per(1000)
             for i, user in enumerate(users, 1):
                 print(f"\n{i}. 📧 {user.email}")
                 print(f"   👤 Nome: {user.name}")